@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Merge the fields extracted from an applicant's documents into one profile.
+
+Each document (passport, ID card, cover letter, offer letter, ...) is extracted separately by
+llm_analysis with the same sections/field names. merge_profile() combines them
+field by field: for every field the non-empty values are ranked by the source
+precedence of their document kind (passport over id_card over cover letter for
+identity fields, see SECTION_PRECEDENCE / FIELD_PRECEDENCE) and the best one
+wins. Differing values from lower-ranked documents are reported as conflicts
+instead of being dropped silently, so they can be checked by hand.
+
+merge_chunk_fields() is the reduce step for one long document extracted in
+page chunks: earlier pages win for single values and lists are concatenated.
+"""
+
+import re
+import json
+from pathlib import Path
+
+from doc_fields import detect_doc_type
+
+SOURCE_KINDS = ("passport", "id_card", "cover_letter", "offer", "other")
+
+# filename hints (lower-cased stem) for documents that are not identity documents
+COVER_LETTER_HINTS = ("cover_letter", "cover-letter", "coverletter", "求学信", "陈述")
+OFFER_HINTS = ("offer", "录取", "admission")
+
+IDENTITY_PRECEDENCE = ("passport", "id_card", "cover_letter", "offer", "other")
+# everything else: the school's offer, then what the applicant wrote; identity documents rarely say
+DEFAULT_PRECEDENCE = ("offer", "cover_letter", "other", "passport", "id_card")
+
+SECTION_PRECEDENCE = {
+    "Personal Information": IDENTITY_PRECEDENCE,
+    "Passport Information": IDENTITY_PRECEDENCE,
+    "Travel Document Details": IDENTITY_PRECEDENCE,
+    # the ID card carries the registered address
+    "Contact Information": ("id_card", "passport", "cover_letter", "other"),
+}
+# per-field overrides, keyed "Section.field"
+FIELD_PRECEDENCE = {
+    "Personal Information.current_location": ("cover_letter", "other", "id_card", "passport"),
+    "Personal Information.current_address": ("id_card", "cover_letter", "other", "passport"),
+    "Contact Information.phone": ("cover_letter", "other", "id_card", "passport"),
+    "Contact Information.email": ("cover_letter", "other", "id_card", "passport"),
+}
+
+
+def document_source(path) -> str:
+    """Document kind from the file name: "passport", "id_card", "cover_letter", "offer" or "other"."""
+    doc_type = detect_doc_type(path)
+    if doc_type:
+        return doc_type
+    name = Path(path).stem.lower()
+    if any(h in name for h in COVER_LETTER_HINTS):
+        return "cover_letter"
+    if any(h in name for h in OFFER_HINTS):
+        return "offer"
+    return "other"
+
+
+def precedence_for(path: tuple) -> tuple:
+    """Source order for a field path like ("Personal Information", "surname")."""
+    key = ".".join([p for p in path if isinstance(p, str)][:2])
+    if key in FIELD_PRECEDENCE:
+        return FIELD_PRECEDENCE[key]
+    return SECTION_PRECEDENCE.get(path[0], DEFAULT_PRECEDENCE)
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _comparable(value):
+    """Normalise a value for conflict detection (case and whitespace do not count)."""
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip().casefold()
+    return value
+
+
+def _is_record_list(value) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _shapes(fields: dict, prefix=(), found=None) -> dict:
+    """{path: {"dict", "list"}} for every object or list-of-objects value."""
+    found = {} if found is None else found
+    for key, value in fields.items():
+        path = prefix + (key,)
+        if isinstance(value, dict) and value:
+            found.setdefault(path, set()).add("dict")
+            _shapes(value, path, found)
+        elif _is_record_list(value):
+            found.setdefault(path, set()).add("list")
+    return found
+
+
+def _mixed_paths(documents) -> set:
+    """Paths that are an object in one document and a list of objects in another."""
+    shapes = {}
+    for doc in documents:
+        for path, kinds in _shapes(doc.get("fields") or {}).items():
+            shapes.setdefault(path, set()).update(kinds)
+    return {path for path, kinds in shapes.items() if kinds == {"dict", "list"}}
+
+
+def _leaves(fields: dict, prefix=(), by_position=frozenset()):
+    """
+    Yield (path, value) for every non-dict value; lists count as one value,
+    except at `by_position` paths, where a list of objects is walked item by
+    item (index in the path) and an object counts as a one-item list.
+    """
+    for key, value in fields.items():
+        path = prefix + (key,)
+        if path in by_position and (_is_record_list(value) or isinstance(value, dict) and value):
+            for i, item in enumerate(value if isinstance(value, list) else [value]):
+                yield from _leaves(item, path + (i,))
+        elif isinstance(value, dict) and value:
+            yield from _leaves(value, path, by_position)
+        else:
+            yield path, value
+
+
+def _field_name(path: tuple) -> str:
+    """("Employment History", 0, "employer_name") -> "Employment History[0].employer_name"."""
+    name = ""
+    for key in path:
+        name += f"[{key}]" if isinstance(key, int) else (f".{key}" if name else key)
+    return name
+
+
+def _set_path(target, path: tuple, value, overwrite=True) -> None:
+    """Set `value` at `path`, creating dicts for names and lists for (int) positions on the way."""
+    for key, nxt in zip(path, path[1:]):
+        container = list if isinstance(nxt, int) else dict
+        if isinstance(target, list):
+            target.extend([None] * (key + 1 - len(target)))
+            if not isinstance(target[key], container):
+                target[key] = container()
+        elif not isinstance(target.get(key), container):
+            target[key] = container()
+        target = target[key]
+    key = path[-1]
+    if isinstance(target, list):
+        target.extend([None] * (key + 1 - len(target)))
+        if overwrite or target[key] is None:
+            target[key] = value
+    elif overwrite or key not in target:
+        target[key] = value
+
+
+def merge_profile(documents) -> dict:
+    """
+    Merge extracted documents into one applicant profile.
+
+    `documents` is a list of {"name": ..., "source": ..., "fields": {...}} in a
+    stable order (ties between documents of the same kind go to the earlier
+    one). Returns {"profile": merged fields, "sources": {"Section.field": name},
+    "conflicts": [...]}; every field any document has appears in the profile,
+    null where no document has a value. A conflict lists the chosen value and
+    the differing values from other documents.
+
+    A section that is a list of objects in one document and a single object
+    in another (the cover letter's employers vs. one employment certificate)
+    is merged by position, the object counting as a one-item list; such
+    fields are named like "Employment History[0].employer_name".
+    """
+    by_position = _mixed_paths(documents)
+    candidates = {}  # path -> [(rank, order, name, value)]
+    for order, doc in enumerate(documents):
+        for path, value in _leaves(doc.get("fields") or {}, by_position=by_position):
+            found = candidates.setdefault(path, [])
+            if _is_empty(value):
+                continue
+            ranking = precedence_for(path)
+            rank = ranking.index(doc["source"]) if doc["source"] in ranking else len(ranking)
+            found.append((rank, order, doc["name"], value))
+
+    # full schema first, in document order; a null never replaces a section another document filled
+    profile = {}
+    for path in candidates:
+        _set_path(profile, path, None, overwrite=False)
+    sources = {}
+    conflicts = []
+    for path, found in sorted(candidates.items(), key=lambda item: len(item[0])):
+        if not found:
+            continue
+        found.sort(key=lambda c: (c[0], c[1]))
+        _, _, name, value = found[0]
+        _set_path(profile, path, value)
+        field = _field_name(path)
+        sources[field] = name
+        others = [{"document": n, "value": v} for _, _, n, v in found[1:] if _comparable(v) != _comparable(value)]
+        if others:
+            conflicts.append({"field": field, "chosen": {"document": name, "value": value}, "others": others})
+    return {"profile": profile, "sources": sources, "conflicts": conflicts}
+
+
+def _reduce_chunks(values: list, path: tuple, conflicts: list):
+    present = [v for v in values if not _is_empty(v)]
+    if not present:
+        return next((v for v in values if v is not None), None)
+    if any(isinstance(v, list) for v in present):
+        merged, seen = [], set()
+        for value in present:
+            for item in value if isinstance(value, list) else [value]:
+                if isinstance(item, dict) and all(_is_empty(v) for v in item.values()):
+                    continue
+                key = json.dumps(item, sort_keys=True, ensure_ascii=False)
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(item)
+        return merged
+    if all(isinstance(v, dict) for v in present):
+        dicts = [v for v in values if isinstance(v, dict)]
+        keys = list(dict.fromkeys(k for d in dicts for k in d))
+        return {k: _reduce_chunks([d.get(k) for d in dicts], path + (k,), conflicts) for k in keys}
+    chosen = present[0]
+    others = []
+    for value in present[1:]:
+        if _comparable(value) != _comparable(chosen) and value not in others:
+            others.append(value)
+    if others:
+        conflicts.append({"field": ".".join(path), "chosen": chosen, "others": others})
+    return chosen
+
+
+def merge_chunk_fields(chunks: list) -> dict:
+    """
+    Reduce the fields extracted from consecutive chunks (page ranges) of one
+    document, in page order. Dicts merge key by key; a single value is the
+    first non-empty one (differing values from later chunks are reported as
+    conflicts); lists are concatenated without duplicates or all-null
+    entries, and a section that is an object in one chunk and a list in
+    another becomes a list. Returns {"fields": ..., "conflicts": [...]}.
+    """
+    conflicts = []
+    fields = _reduce_chunks(list(chunks), (), conflicts)
+    return {"fields": fields if fields is not None else {}, "conflicts": conflicts}
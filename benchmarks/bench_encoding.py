@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: upload encodings (rgb / gray / binary) on the sample documents.
+
+For every page of every PDF and every encoding this renders and encodes the
+page with encode_page_under_limit(), OCRs it through the chosen backend and
+reports upload bytes, encode time, OCR latency, and how closely the recognized
+text agrees with the RGB baseline (difflib ratio over the page text, 1.0 =
+identical). Text agreement is only meaningful with the real Tencent backend;
+the offline backend synthesizes text per image and reports upload sizes only.
+
+用法: python benchmarks/bench_encoding.py [files/*.pdf] [--dpi 150] [--ocr-backend tencent]
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import difflib
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fitz  # PyMuPDF
+
+from pdf_to_markdown import (
+    ENCODINGS, DEFAULT_DPI, encode_page_under_limit, image_bytes_to_b64,
+    ocr_json_to_markdown, get_ocr_dispatcher,
+)
+
+
+def _measure_page(dispatcher, doc, idx, dpi, encoding):
+    t0 = time.perf_counter()
+    img_bytes, used_dpi, _ = encode_page_under_limit(doc, idx, dpi=dpi, encoding=encoding)
+    t1 = time.perf_counter()
+    ocr_json = dispatcher.recognize(image_bytes_to_b64(img_bytes))
+    t2 = time.perf_counter()
+    return {
+        "bytes": len(img_bytes),
+        "dpi": used_dpi,
+        "encode_ms": (t1 - t0) * 1000,
+        "ocr_ms": (t2 - t1) * 1000,
+        "text": ocr_json_to_markdown(ocr_json),
+    }
+
+
+def bench(pdf_paths, dpi, backend):
+    dispatcher = get_ocr_dispatcher(backend, qps=0)
+    rows = []
+    for pdf_path in pdf_paths:
+        doc = fitz.open(pdf_path)
+        try:
+            for idx in range(doc.page_count):
+                pages = {enc: _measure_page(dispatcher, doc, idx, dpi, enc) for enc in ENCODINGS}
+                baseline = pages["rgb"]["text"]
+                for enc, page in pages.items():
+                    page["agreement"] = difflib.SequenceMatcher(None, baseline, page.pop("text")).ratio()
+                    rows.append({"file": os.path.basename(pdf_path), "page": idx + 1, "encoding": enc, **page})
+        finally:
+            doc.close()
+
+    summary = []
+    for enc in ENCODINGS:
+        sel = [r for r in rows if r["encoding"] == enc]
+        n = len(sel) or 1
+        summary.append({
+            "encoding": enc,
+            "pages": len(sel),
+            "upload_bytes_per_page": sum(r["bytes"] for r in sel) // n,
+            "encode_ms_per_page": round(sum(r["encode_ms"] for r in sel) / n, 1),
+            "ocr_ms_per_page": round(sum(r["ocr_ms"] for r in sel) / n, 1),
+            "mean_agreement": round(sum(r["agreement"] for r in sel) / n, 4),
+        })
+    return summary, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="rgb / gray / binary upload encoding benchmark")
+    parser.add_argument("pdfs", nargs="*", help="默认: files/*.pdf")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    parser.add_argument("--ocr-backend", default="tencent", choices=["tencent", "offline"])
+    parser.add_argument("--per-page", action="store_true", help="同时输出每页明细")
+    args = parser.parse_args()
+
+    pdf_paths = args.pdfs or sorted(glob.glob("files/*.pdf"))
+    if not pdf_paths:
+        parser.error("没有找到 PDF 文件")
+    summary, rows = bench(pdf_paths, args.dpi, args.ocr_backend)
+
+    rgb = summary[0]["upload_bytes_per_page"] or 1
+    for s in summary:
+        print(f"{s['encoding']:>6}: {s['upload_bytes_per_page']:>9} bytes/page "
+              f"({s['upload_bytes_per_page'] / rgb:.0%} of rgb), encode {s['encode_ms_per_page']} ms, "
+              f"OCR {s['ocr_ms_per_page']} ms, agreement {s['mean_agreement']}")
+    if args.ocr_backend == "offline":
+        print("注意: offline 后端按图片内容合成文本，agreement 无意义，仅比较上传大小。")
+    print(json.dumps({"summary": summary, "pages": rows if args.per_page else None}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
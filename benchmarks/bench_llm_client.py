@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: llm_analysis import time, first-call latency and connection reuse.
+
+A local OpenAI-compatible stub server answers /chat/completions with a fixed
+JSON reply, so no network or API key is needed and the numbers measure our
+own client overhead. Each run is a fresh process (import costs only show up
+once per interpreter). Reported: time to import llm_analysis, the first
+extract_visa_fields() call (includes creating the client), the mean of the
+following calls, and how many TCP connections the stub saw for all calls
+(1 means keep-alive was reused). The LLM cache is disabled for the run.
+
+用法: python benchmarks/bench_llm_client.py [--calls 10] [--repeat 3]
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+STUB_REPLY = {
+    "id": "stub", "object": "chat.completion", "created": 0, "model": "stub",
+    "choices": [{"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": json.dumps({"Personal Information": {"surname": None}})}}],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Minimal /chat/completions endpoint with HTTP/1.1 keep-alive; counts connections."""
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        # reply headers and body go out in separate writes; without this, delayed ACKs add ~40 ms per call
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps(STUB_REPLY).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _measure(base_url, calls):
+    # OPENAI_API_BASE as well: load_dotenv() never overrides a variable that is already set
+    os.environ.update({"OPENAI_API_BASE": base_url, "OPENAI_BASE_URL": base_url, "OPENAI_API_KEY": "sk-stub",
+                       "MODEL": "stub", "LLM_CACHE": "0"})
+    t0 = time.perf_counter()
+    import llm_analysis
+    import_s = time.perf_counter() - t0
+
+    timings = []
+    for i in range(calls):
+        t0 = time.perf_counter()
+        llm_analysis.extract_visa_fields(f"Name: Applicant {i}", use_mrz=False)
+        timings.append(time.perf_counter() - t0)
+    return {
+        "import_ms": round(import_s * 1000, 1),
+        "first_call_ms": round(timings[0] * 1000, 1),
+        "next_call_ms": round(sum(timings[1:]) / max(1, len(timings) - 1) * 1000, 2),
+    }
+
+
+def _import_only():
+    """Whether importing llm_analysis alone pulls in langchain."""
+    os.environ.update({"OPENAI_API_KEY": "sk-stub", "MODEL": "stub"})
+    import llm_analysis  # noqa: F401
+    return "langchain_openai" in sys.modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM client import / first-call benchmark against a local stub")
+    parser.add_argument("--calls", type=int, default=10, help="每个进程内的提取次数")
+    parser.add_argument("--repeat", type=int, default=3, help="运行次数，取最快一次")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(max(1, args.repeat)):
+        before = StubHandler.connections
+        with ctx.Pool(1) as pool:
+            row = pool.apply(_measure, (base_url, max(1, args.calls)))
+        row["connections"] = StubHandler.connections - before
+        runs.append(row)
+    with ctx.Pool(1) as pool:
+        langchain_at_import = pool.apply(_import_only)
+    server.shutdown()
+
+    best = {metric: min(r[metric] for r in runs) for metric in ("import_ms", "first_call_ms", "next_call_ms")}
+    best.update(calls=args.calls, repeat=len(runs), connections=max(r["connections"] for r in runs),
+                langchain_loaded_at_import=langchain_at_import)
+    print(json.dumps(best, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
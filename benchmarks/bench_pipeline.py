@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: end-to-end OCR pipeline throughput on synthetic PDFs.
+
+Generates PDFs with a given number of pages of "text" (born-digital, has a text
+layer), "image" (scan: a noisy page photo with no text layer) or "mixed"
+(alternating) content, and runs them through iter_page_records() against a
+local stub OCR backend that sleeps `--latency` seconds per request. No network
+or credentials are needed, so the numbers measure our own render / encode /
+scheduling overhead.
+
+Every run of a case is a fresh process so peak RSS is measured in isolation;
+each case runs `--repeat` times and keeps the best time (timings on a shared
+machine only ever get worse by noise). Reported per case: pages/sec, render
+and encode ms per OCR'd page, bytes uploaded (base64 payload), OCR requests
+and peak RSS, written as JSON to --output (not stdout: some PyMuPDF versions
+print a deprecation notice there on import). With --baseline a previous result
+is compared case by case and the exit status is 1 if render or encode ms/page
+got slower than --tolerance, so the benchmark can gate a deploy.
+
+用法: python benchmarks/bench_pipeline.py [--pages 1 10 40] [--dpi 150 300] [--content text image mixed]
+                                         [--latency 0.2] [--workers 4] [--repeat 3]
+                                         [--output bench_pipeline.json] [--baseline old.json] [--tolerance 0.25]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+import contextlib
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fitz  # PyMuPDF
+from PIL import Image, ImageFilter
+
+from pdf_to_markdown import (
+    ENCODINGS, DEFAULT_ENCODING, DEFAULT_OCR_WORKERS, ReplayOcrBackend, iter_page_records,
+)
+from ocr_dispatch import OcrDispatcher
+from bench_render import _max_rss_kb
+
+CONTENTS = ("text", "image", "mixed")
+SCAN_DPI = 200  # resolution of the synthetic "photo" embedded in image pages
+SCAN_VARIANTS = 3  # distinct scan images cycled through, so pages do not all encode alike
+WORDS = ("passport", "applicant", "visa", "Ireland", "address", "employer", "salary", "bank",
+         "statement", "balance", "account", "date", "study", "course", "university", "sponsor")
+
+
+class StubOcrBackend(ReplayOcrBackend):
+    """Synthetic OCR after a fixed latency; counts requests and uploaded base64 bytes."""
+    name = "stub"
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency=latency)
+        self.upload_bytes = 0
+
+    def recognize(self, image_b64: str, use_accurate=True) -> dict:
+        with self._lock:
+            self.upload_bytes += len(image_b64)
+        return super().recognize(image_b64, use_accurate=use_accurate)
+
+
+def _paragraphs(rng, lines=45):
+    return "\n".join(" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 11))) for _ in range(lines))
+
+
+def _text_page(doc, rng):
+    page = doc.new_page(width=595, height=842)  # A4
+    page.insert_textbox(fitz.Rect(56, 56, 539, 786), _paragraphs(rng), fontsize=10)
+    return page
+
+
+def _scan_jpeg(rng):
+    """A text page rendered, blurred and noised like a phone photo of paper, as JPEG bytes."""
+    src = fitz.open()
+    try:
+        pix = _text_page(src, rng).get_pixmap(matrix=fitz.Matrix(SCAN_DPI / 72, SCAN_DPI / 72), alpha=False)
+        img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    finally:
+        src.close()
+    img = img.rotate(rng.uniform(-1.5, 1.5), fillcolor=(235, 232, 225)).filter(ImageFilter.GaussianBlur(0.8))
+    noise = Image.effect_noise(img.size, 18).convert("RGB")
+    img = Image.blend(img, noise, 0.12)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=80)
+    return buf.getvalue()
+
+
+def make_synthetic_pdf(path, pages, content, seed=0):
+    """Write a `pages`-page PDF of `content` ("text", "image" or "mixed") to `path`."""
+    rng = random.Random(seed)
+    scans = [_scan_jpeg(rng) for _ in range(SCAN_VARIANTS)] if content != "text" else []
+    doc = fitz.open()
+    try:
+        for i in range(pages):
+            if content == "text" or (content == "mixed" and i % 2 == 0):
+                _text_page(doc, rng)
+            else:
+                page = doc.new_page(width=595, height=842)
+                page.insert_image(page.rect, stream=scans[i % len(scans)])
+        doc.save(path, garbage=3, deflate=True)
+    finally:
+        doc.close()
+    return path
+
+
+def _measure(pdf_path, dpi, encoding, latency, workers, use_text_layer):
+    backend = StubOcrBackend(latency)
+    dispatcher = OcrDispatcher(backend, qps=0, hedge=None)
+    baseline_kb = _max_rss_kb()
+    render_ms = encode_ms = 0.0
+    sources = {"text": 0, "cache": 0, "ocr": 0}
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for rec in iter_page_records(pdf_path, dpi=dpi, max_workers=workers, backend=dispatcher,
+                                     use_text_layer=use_text_layer, encoding=encoding):
+            sources[rec["source"]] += 1
+            render_ms += rec["timings"].get("render_ms", 0.0)
+            encode_ms += rec["timings"].get("encode_ms", 0.0)
+    wall = time.perf_counter() - t0
+    pages = sum(sources.values())
+    rendered = (sources["ocr"] + sources["cache"]) or 1
+    return {
+        "pages": pages,
+        "wall_s": round(wall, 3),
+        "pages_per_sec": round(pages / wall, 2) if wall else None,
+        "render_ms_per_page": round(render_ms / rendered, 2),
+        "encode_ms_per_page": round(encode_ms / rendered, 2),
+        "upload_bytes": backend.upload_bytes,
+        "upload_bytes_per_page": backend.upload_bytes // rendered,
+        "ocr_requests": backend.calls,
+        "text_layer_pages": sources["text"],
+        "peak_rss_mb": round(_max_rss_kb() / 1024, 1),
+        "peak_rss_delta_mb": round((_max_rss_kb() - baseline_kb) / 1024, 1),
+    }
+
+
+def best_of(runs):
+    """Merge repeated runs of one case: fastest timings, largest memory."""
+    best = dict(min(runs, key=lambda r: r["wall_s"]))
+    best["pages_per_sec"] = max(r["pages_per_sec"] or 0 for r in runs)
+    for metric in ("render_ms_per_page", "encode_ms_per_page"):
+        best[metric] = min(r[metric] for r in runs)
+    for metric in ("peak_rss_mb", "peak_rss_delta_mb"):
+        best[metric] = max(r[metric] for r in runs)
+    best["repeat"] = len(runs)
+    return best
+
+
+def run_cases(pages_list, dpis, contents, encoding, latency, workers, use_text_layer, workdir, repeat=1):
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for content in contents:
+        for pages in pages_list:
+            pdf_path = make_synthetic_pdf(os.path.join(workdir, f"{content}_{pages}.pdf"), pages, content)
+            for dpi in dpis:
+                runs = []
+                for _ in range(max(1, repeat)):
+                    with ctx.Pool(1) as pool:
+                        runs.append(pool.apply(_measure, (pdf_path, dpi, encoding, latency, workers,
+                                                          use_text_layer)))
+                row = best_of(runs)
+                results.append({"case": f"{content}/{pages}p/{dpi}dpi", "content": content, "dpi": dpi, **row})
+                print(f"[BENCH] {results[-1]['case']}: {row['pages_per_sec']} 页/秒, "
+                      f"渲染 {row['render_ms_per_page']} ms/页, 编码 {row['encode_ms_per_page']} ms/页, "
+                      f"上传 {row['upload_bytes']} bytes, 峰值 RSS {row['peak_rss_mb']} MB", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Cases whose render / encode ms per page grew by more than `tolerance` (a
+    fraction). Only cases present in both runs are compared.
+    """
+    old = {r["case"]: r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        prev = old.get(r["case"])
+        if prev is None:
+            continue
+        for metric in ("render_ms_per_page", "encode_ms_per_page"):
+            # ignore sub-millisecond noise (text-only cases barely render anything)
+            if prev[metric] >= 1.0 and r[metric] > prev[metric] * (1 + tolerance):
+                regressions.append({"case": r["case"], "metric": metric,
+                                    "baseline": prev[metric], "current": r[metric]})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR pipeline throughput benchmark on synthetic PDFs")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 40], help="每个 PDF 的页数")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300])
+    parser.add_argument("--content", nargs="+", choices=CONTENTS, default=list(CONTENTS))
+    parser.add_argument("--encoding", choices=ENCODINGS, default=DEFAULT_ENCODING)
+    parser.add_argument("--latency", type=float, default=0.2, help="模拟的每次 OCR 延迟（秒）")
+    parser.add_argument("--workers", type=int, default=DEFAULT_OCR_WORKERS)
+    parser.add_argument("--force-ocr", action="store_true", help="忽略文本层，text 页也走 OCR")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例运行次数，取最快一次")
+    parser.add_argument("--output", default="bench_pipeline.json", help="JSON 结果文件")
+    parser.add_argument("--baseline", help="与之前的 JSON 结果比较，渲染/编码变慢时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的变慢比例（默认 0.25）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_pipeline_") as workdir:
+        results = run_cases(args.pages, args.dpi, args.content, args.encoding, args.latency,
+                            args.workers, not args.force_ocr, workdir, repeat=args.repeat)
+    config = {"latency_s": args.latency, "workers": args.workers, "encoding": args.encoding,
+              "text_layer": not args.force_ocr, "python": sys.version.split()[0],
+              "pymupdf": fitz.VersionBind}
+    report = {"config": config, "results": results}
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"[WARN] 基线配置不同: {baseline.get('config')}", file=sys.stderr)
+        report["regressions"] = compare(results, baseline, args.tolerance)
+        for reg in report["regressions"]:
+            print(f"[WARN] {reg['case']} {reg['metric']}: {reg['baseline']} -> {reg['current']}", file=sys.stderr)
+        status = 1 if report["regressions"] else 0
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"[BENCH] 结果已写入 {args.output}", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: page render + JPEG encode, legacy PNG round-trip vs. direct
+pixmap -> JPEG (pdf_to_markdown.render_page_to_jpeg_bytes).
+
+Every (path, dpi) combination runs in a fresh process so peak RSS is measured
+in isolation. CPU is process time per page.
+
+用法: python benchmarks/bench_render.py [files/Cover_Letter.pdf] [--dpi 150 300] [--repeat 3]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from pdf_to_markdown import render_page_to_jpeg_bytes
+
+
+def legacy_render_to_jpeg(doc, page_number, dpi, jpeg_quality=85):
+    """The previous implementation: pixmap -> PNG -> PIL decode -> RGB -> JPEG."""
+    page = doc.load_page(page_number)
+    mat = fitz.Matrix(dpi / 72.0, dpi / 72.0)
+    pix = page.get_pixmap(matrix=mat, alpha=False)
+    img_bytes = pix.tobytes(output="png")
+    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=jpeg_quality)
+    return buf.getvalue()
+
+
+VARIANTS = {
+    "legacy_png": legacy_render_to_jpeg,
+    "direct": lambda doc, idx, dpi: render_page_to_jpeg_bytes(doc, idx, dpi=dpi),
+}
+
+
+def _max_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _measure(variant, pdf_path, dpi, repeat):
+    render = VARIANTS[variant]
+    doc = fitz.open(pdf_path)
+    baseline_kb = _max_rss_kb()
+    pages = doc.page_count * repeat
+    out_bytes = 0
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    for _ in range(repeat):
+        for idx in range(doc.page_count):
+            out_bytes += len(render(doc, idx, dpi))
+    cpu = time.process_time() - cpu0
+    wall = time.perf_counter() - wall0
+    return {
+        "variant": variant,
+        "dpi": dpi,
+        "pages": pages,
+        "cpu_ms_per_page": round(cpu * 1000 / pages, 2),
+        "wall_ms_per_page": round(wall * 1000 / pages, 2),
+        "peak_rss_delta_mb": round((_max_rss_kb() - baseline_kb) / 1024, 1),
+        "jpeg_bytes_per_page": out_bytes // pages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="render_page_to_jpeg_bytes micro-benchmark")
+    parser.add_argument("pdf", nargs="?", default="files/Cover_Letter.pdf")
+    parser.add_argument("--dpi", type=int, nargs="+", default=[150, 300])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for dpi in args.dpi:
+        for variant in VARIANTS:
+            with ctx.Pool(1) as pool:
+                results.append(pool.apply(_measure, (variant, args.pdf, dpi, args.repeat)))
+
+    for dpi in args.dpi:
+        legacy, direct = [r for r in results if r["dpi"] == dpi]
+        print(f"DPI {dpi}: cpu/page {legacy['cpu_ms_per_page']} -> {direct['cpu_ms_per_page']} ms, "
+              f"peak RSS +{legacy['peak_rss_delta_mb']} -> +{direct['peak_rss_delta_mb']} MB")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
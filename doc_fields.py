@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Document-type routing and typed-field mapping for structured OCR.
+
+Passports and Chinese resident ID cards can be read by Tencent's dedicated
+endpoints (MLIDPassportOCR / IDCardOCR), which return typed fields in one call.
+This module decides which documents qualify (detect_doc_type) and maps those
+responses onto the same sections/field names llm_analysis extracts, so the
+result can be used in place of the LLM for these documents.
+"""
+
+import re
+import datetime
+from pathlib import Path
+
+DOC_TYPES = ("passport", "id_card")
+
+# filename hints (lower-cased stem); only the name decides, since keywords such as
+# "PASSPORT" also appear in cover letters and routing costs extra OCR calls
+FILENAME_HINTS = {
+    "passport": ("passport", "护照"),
+    "id_card": ("id_card", "idcard", "id-card", "身份证"),
+}
+
+# ICAO 9303 nationality codes (passport MRZ / MLIDPassportOCR) -> country names for
+# the Nationality field. Unlisted codes map to None rather than a bare code.
+NATIONALITY_NAMES = {
+    "CHN": "China", "HKG": "Hong Kong", "MAC": "Macao", "TWN": "Taiwan",
+    "IND": "India", "PAK": "Pakistan", "BGD": "Bangladesh", "NPL": "Nepal", "LKA": "Sri Lanka",
+    "IDN": "Indonesia", "MYS": "Malaysia", "PHL": "Philippines", "SGP": "Singapore",
+    "THA": "Thailand", "VNM": "Vietnam", "JPN": "Japan", "KOR": "South Korea",
+    "MNG": "Mongolia", "KAZ": "Kazakhstan", "UZB": "Uzbekistan",
+    "IRN": "Iran", "IRQ": "Iraq", "SAU": "Saudi Arabia", "ARE": "United Arab Emirates",
+    "TUR": "Turkey", "EGY": "Egypt", "NGA": "Nigeria", "GHA": "Ghana", "KEN": "Kenya",
+    "ZAF": "South Africa", "RUS": "Russia", "UKR": "Ukraine", "BLR": "Belarus",
+    "BRA": "Brazil", "MEX": "Mexico", "ARG": "Argentina", "COL": "Colombia", "CHL": "Chile",
+    "USA": "United States", "CAN": "Canada", "AUS": "Australia", "NZL": "New Zealand",
+    "GBR": "United Kingdom", "IRL": "Ireland", "D": "Germany", "FRA": "France",
+    "ITA": "Italy", "ESP": "Spain", "PRT": "Portugal", "NLD": "Netherlands", "POL": "Poland",
+}
+
+FIELDS_SUFFIX = ".fields.json"
+
+_MONTHS = {m: i for i, m in enumerate(
+    ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"], 1)}
+
+
+def fields_path_for(source_path: str) -> str:
+    """`files/passport.pdf` -> `files/passport.pdf.fields.json` (also accepts the .md path)."""
+    base = source_path[:-3] if source_path.endswith(".md") else source_path
+    return base + FIELDS_SUFFIX
+
+
+def detect_doc_type(path):
+    """"passport", "id_card" or None, from the file name (FILENAME_HINTS)."""
+    name = Path(path).stem.lower()
+    for doc_type, hints in FILENAME_HINTS.items():
+        if any(h in name for h in hints):
+            return doc_type
+    return None
+
+
+def normalize_date(value):
+    """
+    Normalize the date formats the endpoints return ("1992-10-17", "19921017",
+    "1992/10/17", "1992.10.17", "17 OCT 1992", "921017") to YYYY-MM-DD.
+    Unparseable values are returned unchanged; empty values become None.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    m = re.fullmatch(r"(\d{4})[-/.年](\d{1,2})[-/.月](\d{1,2})日?", value)
+    if m:
+        y, mo, d = (int(g) for g in m.groups())
+    elif re.fullmatch(r"\d{8}", value):
+        y, mo, d = int(value[:4]), int(value[4:6]), int(value[6:])
+    elif re.fullmatch(r"\d{6}", value):
+        # MRZ style YYMMDD; two-digit years ahead of the current year are last century
+        yy, mo, d = int(value[:2]), int(value[2:4]), int(value[4:])
+        y = 2000 + yy if 2000 + yy <= datetime.date.today().year + 20 else 1900 + yy
+    else:
+        m = re.fullmatch(r"(\d{1,2})\s*([A-Za-z]{3})[A-Za-z]*\s*(\d{4})", value)
+        if not m or m.group(2).upper() not in _MONTHS:
+            return value
+        y, mo, d = int(m.group(3)), _MONTHS[m.group(2).upper()], int(m.group(1))
+    try:
+        return datetime.date(y, mo, d).isoformat()
+    except ValueError:
+        return value
+
+
+def normalize_gender(value):
+    value = (value or "").strip().upper()
+    if value in ("M", "MALE", "男"):
+        return "Male"
+    if value in ("F", "FEMALE", "女"):
+        return "Female"
+    return None
+
+
+def nationality_name(code):
+    """Country name for an ICAO nationality code ("CHN" -> "China"); None when not listed."""
+    if not isinstance(code, str):
+        return None
+    return NATIONALITY_NAMES.get(code.strip().upper())
+
+
+def _clean(value):
+    value = (value or "").strip() if isinstance(value, str) else value
+    return value or None
+
+
+def passport_to_fields(resp: dict) -> dict:
+    """Map an MLIDPassportOCR response onto the extraction schema."""
+    info = resp.get("PassportRecognizeInfos") or {}
+    surname = _clean(resp.get("Surname") or info.get("Surname"))
+    forename = _clean(resp.get("GivenName") or info.get("GivenName"))
+    if not surname and "," in (resp.get("Name") or ""):
+        surname, forename = (_clean(p) for p in resp["Name"].split(",", 1))
+    number = _clean(resp.get("ID") or info.get("PassportID"))
+    doc_code = _clean(resp.get("Type") or info.get("Type")) or ""
+    passport = {
+        "passport_number": number,
+        "issuing_authority": _clean(info.get("IssuingAuthority")),
+        "date_of_issue": normalize_date(info.get("DateOfIssuance")),
+        "date_of_expiry": normalize_date(resp.get("DateOfExpiration") or info.get("DateOfExpiration")),
+    }
+    return {
+        "Personal Information": {
+            "surname": surname,
+            "forename": forename,
+            "date_of_birth": normalize_date(resp.get("DateOfBirth") or info.get("DateOfBirth")),
+            "gender": normalize_gender(resp.get("Sex") or info.get("Sex")),
+            "place_of_birth": _clean(info.get("BirthPlace")),
+            "nationality": nationality_name(resp.get("Nationality") or info.get("Nationality")),
+        },
+        "Passport Information": dict(
+            passport,
+            passport_type="National Passport" if doc_code.startswith("P") else None,
+        ),
+        "Travel Document Details": {"passport_1": passport},
+    }
+
+
+def id_card_to_fields(resp: dict) -> dict:
+    """Map an IDCardOCR response (front and/or back side) onto the extraction schema."""
+    fields = {}
+    name = _clean(resp.get("Name"))
+    if name or resp.get("IdNum"):
+        # the card only has the name in Chinese characters: surname / forename are the
+        # Latin-script (passport) spelling and a per-character split gets compound
+        # surnames (欧阳) wrong, so the name goes into other_name only
+        fields["Personal Information"] = {
+            "other_name": name,
+            "date_of_birth": normalize_date(resp.get("Birth")),
+            "gender": normalize_gender(resp.get("Sex")),
+            "current_address": _clean(resp.get("Address")),
+        }
+        fields["Contact Information"] = {"address_line_1": _clean(resp.get("Address"))}
+    # not part of the visa form sections, kept for cross-checking
+    start, _, end = (resp.get("ValidDate") or "").partition("-")
+    card = {
+        "id_number": _clean(resp.get("IdNum")),
+        "issuing_authority": _clean(resp.get("Authority")),
+        "date_of_issue": normalize_date(start),
+        "date_of_expiry": normalize_date(end),  # "长期" (no expiry) is kept as is
+    }
+    if any(v is not None for v in card.values()):
+        fields["ID Card Information"] = card
+    return fields
+
+
+MAPPERS = {"passport": passport_to_fields, "id_card": id_card_to_fields}
+
+
+def merge_fields(base: dict, extra: dict) -> dict:
+    """Fill None / missing values of `base` from `extra`, section by section."""
+    merged = {k: dict(v) if isinstance(v, dict) else v for k, v in base.items()}
+    for section, values in extra.items():
+        target = merged.setdefault(section, {})
+        if not isinstance(values, dict) or not isinstance(target, dict):
+            continue
+        for key, value in values.items():
+            if key not in target or (target[key] is None and value is not None):
+                target[key] = value
+    return merged
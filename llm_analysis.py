@@ -1,12 +1,58 @@
 import os
+import re
 import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 load_dotenv()
-from langchain_openai import ChatOpenAI
 from pathlib import Path
 
-llm = ChatOpenAI(model_name=os.environ.get("MODEL"), temperature=0.4)
+from doc_fields import fields_path_for, merge_fields
+from mrz_parser import find_mrz, mrz_to_fields
+from llm_cache import LlmCache, make_llm_cache_key
+from applicant_profile import document_source, merge_profile, merge_chunk_fields
+from visa_template import (
+    split_template, sections_for_doc_type, build_prompt, fill_schema, section_skeleton, strip_known_fields,
+)
+from llm_json import parse_llm_json
+from visa_schema import build_schema, section_schema, validate_section
+
+LLM_MODEL = os.environ.get("MODEL")
+LLM_TEMPERATURE = 0.4
+
+# LLM 响应的 JSON 解析方式计数：直接解析 / 本地修复 / 仍需 LLM 修复
+json_parse_stats = {"direct": 0, "local_repair": 0, "llm_repair": 0}
+_json_parse_stats_lock = threading.Lock()
+
+# 结构化输出：json_schema（按请求分节生成的 JSON Schema）/ json_object（JSON 模式）/ off；
+# 接口不支持时自动改为普通请求
+LLM_JSON_MODE = os.environ.get("LLM_JSON_MODE", "json_object")
+_json_mode_supported = True
+# 分节校验失败时重新请求（只发送失败分节）的轮数
+SECTION_RETRIES = 1
+
+# 批量提取时同时进行的 LLM 请求数
+DEFAULT_LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "4"))
+# 进程内同时进行的 LLM 请求上限（invoke_llm 处限流）：批量并发的文件数与各文件的分块并发会相乘，
+# 不限流时请求数会超过 HTTP 连接池（get_llm 按 LLM_CONCURRENCY 设置）
+_llm_slots = threading.BoundedSemaphore(max(1, DEFAULT_LLM_CONCURRENCY))
+# 长文件分块提取：每块文本的最大字符数（按 <!-- Page N --> 整页切分）
+LLM_CHUNK_CHARS = int(os.environ.get("LLM_CHUNK_CHARS", "12000"))
+_PAGE_MARKER = re.compile(r"(?=^<!-- Page \d+ -->)", re.MULTILINE)
+# 接口不支持结构化输出时错误信息中的关键字；其他 400 错误（如上下文超长）不应关闭结构化输出
+_JSON_MODE_ERROR = re.compile(r"response_format|json[ _-]?(mode|object|schema)", re.IGNORECASE)
+# 空闲 HTTP 连接保留时间（秒），两次提取之间不必重新建立 TLS 连接
+LLM_KEEPALIVE_EXPIRY = 120.0
+
+# 进程内共享的 LLM 客户端，首次调用 get_llm() 时创建（导入本模块不加载 langchain）
+llm = None
+_llm_lock = threading.Lock()
+
+# LLM 响应缓存（SQLite，见 llm_cache.py），首次使用时创建；环境变量 LLM_CACHE=0 关闭
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
 
 irish_visa_template_prompt = '''
 你是一名爱尔兰签证材料字段识别专家。
@@ -169,73 +215,462 @@ irish_visa_template_prompt = '''
 {text}
 '''
 
+# 按分节切分的模板（见 visa_template.py），按文件类型只发送相关分节
+visa_prompt_header, visa_prompt_sections, visa_prompt_footer = split_template(irish_visa_template_prompt)
+# 各分节的类型定义（见 visa_schema.py），用于校验 LLM 结果
+visa_section_schemas = {name: section_schema(fragment) for name, fragment in visa_prompt_sections.items()}
+
+# 分节校验失败、只重新请求这些分节时附加在提示词末尾
+section_retry_note = '''
+
+补充说明：上一次提取结果中以下字段不符合要求（类型、可选项或日期格式），请按上面的要求重新提取这些分节：
+{errors}
+'''
+
+# JSON 修复请求的提示词
+json_fix_prompt = "请将以下文本修复为合法的JSON格式，只输出JSON，不要其他解释：\n\n{content}"
+
+
+def get_llm():
+    """
+    返回进程内共享的 ChatOpenAI 客户端，首次调用时才导入 langchain 并创建。
+    客户端可在多个线程（批量提取时的 asyncio.to_thread）间共享，
+    所有请求复用同一个 keep-alive HTTP 连接池，连接数按 LLM_CONCURRENCY 设置
+    """
+    global llm
+    if llm is None:
+        with _llm_lock:
+            if llm is None:
+                import httpx
+                from openai import DefaultHttpxClient
+                from langchain_openai import ChatOpenAI
+
+                limits = httpx.Limits(max_connections=max(1, DEFAULT_LLM_CONCURRENCY) * 2,
+                                      max_keepalive_connections=max(1, DEFAULT_LLM_CONCURRENCY),
+                                      keepalive_expiry=LLM_KEEPALIVE_EXPIRY)
+                llm = ChatOpenAI(model_name=LLM_MODEL, temperature=LLM_TEMPERATURE,
+                                 http_client=DefaultHttpxClient(limits=limits))
+    return llm
+
+
+def get_llm_cache():
+    """返回进程内共享的 LLM 缓存；LLM_CACHE=0 时返回 None"""
+    global _llm_cache
+    if os.environ.get("LLM_CACHE", "1") == "0":
+        return None
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LlmCache()
+    return _llm_cache
+
+
+def count_json_parse(kind: str) -> None:
+    with _json_parse_stats_lock:
+        json_parse_stats[kind] += 1
+
+
+def response_format_for(names, known=None):
+    """
+    按 LLM_JSON_MODE 生成请求的 response_format（只含 names 分节、不含 known 中已有值字段的 JSON Schema），
+    off 或接口不支持时为 None
+    """
+    if not _json_mode_supported:
+        return None
+    if LLM_JSON_MODE == "json_schema":
+        return {"type": "json_schema",
+                "json_schema": {"name": "visa_fields", "schema": build_schema(prompt_sections(known), names)}}
+    if LLM_JSON_MODE == "json_object":
+        return {"type": "json_object"}
+    return None
+
+
+def invoke_llm(prompt: str, response_format=None) -> str:
+    """
+    调用 LLM 并返回响应文本。接口因不支持 response_format 拒绝请求（错误信息提到
+    response_format / JSON mode）时改为普通请求，本进程内之后的请求也不再使用结构化输出；
+    其他错误（包括上下文超长等 400 错误）照常抛出。
+    全进程同时进行的请求不超过 LLM_CONCURRENCY 个（见 _llm_slots），其余请求在此等待
+    """
+    global _json_mode_supported
+    with _llm_slots:
+        if response_format is not None and _json_mode_supported:
+            try:
+                return get_llm().invoke(prompt, response_format=response_format).content.strip()
+            except Exception as e:
+                if not _JSON_MODE_ERROR.search(str(e)):
+                    raise
+                print(f"[WARN] 接口不支持结构化输出（{response_format['type']}），改用普通请求: {str(e)[:200]}")
+                _json_mode_supported = False
+        return get_llm().invoke(prompt).content.strip()
+
+
+def invoke_llm_cached(prompt: str, template: str, text: str, cache, pending: dict, response_format=None) -> str:
+    """
+    调用 LLM 并返回响应文本；缓存命中（同一模型、温度、提示词模板、输入和输出格式）时不调用。
+    新的响应先记入 pending（键 -> 响应），由调用方在 JSON 解析成功后再写入缓存，
+    避免把无法解析的结果固定下来
+    """
+    key = make_llm_cache_key(LLM_MODEL, LLM_TEMPERATURE, template, text,
+                             response_format=json.dumps(response_format, sort_keys=True))
+    if cache is not None:
+        content = cache.get(key)
+        if content is not None:
+            return content
+    content = invoke_llm(prompt, response_format)
+    pending[key] = content
+    return content
+
+
+def validate_fields(fields: dict, names, drop_invalid=False) -> dict:
+    """按类型定义校验 names 中各分节（原地规范化），返回 {分节: [错误说明]}，只含有错误的分节"""
+    errors = {}
+    for name in names:
+        found = validate_section(fields, name, visa_section_schemas[name], drop_invalid)
+        if found:
+            errors[name] = found
+    return errors
+
+
+def retry_sections(fields: dict, errors: dict, markdown_text: str, known, cache, pending: dict) -> dict:
+    """
+    只重新请求校验失败的分节：提示词只含这些分节并附上错误说明，
+    新结果中对应分节替换原结果，其余分节不变
+    """
+    names = list(errors)
+    print(f"[WARN] 分节校验失败，重新请求: {', '.join(names)}")
+    error_text = "\n".join(f"- {msg}" for name in names for msg in errors[name])
+    template = build_prompt(visa_prompt_header, prompt_sections(known), names, visa_prompt_footer)
+    prompt = template.format(text=markdown_text) + section_retry_note.format(errors=error_text)
+    template += section_retry_note
+    content = invoke_llm_cached(prompt, template, markdown_text + "\n" + error_text, cache, pending,
+                                response_format_for(names, known))
+    try:
+        retried = parse_llm_json(content)
+    except ValueError:
+        print(f"[WARN] 重新请求的结果无法解析: {content[:200]}")
+        return fields
+    if isinstance(retried, dict):
+        for name in names:
+            if retried.get(name) is not None:
+                fields[name] = retried[name]
+    return fields
+
+
+def prompt_sections(known=None) -> dict:
+    """
+    提示词各分节；known（如 MRZ 字段）中已有值的字段从分节中删去，
+    字段全部已知的分节为 None（不再请求）
+    """
+    if not known:
+        return visa_prompt_sections
+    known = known_values(known)
+    return {name: strip_known_fields(fragment, known.get(name) or {})
+            for name, fragment in visa_prompt_sections.items()}
+
+
+def visa_prompt_for(doc_type=None, known=None):
+    """
+    按文件类型选取提示词分节（依据模板中的 //passport、//id_card、//offer 等来源提示），
+    known 中已有值的字段不放进提示词（见 prompt_sections）
+
+    Returns:
+        (提示词模板, 选中的分节名列表)；doc_type 为 None 或没有对应规则时为完整模板和全部分节，
+        分节全部已知时列表为空
+    """
+    sections = prompt_sections(known)
+    names = [name for name in sections_for_doc_type(visa_prompt_sections, doc_type) if sections[name] is not None]
+    if sections is visa_prompt_sections and len(names) == len(visa_prompt_sections):
+        return irish_visa_template_prompt, names
+    return build_prompt(visa_prompt_header, sections, names, visa_prompt_footer), names
+
+
+def known_values(known: dict) -> dict:
+    """known 中去掉值为 None 的字段（这些字段仍由 LLM 识别，不能从提示词中删去）"""
+    result = {}
+    for key, value in known.items():
+        if isinstance(value, dict):
+            value = known_values(value)
+        if value not in (None, {}):
+            result[key] = value
+    return result
+
+
+def apply_known_fields(fields: dict, known: dict) -> dict:
+    """
+    用已确定的字段（如 MRZ 解析结果）覆盖 LLM 的结果，按分节逐字段合并，
+    known 中为 None 的字段保留 LLM 的值
+    """
+    for section, values in known.items():
+        if isinstance(values, dict) and isinstance(fields.get(section), dict):
+            apply_known_fields(fields[section], values)
+        elif isinstance(values, dict):
+            fields[section] = apply_known_fields({}, values)
+        elif values is not None:
+            fields[section] = values
+    return fields
+
+
+def mrz_fields_from_text(markdown_text: str):
+    """
+    在OCR文本中查找护照MRZ并校验；所有校验位通过时返回对应字段，
+    未找到或校验失败时返回 None（此时全部交给 LLM 识别）
+    """
+    mrz = find_mrz(markdown_text)
+    if mrz is None:
+        return None
+    if not mrz["valid"]:
+        failed = [name for name, ok in mrz["checks"].items() if not ok]
+        print(f"[WARN] 护照 MRZ 校验位不符 ({', '.join(failed)})，改由 LLM 识别")
+        return None
+    print(f"[INFO] 护照 MRZ 校验通过: {mrz['passport_number']}，相关字段不再由 LLM 识别")
+    return mrz_to_fields(mrz)
 
-def extract_visa_fields(markdown_text: str) -> dict:
+
+def extract_visa_fields(markdown_text: str, use_mrz=True, use_cache=True, doc_type=None) -> dict:
     """
     从Markdown文本中提取签证字段
     
     Args:
         markdown_text: Markdown格式的文本内容
+        use_mrz: 先在本地解析护照MRZ（机读区），校验通过的字段直接填入，
+            LLM 只识别其余字段
+        use_cache: 使用 LLM 响应缓存（主请求和 JSON 修复请求都经过缓存）
+        doc_type: 文件类型（passport / id_card / offer ...），提示词只包含该类文件能填写的分节，
+            其余分节在结果中补为 null；None 时发送完整模板
         
     Returns:
         提取的签证字段字典
     """
-    # 构建完整的提示词，将文本内容插入模板
-    prompt = irish_visa_template_prompt.format(text=markdown_text)
-    
-    # 调用LLM进行字段提取
-    response = llm.invoke(prompt)
-    
-    # 获取响应内容
-    content = response.content.strip()
+    known = mrz_fields_from_text(markdown_text) if use_mrz else None
+    cache = get_llm_cache() if use_cache else None
+    pending = {}  # 本次新得到的 LLM 响应，解析成功后写入缓存
+
+    # 构建提示词，将文本内容插入模板（按文件类型只保留相关分节，MRZ 已读出的字段不再列出）
+    template, sections = visa_prompt_for(doc_type, known)
+    if not sections:
+        print("[INFO] 所需字段已全部由 MRZ 填入，跳过 LLM")
+        return apply_known_fields(fill_schema({}, visa_prompt_sections, []), known)
+    prompt = template.format(text=markdown_text)
+
+    # 调用LLM进行字段提取（支持时使用结构化输出），获取响应内容
+    response_format = response_format_for(sections, known)
+    content = invoke_llm_cached(prompt, template, markdown_text, cache, pending, response_format)
     
-    # 尝试解析JSON
+    # 尝试解析JSON：先严格解析，再本地修复（代码块、多余逗号、True/None 等），都失败时才请 LLM 修复
     try:
-        # 如果响应是JSON格式，直接解析
         fields = json.loads(content)
+        count_json_parse("direct")
     except json.JSONDecodeError:
-        # 如果响应不是纯JSON，尝试提取JSON部分
-        # 查找JSON代码块或直接提取JSON
-        import re
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if json_match:
-            try:
-                fields = json.loads(json_match.group())
-            except json.JSONDecodeError:
-                # 如果还是失败，返回错误信息
-                print(f"[WARN] 无法解析JSON，原始响应: {content[:200]}...")
-                # 尝试让LLM修复JSON
-                fix_prompt = f"请将以下文本修复为合法的JSON格式，只输出JSON，不要其他解释：\n\n{content}"
-                fix_response = llm.invoke(fix_prompt)
-                try:
-                    fields = json.loads(fix_response.content.strip())
-                except json.JSONDecodeError:
-                    raise ValueError(f"无法解析LLM返回的JSON格式: {fix_response.content[:200]}")
-        else:
+        if "{" not in content:
             raise ValueError(f"响应中未找到JSON格式: {content[:200]}")
+        try:
+            fields = parse_llm_json(content)
+            count_json_parse("local_repair")
+        except ValueError:
+            print(f"[WARN] 无法解析JSON，请求 LLM 修复，原始响应: {content[:200]}...")
+            count_json_parse("llm_repair")
+            fix_prompt = json_fix_prompt.format(content=content)
+            fixed = invoke_llm_cached(fix_prompt, json_fix_prompt, content, cache, pending, response_format)
+            try:
+                fields = parse_llm_json(fixed)
+            except ValueError:
+                raise ValueError(f"无法解析LLM返回的JSON格式: {fixed[:200]}")
     
+    # 按类型校验各分节，不合格的分节单独重新请求；仍不合格的字段置为 null
+    errors = validate_fields(fields, sections) if isinstance(fields, dict) else {}
+    for _ in range(SECTION_RETRIES):
+        if not errors:
+            break
+        fields = retry_sections(fields, errors, markdown_text, known, cache, pending)
+        errors = validate_fields(fields, list(errors))
+    if errors:
+        validate_fields(fields, list(errors), drop_invalid=True)
+        print(f"[WARN] 以下字段仍不符合要求，已置为 null: {[msg for msgs in errors.values() for msg in msgs]}")
+
+    if cache is not None:
+        for key, value in pending.items():
+            cache.put(key, value)
+    if len(sections) < len(visa_prompt_sections):
+        fields = fill_schema(fields, visa_prompt_sections, sections)
+    if known:
+        fields = apply_known_fields(fields, known)
+    return fields
+
+
+def _pack(pieces, max_chars: int) -> list:
+    """把相邻片段依次合并成不超过 max_chars 的块；只有页标记的片段不单独成块"""
+    chunks = []
+    buf = ""
+    for piece in pieces:
+        if buf and len(buf) + len(piece) > max_chars and not re.fullmatch(r"<!-- Page \d+ -->", buf.strip()):
+            chunks.append(buf)
+            buf = ""
+        buf += piece
+    if buf.strip():
+        chunks.append(buf)
+    return chunks
+
+
+def split_markdown_chunks(markdown_text: str, max_chars=LLM_CHUNK_CHARS) -> list:
+    """
+    按 pdf_to_markdown 输出的 <!-- Page N --> 标记把文本切成约 max_chars 字符的块：
+    相邻整页合并到同一块，单页超长时再按段落、仍超长时按行切开，
+    没有换行的超长行（部分 OCR 输出）按 max_chars 硬切。每块最多 max_chars 字符
+    另加一个页标记，各块依次拼接即为原文
+    """
+    pieces = []
+    for page in _PAGE_MARKER.split(markdown_text):
+        if not page.strip():
+            continue
+        if len(page) <= max_chars:
+            pieces.append(page)
+            continue
+        for para in re.split(r"(?<=\n\n)", page):
+            if len(para) <= max_chars:
+                pieces.append(para)
+            else:
+                lines = re.split(r"(?<=\n)", para)
+                pieces.extend(_pack([line[i:i + max_chars] for line in lines
+                                     for i in range(0, max(1, len(line)), max_chars)], max_chars))
+    return _pack(pieces, max_chars)
+
+
+def extract_visa_fields_chunked(markdown_text: str, use_mrz=True, use_cache=True, doc_type=None,
+                                max_chars=LLM_CHUNK_CHARS, max_concurrency=DEFAULT_LLM_CONCURRENCY) -> dict:
+    """
+    长文件分块提取（map-reduce）：按页切成约 max_chars 字符的块，各块并发调用
+    extract_visa_fields，再按字段规则合并（见 applicant_profile.merge_chunk_fields：
+    单值取页序最靠前的非空值，列表合并去重）。总耗时取决于最大的一块而不是整个文件；
+    只有一块时与 extract_visa_fields 相同。护照 MRZ 在整份文本上解析，合并后填入
+    """
+    chunks = split_markdown_chunks(markdown_text, max_chars)
+    if len(chunks) <= 1:
+        return extract_visa_fields(markdown_text, use_mrz=use_mrz, use_cache=use_cache, doc_type=doc_type)
+
+    print(f"[INFO] 文本较长（{len(markdown_text)} 字符），分 {len(chunks)} 块并发提取")
+
+    def extract_chunk(chunk):
+        try:
+            return extract_visa_fields(chunk, use_mrz=False, use_cache=use_cache, doc_type=doc_type)
+        except ValueError as e:
+            print(f"[WARN] 分块提取失败，跳过该块: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks)))) as pool:
+        results = [r for r in pool.map(extract_chunk, chunks) if r is not None]
+    if not results:
+        raise ValueError(f"全部 {len(chunks)} 块提取失败")
+
+    reduced = merge_chunk_fields(results)
+    for conflict in reduced["conflicts"]:
+        print(f"[WARN] 分块结果不一致 {conflict['field']}: 采用 {conflict['chosen']!r}，其他: {conflict['others']!r}")
+    fields = reduced["fields"]
+    known = mrz_fields_from_text(markdown_text) if use_mrz else None
+    if known:
+        fields = apply_known_fields(fields, known)
     return fields
 
 
+def structured_fields_to_schema(raw: dict) -> dict:
+    """
+    把结构化 OCR 的字段（`<文件>.fields.json`）整理成与 LLM 提取相同的完整结构：
+    只保留模板中的分节（`_source`、仅用于核对的 "ID Card Information" 留在文件里），
+    缺少的字段和分节补 null，再按类型定义校验，不合格的值置为 null
+    """
+    fields = {name: value for name, value in raw.items() if name in visa_prompt_sections}
+    requested = list(fields)
+    fields = fill_schema(fields, visa_prompt_sections, requested)
+    fields = merge_fields(fields, {name: section_skeleton(visa_prompt_sections[name]) for name in requested})
+    errors = validate_fields(fields, requested, drop_invalid=True)
+    for name, messages in errors.items():
+        print(f"[WARN] 结构化 OCR 字段不符合类型定义，已置为 null: {'; '.join(messages)}")
+    return fields
+
+
+def extract_visa_fields_for_file(md_path: str) -> dict:
+    """
+    提取单个转换后文件的签证字段。经结构化OCR识别的护照/身份证
+    （pdf_to_markdown --doc-type）在Markdown旁有 `<文件>.fields.json`，
+    直接使用该文件（整理为完整结构，见 structured_fields_to_schema），不调用 LLM
+    """
+    fields_path = Path(fields_path_for(str(md_path)))
+    if fields_path.exists():
+        print(f"[INFO] 使用结构化 OCR 字段，跳过 LLM: {fields_path}")
+        return structured_fields_to_schema(json.loads(fields_path.read_text(encoding="utf-8")))
+    return extract_visa_fields_chunked(Path(md_path).read_text(encoding="utf-8"), doc_type=document_source(md_path))
+
+
+async def extract_documents_async(md_paths, max_concurrency=DEFAULT_LLM_CONCURRENCY) -> list:
+    """
+    并发提取同一申请人多个文件的签证字段，同时进行的提取不超过 max_concurrency 个
+    （每个文件在线程中调用 extract_visa_fields_for_file）
+
+    Returns:
+        与 md_paths 顺序一致的列表，每项为 {"name", "source", "fields", "error"}；
+        source 为文件类型（passport / id_card / cover_letter / other），
+        单个文件失败时 fields 为 None、error 为错误信息，不影响其他文件
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def extract_one(md_path):
+        doc = {"name": str(md_path), "source": document_source(md_path), "fields": None, "error": None}
+        async with semaphore:
+            print(f"[BATCH] 正在处理: {md_path}")
+            try:
+                doc["fields"] = await asyncio.to_thread(extract_visa_fields_for_file, md_path)
+            except Exception as e:
+                doc["error"] = str(e)
+                print(f"[ERROR] 提取失败: {md_path}: {e}")
+        return doc
+
+    return list(await asyncio.gather(*(extract_one(p) for p in md_paths)))
+
+
+async def extract_applicant_profile_async(md_paths, max_concurrency=DEFAULT_LLM_CONCURRENCY) -> dict:
+    """
+    并发提取申请人的全部文件，并按字段来源优先级合并为一份申请人档案
+    （身份字段：护照 > 身份证 > 求学信，见 applicant_profile.py）
+
+    Returns:
+        {"profile": 合并后的字段, "sources": {"分节.字段": 取值来源文件},
+         "conflicts": 各文件取值不一致的字段, "documents": 各文件的 name / source / error}
+    """
+    docs = await extract_documents_async(md_paths, max_concurrency)
+    result = merge_profile([doc for doc in docs if doc["fields"] is not None])
+    result["documents"] = [{k: doc[k] for k in ("name", "source", "error")} for doc in docs]
+    return result
+
+
+def extract_applicant_profile(md_paths, max_concurrency=DEFAULT_LLM_CONCURRENCY) -> dict:
+    """extract_applicant_profile_async 的同步版本"""
+    return asyncio.run(extract_applicant_profile_async(md_paths, max_concurrency))
+
+
 if __name__ == "__main__":
     md_files = [
         "files/passport.pdf.md",
         "files/id_card.pdf.md",
         "files/cover_letter.pdf.md"
     ]
+    profile_path = Path("files/applicant_profile.json")
 
+    existing = []
     for md_path in md_files:
-        path = Path(md_path)
-        if not path.exists():
+        if Path(md_path).exists():
+            existing.append(md_path)
+        else:
             print(f"[WARN] 文件不存在: {md_path}")
-            continue
 
-        markdown_text = path.read_text(encoding="utf-8")
-        print(f"\n[INFO] 正在处理: {md_path}")
+    result = extract_applicant_profile(existing)
+    print("\n[INFO] 合并后的申请人档案:")
+    print(json.dumps(result["profile"], ensure_ascii=False, indent=2))
+    for conflict in result["conflicts"]:
+        others = ", ".join(f"{o['document']}={o['value']!r}" for o in conflict["others"])
+        print(f"[WARN] 字段不一致 {conflict['field']}: 采用 {conflict['chosen']['document']}="
+              f"{conflict['chosen']['value']!r}，其他: {others}")
+    profile_path.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[INFO] 申请人档案已保存: {profile_path}")
 
-        try:
-            fields = extract_visa_fields(markdown_text)
-            print("[INFO] 提取的签证字段:")
-            print(json.dumps(fields, ensure_ascii=False, indent=2))
-        except Exception as e:
-            print(f"[ERROR] 提取失败: {e}")
\ No newline at end of file
+    print(f"[INFO] JSON 解析统计 {json_parse_stats}")
+    if get_llm_cache() is not None:
+        print(f"\n[CACHE] LLM 缓存 {get_llm_cache().stats()}")
\ No newline at end of file
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent SQLite cache for LLM responses.
+
+Key = sha256 over the model name, temperature, a hash of the prompt template
+and a hash of the input text (see make_llm_cache_key()), value = the raw
+response text. Entries older than `ttl_seconds` are treated as misses and
+purged; once the stored responses grow past `max_bytes` the least recently
+used ones are evicted. One database file can be shared by several processes.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+DEFAULT_LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+DEFAULT_LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024
+DEFAULT_LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 3600
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_llm_cache_key(model, temperature, template: str, text: str, **params) -> str:
+    """Hash everything that changes the response: model, temperature, prompt template and input."""
+    meta = {"model": model, "temperature": temperature,
+            "template": _sha256(template), "input": _sha256(text)}
+    meta.update(params)
+    return _sha256(json.dumps(meta, sort_keys=True))
+
+
+class LlmCache:
+    """Thread-safe persistent LLM response cache with a TTL, a size cap and LRU eviction."""
+
+    def __init__(self, path=DEFAULT_LLM_CACHE_PATH, max_bytes=DEFAULT_LLM_CACHE_MAX_BYTES,
+                 ttl_seconds=DEFAULT_LLM_CACHE_TTL, clock=time.time):
+        self.path = Path(path)
+        if self.path.parent != Path("."):
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                             "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                             "created_at REAL NOT NULL, last_used REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key: str):
+        """Return the cached response for `key`, or None on a miss (expired entries are misses)."""
+        now = self._clock()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            # touch so the entry counts as recently used
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        """Store `value` under `key`, purge expired entries and evict LRU ones if over the cap."""
+        now = self._clock()
+        size = len(value.encode("utf-8"))
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                             (key, value, size, now, now))
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(total)
+
+    def _evict(self, total) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes (lock held)."""
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return {"hits": self.hits, "misses": self.misses, "expired": self.expired,
+                    "evictions": self.evictions, "entries": entries, "bytes": size}
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tolerant parsing of the JSON an LLM returns.
+
+Models often wrap otherwise good JSON in a markdown fence or a sentence of
+prose, leave a trailing comma, write Python literals (True / False / None,
+single-quoted strings) or echo the template's "//" comments. repair_json()
+fixes exactly those deterministically, outside string literals only, and
+parse_llm_json() tries strict json.loads first, then the repaired text. Only
+what neither can read needs another LLM round-trip.
+"""
+
+import re
+import json
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)```", re.DOTALL)
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def extract_json_block(text: str) -> str:
+    """
+    The JSON part of a response: the contents of a ``` fence if there is one,
+    otherwise the span from the first "{" (or "[") to its matching bracket
+    (to the end of the text if it never closes).
+    """
+    m = _FENCE.search(text)
+    if m:
+        text = m.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return text.strip()
+    start = min(starts)
+    depth = 0
+    quote = None
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if quote:
+            if ch == "\\":
+                i += 1
+            elif ch == quote:
+                quote = None
+        elif ch in "\"'":
+            quote = ch
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+        i += 1
+    return text[start:]
+
+
+def _read_string(text: str, i: int):
+    """Read the string literal starting at text[i]; returns (JSON string literal, index after it)."""
+    quote = text[i]
+    j = i + 1
+    parts = []
+    while j < len(text) and text[j] != quote:
+        if text[j] == "\\" and j + 1 < len(text):
+            pair = text[j:j + 2]
+            parts.append("'" if pair == "\\'" else pair)
+            j += 2
+            continue
+        parts.append('\\"' if text[j] == '"' else text[j])
+        j += 1
+    return '"' + "".join(parts) + '"', j + 1
+
+
+def _skip_blank(text: str, i: int) -> int:
+    """Index of the next character that is not whitespace or inside a comment."""
+    while i < len(text):
+        if text[i].isspace():
+            i += 1
+        elif text.startswith("//", i) or text[i] == "#":
+            while i < len(text) and text[i] != "\n":
+                i += 1
+        else:
+            break
+    return i
+
+
+def repair_json(text: str) -> str:
+    """
+    Rewrite common LLM JSON mistakes into valid JSON: drop fences / prose around
+    the object, "//" and "#" comments and trailing commas, turn True / False /
+    None into JSON literals and single-quoted strings into double-quoted ones.
+    String contents are left alone.
+    """
+    text = extract_json_block(text)
+    out = []
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch in "\"'":
+            literal, i = _read_string(text, i)
+            out.append(literal)
+            continue
+        if text.startswith("//", i) or ch == "#":
+            while i < n and text[i] != "\n":
+                i += 1
+            continue
+        if ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            out.append(_PY_LITERALS.get(word, word))
+            i = j
+            continue
+        if ch == ",":
+            j = _skip_blank(text, i + 1)
+            if j < n and text[j] in "}]":
+                i += 1
+                continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def parse_llm_json(text: str):
+    """
+    Parse an LLM response as JSON: strict first, then after repair_json().
+    Raises ValueError (json.JSONDecodeError) when neither works.
+    """
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    # strict=False: models put raw newlines / tabs inside string values
+    return json.loads(repair_json(text), strict=False)
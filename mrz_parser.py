@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Find and parse the machine-readable zone (MRZ) of a passport in OCR text.
+
+Passports carry a two-line, 44-character TD3 MRZ (ICAO 9303):
+
+    P<CHNLEI<<NANKUN<<<<<<<<<<<<<<<<<<<<<<<<<<<<
+    EQ59212201CHN9210170M3509087MANHMEMPMAKEA988
+
+Line 2 holds the passport number, nationality, date of birth, sex and expiry,
+each numeric field followed by a check digit, plus a composite check digit over
+the whole line. OCR often splits line 1 into several lines and confuses O/0,
+I/1 etc.; find_mrz() re-joins the pieces and repairs digits in numeric
+positions only, and every check digit is verified so a misread never passes
+silently. mrz_to_fields() maps a parsed MRZ onto the extraction schema.
+"""
+
+import re
+import datetime
+
+from doc_fields import normalize_gender, nationality_name
+
+TD3_LENGTH = 44
+
+# characters OCR confuses with digits; only applied where the MRZ requires a digit
+_TO_DIGIT = str.maketrans({"O": "0", "Q": "0", "D": "0", "I": "1", "L": "1", "Z": "2",
+                           "S": "5", "B": "8", "G": "6"})
+_NUM = "[0-9OQDILZSBG]"
+_LINE2 = re.compile(
+    rf"[A-Z0-9<]{{9}}{_NUM}[A-Z<]{{3}}{_NUM}{{7}}[MFX<]{_NUM}{{7}}[A-Z0-9<]{{14}}[0-9OQDILZSBG<]{_NUM}")
+_LINE1_START = re.compile(r"P[A-Z0-9<][A-Z<]{3}")
+
+
+def check_digit(field: str) -> str:
+    """ICAO 9303 check digit: weights 7, 3, 1 over digits, A=10..Z=35 and '<'=0."""
+    total = 0
+    for i, ch in enumerate(field):
+        if ch.isdigit():
+            value = int(ch)
+        elif "A" <= ch <= "Z":
+            value = ord(ch) - ord("A") + 10
+        else:
+            value = 0
+        total += value * (7, 3, 1)[i % 3]
+    return str(total % 10)
+
+
+def _mrz_date(yymmdd: str, past: bool):
+    """YYMMDD -> YYYY-MM-DD; birth dates (`past`) are never in the future, expiry dates within 50 years."""
+    try:
+        yy, mm, dd = int(yymmdd[:2]), int(yymmdd[2:4]), int(yymmdd[4:6])
+    except ValueError:
+        return None
+    this_year = datetime.date.today().year
+    year = 2000 + yy
+    if (past and year > this_year) or (not past and year > this_year + 50):
+        year -= 100
+    try:
+        return datetime.date(year, mm, dd).isoformat()
+    except ValueError:
+        return None
+
+
+def _normalize_line(line: str) -> str:
+    return line.strip().upper().replace(" ", "").replace("«", "<").replace("＜", "<")
+
+
+def parse_td3(line1, line2: str) -> dict:
+    """
+    Parse a TD3 MRZ. `line1` (names) may be None when it could not be found.
+    Numeric fields of line 2 are digit-repaired before the checks. Returns the
+    fields, per-field check results under "checks" and "valid" (all checks pass).
+    """
+    line2 = line2[:TD3_LENGTH].ljust(TD3_LENGTH, "<")
+    number, number_check = line2[0:9], line2[9].translate(_TO_DIGIT)
+    birth, birth_check = line2[13:19].translate(_TO_DIGIT), line2[19].translate(_TO_DIGIT)
+    expiry, expiry_check = line2[21:27].translate(_TO_DIGIT), line2[27].translate(_TO_DIGIT)
+    personal, personal_check = line2[28:42], line2[42].translate(_TO_DIGIT)
+    composite_check = line2[43].translate(_TO_DIGIT)
+    repaired = number + number_check + line2[10:13] + birth + birth_check + line2[20] \
+        + expiry + expiry_check + personal + personal_check + composite_check
+
+    checks = {
+        "passport_number": check_digit(number) == number_check,
+        "date_of_birth": check_digit(birth) == birth_check,
+        "date_of_expiry": check_digit(expiry) == expiry_check,
+        # an unused personal number may have '<' as its check digit
+        "personal_number": check_digit(personal) == personal_check
+        or (personal_check == "<" and personal.strip("<") == ""),
+        "composite": check_digit(repaired[0:10] + repaired[13:20] + repaired[21:43]) == composite_check,
+    }
+    result = {
+        "document_code": None,
+        "issuing_country": None,
+        "surname": None,
+        "given_names": None,
+        "passport_number": number.replace("<", "") or None,
+        "nationality": line2[10:13].replace("<", "") or None,
+        "date_of_birth": _mrz_date(birth, past=True),
+        "sex": line2[20] if line2[20] in "MFX" else None,
+        "date_of_expiry": _mrz_date(expiry, past=False),
+        "personal_number": personal.replace("<", "") or None,
+        "checks": checks,
+        "valid": all(checks.values()),
+        "lines": [None, repaired],
+    }
+    if line1:
+        line1 = line1[:TD3_LENGTH].ljust(TD3_LENGTH, "<")
+        result["lines"][0] = line1
+        surname, _, given = line1[5:].partition("<<")
+        result.update({
+            "document_code": line1[0:2].replace("<", ""),
+            "issuing_country": line1[2:5].replace("<", ""),
+            "surname": surname.replace("<", " ").strip() or None,
+            "given_names": " ".join(given.replace("<", " ").split()) or None,
+        })
+    return result
+
+
+def find_mrz(text: str):
+    """
+    Locate a TD3 MRZ in OCR text and parse it (see parse_td3()), or None.
+    Line 1 is re-assembled from the pieces OCR split it into: the closest line
+    above line 2 starting like "P<CHN..." plus the filler-only lines after it.
+    """
+    lines = [_normalize_line(line) for line in text.splitlines()]
+    for i, line in enumerate(lines):
+        m = _LINE2.search(line)
+        if not m:
+            continue
+        line1 = None
+        for j in range(i - 1, max(-1, i - 4), -1):
+            if _LINE1_START.match(lines[j]) and "<<" in lines[j]:
+                line1 = "".join(lines[j:i])
+                if re.fullmatch(r"[A-Z0-9<]+", line1):
+                    break
+                line1 = None
+        return parse_td3(line1, m.group())
+    return None
+
+
+def mrz_to_fields(mrz: dict) -> dict:
+    """
+    Map a parsed MRZ onto the Personal / Passport / Travel Document sections.
+    The nationality code becomes a country name (doc_fields.nationality_name());
+    an unlisted code gives None, so the LLM's reading is kept instead.
+    """
+    sex = mrz.get("sex")
+    passport = {
+        "passport_number": mrz["passport_number"],
+        "date_of_expiry": mrz["date_of_expiry"],
+    }
+    return {
+        "Personal Information": {
+            "surname": mrz["surname"],
+            "forename": mrz["given_names"],
+            "date_of_birth": mrz["date_of_birth"],
+            "gender": "Other" if sex == "X" else normalize_gender(sex),
+            "nationality": nationality_name(mrz["nationality"]),
+        },
+        "Passport Information": dict(
+            passport,
+            passport_type="National Passport" if (mrz.get("document_code") or "").startswith("P") else None,
+        ),
+        "Travel Document Details": {"passport_1": dict(passport)},
+    }
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed on-disk cache for OCR results.
+
+Key = sha256 of the rendered page bytes plus the OCR/render parameters,
+value = the raw OCR JSON returned by Tencent. Entries are plain JSON files;
+the file mtime doubles as the LRU clock and the oldest entries are evicted
+once the cache grows past `max_bytes`.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = os.getenv("OCR_CACHE_DIR", ".ocr_cache")
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+def make_cache_key(img_bytes: bytes, use_accurate=True, dpi=None, quality=None, **params) -> str:
+    """Hash the exact bytes sent to OCR together with everything that changes the result."""
+    h = hashlib.sha256(img_bytes)
+    meta = {"use_accurate": bool(use_accurate), "dpi": dpi, "quality": quality}
+    meta.update(params)
+    h.update(json.dumps(meta, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+class OcrCache:
+    """Thread-safe persistent OCR result cache with a size cap and LRU eviction."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._sizes = None  # {path: size}, scanned lazily on first write
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        """Return the cached OCR JSON for `key`, or None on a miss."""
+        path = self._path(key)
+        try:
+            ocr_json = json.loads(path.read_text(encoding="utf-8"))
+            # touch so the entry counts as recently used
+            os.utime(path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return ocr_json
+
+    def put(self, key: str, ocr_json) -> None:
+        """Store `ocr_json` under `key` (atomic write) and evict old entries if over the cap."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(ocr_json, ensure_ascii=False).encode("utf-8")
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._sizes is None:
+                self._sizes = {p: p.stat().st_size for p in self.cache_dir.glob("*/*.json")}
+            self._sizes[path] = len(data)
+            if sum(self._sizes.values()) > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes (lock held)."""
+        entries = []
+        for p in list(self._sizes):
+            try:
+                entries.append((p.stat().st_mtime, p))
+            except OSError:
+                self._sizes.pop(p, None)
+        total = sum(self._sizes.values())
+        for _, p in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                pass
+            total -= self._sizes.pop(p, 0)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
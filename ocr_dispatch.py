@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rate-limit-aware OCR dispatcher.
+
+Sits in front of an OCR backend (anything with recognize(image_b64, use_accurate)):
+- a token bucket caps requests per second across all threads sharing the dispatcher;
+- throttling errors (Tencent RequestLimitExceeded*, HTTP 429) are retried with
+  full-jitter exponential backoff and never trigger the Basic fallback;
+- any other Accurate-endpoint failure falls back to Basic OCR, as before;
+- optionally, an Accurate call still running after the `hedge_percentile`
+  latency of recent calls is hedged with a second request (Basic, or Accurate
+  again) and whichever good result arrives first is used.
+Throttles, retries, fallbacks, hedges fired and hedges won are counted, and
+per-page latency percentiles are kept for tuning.
+"""
+
+import os
+import math
+import time
+import random
+import threading
+from collections import deque
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+
+# Tencent GeneralAccurateOCR default quota is 10 requests/second per account
+DEFAULT_OCR_QPS = float(os.getenv("OCR_QPS", "10"))
+DEFAULT_MAX_RETRIES = int(os.getenv("OCR_MAX_RETRIES", "5"))
+DEFAULT_BACKOFF_BASE = 0.5  # seconds
+DEFAULT_BACKOFF_MAX = 8.0   # seconds
+
+# hedging: "basic" / "accurate" / "" (off)
+DEFAULT_HEDGE = os.getenv("OCR_HEDGE", "") or None
+DEFAULT_HEDGE_PERCENTILE = float(os.getenv("OCR_HEDGE_PERCENTILE", "95"))
+HEDGE_INITIAL_DELAY = 3.0  # seconds, used until HEDGE_MIN_SAMPLES latencies have been seen
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200       # recent calls the percentiles are computed over
+HEDGE_MODES = ("basic", "accurate")
+
+THROTTLE_CODE_PREFIXES = ("RequestLimitExceeded", "LimitExceeded.Frequency", "FailedOperation.RequestLimitExceeded")
+
+
+def is_throttle_error(exc) -> bool:
+    """True if `exc` means "slow down" rather than "this request failed"."""
+    code = getattr(exc, "code", None)
+    if code is None and callable(getattr(exc, "get_code", None)):
+        code = exc.get_code()
+    if isinstance(code, str) and code.startswith(THROTTLE_CODE_PREFIXES):
+        return True
+    return getattr(exc, "status_code", None) == 429 or code == 429
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate, capacity=None):
+        with self._lock:
+            self.rate = float(rate)
+            self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+            self._tokens = min(self._tokens, self.capacity)
+
+    def acquire(self):
+        """Take one token, sleeping until one is available. No-op when rate <= 0."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of `samples` (None when empty)."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, int(math.ceil(p / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class OcrDispatcher:
+    """Throttle-aware front for an OCR backend; share one per backend per process."""
+
+    def __init__(self, backend, qps=DEFAULT_OCR_QPS, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX,
+                 sleep=time.sleep, rng=random.random, hedge=DEFAULT_HEDGE,
+                 hedge_percentile=DEFAULT_HEDGE_PERCENTILE, hedge_initial_delay=HEDGE_INITIAL_DELAY):
+        self.backend = backend
+        self.name = backend.name
+        self.bucket = TokenBucket(qps, sleep=sleep)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sleep = sleep
+        self._rng = rng
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.throttles = 0
+        self.retries = 0
+        self.fallbacks = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.set_hedging(hedge, hedge_percentile)
+        self.hedge_initial_delay = hedge_initial_delay
+        self._accurate_latencies = deque(maxlen=LATENCY_WINDOW)  # single Accurate calls, sets the hedge delay
+        self._page_latencies = deque(maxlen=LATENCY_WINDOW)      # whole recognize() calls, for reporting
+
+    def set_hedging(self, hedge, hedge_percentile=None):
+        """Turn hedging on ("basic" or "accurate" second request) or off (None)."""
+        if hedge not in (None,) + HEDGE_MODES:
+            raise ValueError(f"未知的对冲模式: {hedge}（可选: {', '.join(HEDGE_MODES)}）")
+        self.hedge = hedge
+        if hedge_percentile is not None:
+            self.hedge_percentile = float(hedge_percentile)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for an Accurate call before hedging it."""
+        with self._lock:
+            samples = list(self._accurate_latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return self.hedge_initial_delay
+        return percentile(samples, self.hedge_percentile)
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _call(self, image_b64, use_accurate, doc_type=None):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            self._count("requests")
+            start = time.monotonic()
+            try:
+                if doc_type is not None:
+                    return self.backend.recognize_document(image_b64, doc_type)
+                result = self.backend.recognize(image_b64, use_accurate=use_accurate)
+                if use_accurate:
+                    with self._lock:
+                        self._accurate_latencies.append(time.monotonic() - start)
+                return result
+            except Exception as e:
+                if not is_throttle_error(e):
+                    raise
+                self._count("throttles")
+                if attempt >= self.max_retries:
+                    raise
+                # full jitter: uniform in [0, min(max, base * 2^attempt)]
+                delay = self._rng() * min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                attempt += 1
+                self._count("retries")
+                print(f"  [WARN] OCR 被限流 ({e})，{delay:.2f}s 后第 {attempt} 次重试")
+                self._sleep(delay)
+
+    def _spawn(self, image_b64, use_accurate):
+        """Run _call() on its own thread; a hedged call's loser is left to finish and discarded."""
+        fut = Future()
+
+        def run():
+            try:
+                fut.set_result(self._call(image_b64, use_accurate))
+            except BaseException as e:
+                fut.set_exception(e)
+
+        threading.Thread(target=run, name="ocr-hedge", daemon=True).start()
+        return fut
+
+    def _hedged(self, image_b64):
+        """
+        Accurate call, hedged once it outlives hedge_delay(). An Accurate result
+        wins as soon as it arrives; a Basic hedge that finishes first is only
+        used if the Accurate call is still not back after another hedge_delay().
+        If every attempt fails, the Accurate error is raised.
+        Returns (result, endpoint) like recognize_with_endpoint().
+        """
+        delay = self.hedge_delay()
+        primary = self._spawn(image_b64, True)
+        if wait([primary], timeout=delay).done:
+            return primary.result(), "accurate"
+
+        self._count("hedges_fired")
+        hedge_accurate = self.hedge == "accurate"
+        print(f"  [OCR] Accurate OCR {delay:.2f}s 未返回，发出对冲请求 ({self.hedge})")
+        hedge = self._spawn(image_b64, hedge_accurate)
+        racing = {primary, hedge}
+        basic_result = None
+        while racing:
+            done, racing = wait(racing, timeout=delay if basic_result is not None else None,
+                                return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for fut in done:
+                if fut.exception() is not None:
+                    continue
+                if fut is primary or hedge_accurate:
+                    if fut is hedge:
+                        self._count("hedges_won")
+                    return fut.result(), "accurate"
+                basic_result = fut.result()
+        if basic_result is not None:
+            self._count("hedges_won")
+            return basic_result, "basic"
+        return primary.result(), "accurate"
+
+    def recognize_with_endpoint(self, image_b64: str, use_accurate=True):
+        """
+        OCR with throttle retries (and hedging, if enabled). A non-throttling
+        Accurate failure falls back to Basic OCR; throttling that outlasts the
+        retries is raised, not downgraded.
+        Returns (result, endpoint) where endpoint is "accurate" or "basic", the
+        one that actually answered, so a fallback or a winning Basic hedge is
+        never taken (or cached) as an Accurate result.
+        """
+        start = time.monotonic()
+        try:
+            try:
+                if use_accurate and self.hedge:
+                    return self._hedged(image_b64)
+                return self._call(image_b64, use_accurate), "accurate" if use_accurate else "basic"
+            except Exception as e:
+                if not use_accurate or is_throttle_error(e):
+                    raise
+                self._count("fallbacks")
+                print(f"  [WARN] Accurate OCR 失败，尝试 Basic OCR: {e}")
+                return self._call(image_b64, False), "basic"
+        finally:
+            with self._lock:
+                self._page_latencies.append(time.monotonic() - start)
+
+    def recognize(self, image_b64: str, use_accurate=True) -> dict:
+        """recognize_with_endpoint() without the endpoint."""
+        return self.recognize_with_endpoint(image_b64, use_accurate=use_accurate)[0]
+
+    def recognize_document(self, image_b64: str, doc_type: str) -> dict:
+        """Structured (passport / ID card) OCR under the same QPS bucket and throttle retries; no fallback."""
+        return self._call(image_b64, True, doc_type=doc_type)
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)) -> dict:
+        """Per-page recognize() latency over the last LATENCY_WINDOW calls, in ms."""
+        with self._lock:
+            samples = list(self._page_latencies)
+        result = {"samples": len(samples)}
+        for p in percentiles:
+            value = percentile(samples, p)
+            result[f"p{p:g}_ms"] = None if value is None else round(value * 1000, 1)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "throttles": self.throttles,
+                    "retries": self.retries, "fallbacks": self.fallbacks,
+                    "hedges_fired": self.hedges_fired, "hedges_won": self.hedges_won}
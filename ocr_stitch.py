@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stitch several small page images into one canvas for a single OCR call, and
+split the OCR result back into per-page results.
+
+Pages are stacked vertically with a blank gap between them. Every TextDetection
+is assigned to the page whose region contains the centre of its polygon, and
+its coordinates are shifted back into that page's own pixel space, so each
+per-page result looks as if the page had been OCR'd on its own.
+"""
+
+import copy
+
+from PIL import Image
+
+# Tencent general OCR accepts images up to 10000 px per side
+MAX_CANVAS_SIDE = 10000
+STITCH_GAP = 48  # blank pixels between pages, keeps lines of adjacent pages apart
+
+
+def layout_vertical(sizes, gap=STITCH_GAP):
+    """
+    Stack (width, height) boxes top to bottom.
+    Returns (canvas_size, regions) where regions[i] = (x, y, width, height).
+    """
+    regions = []
+    y = 0
+    for width, height in sizes:
+        regions.append((0, y, width, height))
+        y += height + gap
+    canvas_w = max((w for w, _ in sizes), default=0)
+    canvas_h = max(0, y - gap)
+    return (canvas_w, canvas_h), regions
+
+
+def stitch_images(images, gap=STITCH_GAP):
+    """Paste PIL images onto one white canvas (RGB if any page is colour, else L)."""
+    mode = "RGB" if any(img.mode not in ("1", "L") for img in images) else "L"
+    canvas_size, regions = layout_vertical([img.size for img in images], gap)
+    canvas = Image.new(mode, canvas_size, "white")
+    for img, (x, y, _, _) in zip(images, regions):
+        canvas.paste(img if img.mode == mode else img.convert(mode), (x, y))
+    return canvas, regions
+
+
+def _points(item):
+    """Corner points of a detection as [(x, y), ...] (Polygon, else ItemPolygon)."""
+    polygon = item.get("Polygon")
+    if polygon:
+        return [(p.get("X", 0), p.get("Y", 0)) for p in polygon]
+    box = item.get("ItemPolygon")
+    if box:
+        x, y = box.get("X", 0), box.get("Y", 0)
+        return [(x, y), (x + box.get("Width", 0), y + box.get("Height", 0))]
+    return []
+
+
+def _shift(item, dx, dy):
+    item = copy.deepcopy(item)
+    for p in item.get("Polygon") or []:
+        p["X"] = p.get("X", 0) - dx
+        p["Y"] = p.get("Y", 0) - dy
+    box = item.get("ItemPolygon")
+    if box:
+        box["X"] = box.get("X", 0) - dx
+        box["Y"] = box.get("Y", 0) - dy
+    return item
+
+
+def split_detections(ocr_json, regions):
+    """
+    Split a stitched-canvas OCR result into one result per region, keeping the
+    detection order. Detections without coordinates go to the first page;
+    centres that fall into a gap go to the nearest page.
+    """
+    pages = [[] for _ in regions]
+    for item in ocr_json.get("TextDetections", []):
+        pts = _points(item)
+        if not pts or not regions:
+            if regions:
+                pages[0].append(item)
+            continue
+        cx = sum(x for x, _ in pts) / len(pts)
+        cy = sum(y for _, y in pts) / len(pts)
+
+        def distance(region):
+            x, y, w, h = region
+            dx = max(x - cx, 0, cx - (x + w))
+            dy = max(y - cy, 0, cy - (y + h))
+            return dx * dx + dy * dy
+
+        i = min(range(len(regions)), key=lambda k: distance(regions[k]))
+        x, y, _, _ = regions[i]
+        pages[i].append(_shift(item, x, y))
+
+    results = []
+    for detections in pages:
+        page_json = {k: v for k, v in ocr_json.items() if k != "TextDetections"}
+        page_json["TextDetections"] = detections
+        results.append(page_json)
+    return results
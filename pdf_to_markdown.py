@@ -9,6 +9,13 @@ import os
 import json
 import base64
 import io
+import math
+import time
+import gzip
+import hashlib
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
 from pathlib import Path
 
 from tencentcloud.common import credential
@@ -20,7 +27,12 @@ try:
 except Exception as e:
     raise ImportError("请先安装 PyMuPDF: pip install pymupdf") from e
 
-from PIL import Image
+from PIL import Image, ImageChops, ImageFilter
+
+from ocr_cache import OcrCache, make_cache_key, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_BYTES
+from ocr_dispatch import OcrDispatcher, DEFAULT_OCR_QPS, DEFAULT_HEDGE, DEFAULT_HEDGE_PERCENTILE, HEDGE_MODES
+from ocr_stitch import stitch_images, split_detections, MAX_CANVAS_SIDE, STITCH_GAP
+from doc_fields import DOC_TYPES, MAPPERS, detect_doc_type, merge_fields, fields_path_for
 
 # Tencent limits
 MAX_B64_BYTES = 7 * 1024 * 1024  # 7 MB
@@ -28,6 +40,46 @@ MAX_B64_BYTES = 7 * 1024 * 1024  # 7 MB
 # default render settings
 DEFAULT_DPI = 150
 MIN_DPI = 72
+DEFAULT_JPEG_QUALITY = 85
+MIN_JPEG_QUALITY = 30
+JPEG_QUALITY_STEP = 5  # stop bisecting quality once the bracket is this narrow
+
+# upload encoding: "rgb" (colour JPEG), "gray" (grayscale JPEG) or "binary"
+# (adaptive-threshold black/white PNG, smallest payload for scans of printed text)
+ENCODINGS = ("rgb", "gray", "binary")
+DEFAULT_ENCODING = os.getenv("OCR_ENCODING", "rgb")
+BINARY_THRESHOLD_OFFSET = 10  # a pixel is ink if this much darker than its neighbourhood mean
+BINARY_DARK_LEVEL = 64        # ...or darker than this outright (large solid areas)
+
+# pages whose text layer has at least this many non-whitespace chars skip OCR
+MIN_TEXT_LAYER_CHARS = int(os.getenv("MIN_TEXT_LAYER_CHARS", "50"))
+
+# cheap page classifier (skip_blank): a page without a text layer is rendered as a
+# CLASSIFY_DPI grayscale thumbnail, and it is blank if fewer than BLANK_INK_RATIO
+# of its pixels are BLANK_INK_OFFSET levels darker than the paper (median level)
+CLASSIFY_DPI = 24
+BLANK_INK_OFFSET = 40
+BLANK_INK_RATIO = 0.0005
+
+# concurrent OCR requests per document (Tencent round-trip dominates page time)
+DEFAULT_OCR_WORKERS = int(os.getenv("OCR_WORKERS", "4"))
+
+# OCR backend: "tencent" (default) or "offline" (fixture replay, no network / credentials)
+DEFAULT_OCR_BACKEND = os.getenv("OCR_BACKEND", "tencent")
+
+# image files OCR'd directly (no PDF wrapper); these formats are sent as-is when they fit
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp")
+
+# structured OCR (passport / ID card endpoints) looks at this many leading pages
+STRUCTURED_MAX_PAGES = 2
+
+# stitching: consecutive pages no larger than A5 share one OCR request (up to STITCH_MAX_PAGES)
+STITCH_MAX_PAGE_AREA = 420 * 595  # points^2
+STITCH_MAX_PAGES = int(os.getenv("OCR_STITCH_MAX_PAGES", "6"))
+
+# batch folder mode: PDFs converted in parallel processes, manifest written to the folder root
+DEFAULT_BATCH_JOBS = int(os.getenv("PDF_BATCH_JOBS", str(min(4, os.cpu_count() or 1))))
+MANIFEST_NAME = "pdf_to_markdown_manifest.json"
 
 
 def init_ocr_client():
@@ -64,6 +116,21 @@ def call_ocr_image(client, image_b64: str, use_accurate=True):
     return json.loads(resp.to_json_string())
 
 
+def call_document_ocr(client, image_b64: str, doc_type: str):
+    """
+    Call Tencent structured OCR: MLIDPassportOCR for "passport", IDCardOCR
+    (either side) for "id_card". Returns parsed JSON with typed fields.
+    """
+    if doc_type == "passport":
+        req, method = models.MLIDPassportOCRRequest(), client.MLIDPassportOCR
+    elif doc_type == "id_card":
+        req, method = models.IDCardOCRRequest(), client.IDCardOCR
+    else:
+        raise ValueError(f"不支持的证件类型: {doc_type}（可选: {', '.join(DOC_TYPES)}）")
+    req.from_json_string(json.dumps({"ImageBase64": image_b64}))
+    return json.loads(method(req).to_json_string())
+
+
 def ocr_json_to_markdown(ocr_json):
     """Convert OCR JSON to markdown text (simple line join)."""
     lines = []
@@ -75,108 +142,1139 @@ def ocr_json_to_markdown(ocr_json):
     return "\n".join(lines)
 
 
-def render_page_to_jpeg_bytes(doc, page_number, dpi=DEFAULT_DPI, jpeg_quality=85):
+class OcrBackend:
     """
-    Render single page (0-indexed) to JPEG bytes using PyMuPDF.
-    Will return bytes of JPEG image.
+    OCR engine interface. recognize() takes a base64 image and returns
+    Tencent-shaped JSON ({"TextDetections": [{"DetectedText": ...}, ...]}).
+    recognize_document() is the structured variant for DOC_TYPES and returns the
+    typed fields of Tencent's passport / ID card endpoints.
+    Implementations must be safe to call from several threads at once.
+    """
+    name = "base"
+
+    def recognize(self, image_b64: str, use_accurate=True) -> dict:
+        raise NotImplementedError
+
+    def recognize_document(self, image_b64: str, doc_type: str) -> dict:
+        raise NotImplementedError
+
+
+class TencentOcrBackend(OcrBackend):
+    """Tencent GeneralAccurateOCR / GeneralBasicOCR; one client per backend, created on first use."""
+    name = "tencent"
+
+    def __init__(self, client=None):
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = init_ocr_client()
+        return self._client
+
+    def recognize(self, image_b64: str, use_accurate=True) -> dict:
+        return call_ocr_image(self.client, image_b64, use_accurate=use_accurate)
+
+    def recognize_document(self, image_b64: str, doc_type: str) -> dict:
+        return call_document_ocr(self.client, image_b64, doc_type)
+
+
+class ReplayOcrBackend(OcrBackend):
+    """
+    Offline stand-in: replays recorded OCR JSON from `fixture_dir/<sha256 of image bytes>.json`
+    (`<sha256>.<doc_type>.json` for structured OCR, see RecordingOcrBackend) and
+    answers unknown images with a synthetic one-line result (or synthetic
+    passport / ID card fields), after an optional simulated `latency` in
+    seconds. Lets the whole pipeline run and be load-tested with no network or
+    credentials.
+    """
+    name = "offline"
+
+    def __init__(self, fixture_dir=None, latency=0.0):
+        self.fixture_dir = Path(fixture_dir) if fixture_dir else None
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _replay(self, image_b64, suffix=""):
+        """(digest, recorded fixture or None), after counting the call and the simulated latency."""
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha256(base64.b64decode(image_b64)).hexdigest()
+        if self.fixture_dir is not None:
+            path = self.fixture_dir / f"{digest}{suffix}.json"
+            if path.exists():
+                return digest, json.loads(path.read_text(encoding="utf-8"))
+        return digest, None
+
+    def recognize_document(self, image_b64: str, doc_type: str) -> dict:
+        digest, recorded = self._replay(image_b64, f".{doc_type}")
+        if recorded is not None:
+            return recorded
+        number = str(int(digest[:10], 16))[-8:].zfill(8)
+        if doc_type == "passport":
+            return {"ID": f"E{number}", "Name": "OFFLINE,TEST", "Surname": "OFFLINE", "GivenName": "TEST",
+                    "DateOfBirth": "1990-01-01", "Sex": "M", "DateOfExpiration": "2035-01-01",
+                    "IssuingCountry": "CHN", "Nationality": "CHN", "Type": "P", "RequestId": "offline"}
+        if doc_type == "id_card":
+            return {"Name": "离线测试", "Sex": "男", "Nation": "汉", "Birth": "1990/1/1",
+                    "Address": f"离线测试地址{number}", "IdNum": f"1101011990{number[:8]}",
+                    "Authority": "离线测试公安局", "ValidDate": "2020.01.01-2040.01.01", "RequestId": "offline"}
+        raise ValueError(f"不支持的证件类型: {doc_type}（可选: {', '.join(DOC_TYPES)}）")
+
+    def recognize(self, image_b64: str, use_accurate=True) -> dict:
+        digest, recorded = self._replay(image_b64)
+        if recorded is not None:
+            return recorded
+        return {
+            "TextDetections": [{
+                "DetectedText": f"[offline OCR {digest[:12]}]",
+                "Confidence": 100,
+                "Polygon": [{"X": 0, "Y": 0}, {"X": 100, "Y": 0}, {"X": 100, "Y": 20}, {"X": 0, "Y": 20}],
+            }],
+            "Angle": 0,
+            "RequestId": "offline",
+        }
+
+
+class RecordingOcrBackend(OcrBackend):
+    """Wraps another backend and saves every result as a ReplayOcrBackend fixture."""
+
+    def __init__(self, backend, fixture_dir):
+        self.backend = backend
+        self.name = backend.name
+        self.fixture_dir = Path(fixture_dir)
+        self.fixture_dir.mkdir(parents=True, exist_ok=True)
+
+    def _record(self, image_b64, result, suffix=""):
+        digest = hashlib.sha256(base64.b64decode(image_b64)).hexdigest()
+        path = self.fixture_dir / f"{digest}{suffix}.json"
+        path.write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+        return result
+
+    def recognize(self, image_b64: str, use_accurate=True) -> dict:
+        return self._record(image_b64, self.backend.recognize(image_b64, use_accurate=use_accurate))
+
+    def recognize_document(self, image_b64: str, doc_type: str) -> dict:
+        return self._record(image_b64, self.backend.recognize_document(image_b64, doc_type), f".{doc_type}")
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_ocr_backend(name=None) -> OcrBackend:
+    """
+    Process-wide shared backend by name ("tencent" or "offline"), so the Tencent
+    client is built once per process rather than once per document.
+    The offline backend reads OCR_FIXTURE_DIR and OCR_OFFLINE_LATENCY (seconds).
+    """
+    name = name or DEFAULT_OCR_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            if name == "tencent":
+                _backends[name] = TencentOcrBackend()
+            elif name == "offline":
+                _backends[name] = ReplayOcrBackend(os.getenv("OCR_FIXTURE_DIR"),
+                                                   float(os.getenv("OCR_OFFLINE_LATENCY", "0")))
+            else:
+                raise ValueError(f"未知的 OCR 后端: {name} (可选: tencent, offline)")
+        return _backends[name]
+
+
+_dispatchers = weakref.WeakKeyDictionary()
+
+
+def get_ocr_dispatcher(backend=None, qps=None) -> OcrDispatcher:
+    """
+    The process-wide OcrDispatcher (QPS token bucket, throttle retries, Basic
+    fallback) for `backend` (an OcrBackend, a name, or None for the default).
+    Passing `qps` updates the shared bucket's rate.
+    """
+    if isinstance(backend, OcrDispatcher):
+        dispatcher = backend
+    else:
+        if backend is None or isinstance(backend, str):
+            backend = get_ocr_backend(backend)
+        with _backends_lock:
+            dispatcher = _dispatchers.get(backend)
+            if dispatcher is None:
+                dispatcher = _dispatchers[backend] = OcrDispatcher(backend)
+    if qps is not None:
+        dispatcher.bucket.set_rate(qps)
+    return dispatcher
+
+
+def reset_ocr_backends():
+    """Forget the shared backends and dispatchers (e.g. after credentials change)."""
+    with _backends_lock:
+        _backends.clear()
+        _dispatchers.clear()
+
+
+def extract_text_layer(doc, page_number):
+    """
+    Return the page's embedded text (born-digital PDFs) as markdown lines,
+    or "" if the page has too little text to trust (scans, photos).
+    """
+    page = doc.load_page(page_number)
+    text = page.get_text("text")
+    lines = [line.strip() for line in text.splitlines()]
+    if sum(len(line.replace(" ", "")) for line in lines) < MIN_TEXT_LAYER_CHARS:
+        return ""
+    return "\n".join(line for line in lines if line)
+
+
+def parse_page_ranges(spec: str, page_count: int) -> list:
+    """
+    "1-3,7,10-" -> 0-based page indexes [0, 1, 2, 6, 9, ..., page_count-1], sorted
+    and without duplicates. Numbers are 1-based as printed; "N-" runs to the
+    last page. Pages past `page_count` are dropped; a malformed spec raises ValueError.
+    """
+    pages = set()
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        try:
+            start = int(first)
+            end = (int(last) if last else page_count) if dash else start
+        except ValueError:
+            raise ValueError(f"无法解析页码范围: {part!r}（示例: 1-3,7,10-）") from None
+        if start < 1 or (dash and last and end < start):
+            raise ValueError(f"无效的页码范围: {part!r}")
+        pages.update(range(start - 1, min(end, page_count)))
+    return sorted(pages)
+
+
+def is_blank_page(doc, page_number) -> bool:
+    """
+    Cheap blank-page test: any text layer means not blank; otherwise a tiny
+    grayscale thumbnail is rendered and the pixels clearly darker than its
+    paper counted (scanned blank pages have tinted, noisy paper but no ink).
     """
     page = doc.load_page(page_number)
+    if page.get_text("text").strip():
+        return False
+    mat = fitz.Matrix(CLASSIFY_DPI / 72.0, CLASSIFY_DPI / 72.0)
+    pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+    hist = pixmap_to_image(pix).histogram()
+    total = pix.width * pix.height
+    seen, paper = 0, 255
+    for level, count in enumerate(hist):
+        seen += count
+        if seen * 2 >= total:
+            paper = level
+            break
+    ink = sum(hist[:max(0, paper - BLANK_INK_OFFSET)])
+    return ink < BLANK_INK_RATIO * total
+
+
+def page_has_keywords(doc, page_number, keywords) -> bool:
+    """
+    True if the page's text layer contains any of `keywords` (case-insensitive).
+    Pages without a text layer cannot be judged without OCR and count as matches.
+    """
+    text = doc.load_page(page_number).get_text("text")
+    if not text.strip():
+        return True
+    text = text.lower()
+    return any(k.lower() in text for k in keywords)
+
+
+def select_pages(doc, pages, skip_blank=False, keywords=None) -> list:
+    """
+    First pass over `pages` (0-based indexes) that drops the ones not worth
+    OCR'ing: blank pages (skip_blank) and text-layer pages that mention none
+    of `keywords`. Only pages in `pages` are ever loaded.
+    """
+    kept, blank, unmatched = [], [], []
+    for idx in pages:
+        if skip_blank and is_blank_page(doc, idx):
+            blank.append(idx + 1)
+        elif keywords and not page_has_keywords(doc, idx, keywords):
+            unmatched.append(idx + 1)
+        else:
+            kept.append(idx)
+    if blank or unmatched:
+        print(f"[INFO] 页面筛选: 保留 {len(kept)}/{len(pages)} 页"
+              + (f"，跳过空白页 {blank}" if blank else "")
+              + (f"，跳过不含关键词的页 {unmatched}" if unmatched else ""))
+    return kept
+
+
+def render_page_pixmap(doc, page_number, dpi=DEFAULT_DPI, gray=False):
+    """Render single page (0-indexed) to an RGB (or single-channel grayscale) pixmap at `dpi`."""
+    page = doc.load_page(page_number)
     mat = fitz.Matrix(dpi / 72.0, dpi / 72.0)  # scale
-    pix = page.get_pixmap(matrix=mat, alpha=False)  # RGB
-    img_bytes = pix.tobytes(output="png")  # get PNG bytes first (lossless)
-    # Convert PNG bytes to JPEG (to reduce size) via PIL
-    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    if gray:
+        return page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+    return page.get_pixmap(matrix=mat, alpha=False)  # RGB
+
+
+def pixmap_to_image(pix):
+    """Wrap the pixmap samples in a PIL image without copying (mode L for gray pixmaps)."""
+    mode = "L" if pix.n == 1 else "RGB"
+    return Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+
+
+def pixmap_to_jpeg_bytes(pix, jpeg_quality=DEFAULT_JPEG_QUALITY):
+    """
+    Encode a pixmap to JPEG straight from its sample buffer.
+    PIL wraps the samples without copying; there is no intermediate PNG.
+    """
+    img = pixmap_to_image(pix)
     buf = io.BytesIO()
     img.save(buf, format="JPEG", quality=jpeg_quality)
     return buf.getvalue()
 
 
-def ensure_under_limit(img_bytes: bytes, dpi, page_idx):
+def binarize_image(gray_img, dpi=DEFAULT_DPI):
     """
-    Ensure image base64 <= MAX_B64_BYTES by reducing dpi or quality.
-    Returns (img_bytes, dpi_used) or raises if cannot reduce further.
+    Adaptive threshold: a pixel is ink when it is BINARY_THRESHOLD_OFFSET darker
+    than the mean of its ~0.2 inch neighbourhood, so uneven scan lighting and
+    coloured backgrounds drop out while strokes survive. Returns a mode "1" image.
     """
-    img_b64 = image_bytes_to_b64(img_bytes)
-    b64_size = len(img_b64.encode("utf-8"))
-    if b64_size <= MAX_B64_BYTES:
-        return img_bytes, dpi
+    radius = max(5, dpi // 10)
+    local_mean = gray_img.filter(ImageFilter.BoxBlur(radius))
+    darker = ImageChops.subtract(local_mean, gray_img)
+    ink = ImageChops.lighter(
+        darker.point([255 if v > BINARY_THRESHOLD_OFFSET else 0 for v in range(256)]),
+        gray_img.point([255 if v < BINARY_DARK_LEVEL else 0 for v in range(256)]),
+    )
+    return ImageChops.invert(ink).convert("1", dither=Image.Dither.NONE)
 
-    # Try progressively lowering JPEG quality and DPI
-    quality_list = [85, 70, 60, 50, 35]
-    dpi_now = dpi
-    for q in quality_list:
-        # reduce dpi gradually
-        for d in [dpi_now, max(MIN_DPI, dpi_now // 2), MIN_DPI]:
-            try:
-                # re-render at smaller dpi
-                rendered = render_page_to_jpeg_bytes_cached_bytes(page_doc_bytes=None, page_idx=page_idx, dpi=d, jpeg_quality=q)
-            except Exception:
-                # fallback: can't re-render here; break to next
-                continue
-            b64 = image_bytes_to_b64(rendered)
-            if len(b64.encode("utf-8")) <= MAX_B64_BYTES:
-                return rendered, d
-        dpi_now = max(MIN_DPI, dpi_now // 2)
 
-    raise RuntimeError("单页图像压缩失败，仍超出 7MB 限制。请手动压缩或上传到 COS 并使用 URL 识别。")
+def pixmap_to_binary_png_bytes(pix, dpi=DEFAULT_DPI):
+    """Encode a grayscale pixmap as an adaptive-thresholded 1-bit PNG."""
+    img = pixmap_to_image(pix)
+    if img.mode != "L":
+        img = img.convert("L")
+    buf = io.BytesIO()
+    binarize_image(img, dpi).save(buf, format="PNG")
+    return buf.getvalue()
+
 
+def render_page_to_jpeg_bytes(doc, page_number, dpi=DEFAULT_DPI, jpeg_quality=DEFAULT_JPEG_QUALITY):
+    """
+    Render single page (0-indexed) to JPEG bytes using PyMuPDF.
+    Will return bytes of JPEG image.
+    """
+    pix = render_page_pixmap(doc, page_number, dpi=dpi)
+    return pixmap_to_jpeg_bytes(pix, jpeg_quality=jpeg_quality)
+
+
+def b64_size(n_bytes: int) -> int:
+    """Length of the base64 encoding of `n_bytes` bytes (no need to encode to know)."""
+    return 4 * ((n_bytes + 2) // 3)
+
+
+def format_size_limit(n_bytes: int) -> str:
+    """A byte limit for messages: "7MB" for whole megabytes, otherwise "600 bytes"."""
+    mb, rest = divmod(n_bytes, 1024 * 1024)
+    return f"{mb}MB" if mb and not rest else f"{n_bytes} bytes"
+
+
+def encode_page_under_limit(doc, idx, dpi=DEFAULT_DPI, jpeg_quality=DEFAULT_JPEG_QUALITY,
+                            max_b64_bytes=MAX_B64_BYTES, encoding=DEFAULT_ENCODING, timings=None):
+    """
+    Render page `idx` and encode it so its base64 fits `max_b64_bytes`.
+    `encoding` is one of ENCODINGS; "gray" renders a single-channel pixmap and
+    "binary" thresholds it to a 1-bit PNG (no JPEG quality, so only DPI shrinks).
+
+    The page is rendered once per DPI and JPEG quality is bisected on that
+    pixmap, so the result is the highest quality that fits at the highest DPI
+    that fits. If even MIN_JPEG_QUALITY is too big, the DPI that fits is
+    predicted from the size ratio (JPEG size ~ dpi^k, starting from k=2 for
+    pixel area and refitting k from the sizes observed so far) and the page is
+    re-rendered at that DPI.
+    Returns (img_bytes, dpi_used, quality_used); quality_used is None for "binary".
+    If `timings` is a dict, the time spent rendering and encoding (all attempts
+    included) is added to its "render_ms" / "encode_ms" entries.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"未知的编码模式: {encoding}（可选: {', '.join(ENCODINGS)}）")
+    binary = encoding == "binary"
+    current_dpi = dpi
+    exponent = 2.0
+    prev = None  # (dpi, smallest_size) of the previous render
+    clock = time.perf_counter
+    t_render = t_encode = 0.0
 
-# We'll implement a helper that re-renders using the open doc (so we avoid passing raw bytes).
-# To keep simple, we will re-render using the doc object passed in pdf_to_markdown loop,
-# so the ensure_under_limit above will be simplified in main flow.
+    def done(result):
+        if timings is not None:
+            timings["render_ms"] = timings.get("render_ms", 0.0) + t_render * 1000
+            timings["encode_ms"] = timings.get("encode_ms", 0.0) + t_encode * 1000
+        return result
 
-def pdf_to_markdown(pdf_path: str, dpi=DEFAULT_DPI, use_accurate=True):
-    client = init_ocr_client()
-    doc = fitz.open(pdf_path)
-    n = doc.page_count
+    while True:
+        t0 = clock()
+        pix = render_page_pixmap(doc, idx, dpi=current_dpi, gray=encoding != "rgb")
+        t1 = clock()
+        t_render += t1 - t0
+        if binary:
+            img_bytes = pixmap_to_binary_png_bytes(pix, current_dpi)
+        else:
+            img_bytes = pixmap_to_jpeg_bytes(pix, jpeg_quality)
+        size = b64_size(len(img_bytes))
+        if size <= max_b64_bytes:
+            t_encode += clock() - t1
+            return done((img_bytes, current_dpi, None if binary else jpeg_quality))
+
+        if binary:
+            smallest_size = size
+        else:
+            smallest = pixmap_to_jpeg_bytes(pix, MIN_JPEG_QUALITY)
+            smallest_size = b64_size(len(smallest))
+        if not binary and smallest_size <= max_b64_bytes:
+            # invariant: lo fits, hi does not
+            lo, hi, best = MIN_JPEG_QUALITY, jpeg_quality, smallest
+            while hi - lo > JPEG_QUALITY_STEP:
+                mid = (lo + hi) // 2
+                candidate = pixmap_to_jpeg_bytes(pix, mid)
+                if b64_size(len(candidate)) <= max_b64_bytes:
+                    lo, best = mid, candidate
+                else:
+                    hi = mid
+            t_encode += clock() - t1
+            print(f"  [INFO] 第 {idx+1} 页 base64 {size} bytes > {format_size_limit(max_b64_bytes)}，DPI={current_dpi} 下 quality -> {lo}")
+            return done((best, current_dpi, lo))
+
+        t_encode += clock() - t1
+        if current_dpi <= MIN_DPI:
+            raise RuntimeError(f"第 {idx+1} 页图像经过压缩仍然超过 {format_size_limit(max_b64_bytes)}，无法直接用 ImageBase64 识别。建议上传到 COS 并用 URL 识别或手动压缩页面。")
+        if prev is not None and prev[0] != current_dpi and prev[1] != smallest_size:
+            exponent = math.log(prev[1] / smallest_size) / math.log(prev[0] / current_dpi)
+            exponent = min(2.5, max(1.0, exponent))
+        prev = (current_dpi, smallest_size)
+        # 5% margin so the predicted DPI lands under the limit on the first try
+        scale = (max_b64_bytes / smallest_size) ** (1.0 / exponent) * 0.95
+        next_dpi = max(MIN_DPI, min(current_dpi - 1, int(current_dpi * scale)))
+        print(f"  [INFO] 第 {idx+1} 页 quality={MIN_JPEG_QUALITY} 仍有 {smallest_size} bytes > {format_size_limit(max_b64_bytes)}，预测 DPI -> {next_dpi}")
+        current_dpi = next_dpi
+
+
+def ocr_page_cached(dispatcher, image_b64: str, use_accurate=True, cache=None, cache_key=None):
+    """
+    OCR a rendered page through the dispatcher and store the raw JSON in `cache`.
+    A Basic result standing in for a failed Accurate call is returned but not
+    cached, since the key says Accurate; the next run tries Accurate again.
+    """
+    ocr_json, endpoint = dispatcher.recognize_with_endpoint(image_b64, use_accurate=use_accurate)
+    if cache is not None and cache_key is not None:
+        if use_accurate and endpoint != "accurate":
+            print("  [CACHE] Basic OCR 结果不写入 Accurate 缓存")
+        else:
+            cache.put(cache_key, ocr_json)
+    return ocr_json
+
+
+def is_image_file(path) -> bool:
+    return Path(path).suffix.lower() in IMAGE_SUFFIXES
+
+
+def encode_image_file(image_path, encoding=DEFAULT_ENCODING, max_b64_bytes=MAX_B64_BYTES, timings=None):
+    """
+    Upload bytes for a JPG / PNG / BMP scan. The original file is sent unchanged
+    when it fits the base64 limit and Tencent's pixel limit (and no gray/binary
+    encoding was asked for); otherwise PyMuPDF opens it as a one-page document
+    and it goes through encode_page_under_limit() at its native resolution.
+    Returns (img_bytes, dpi_used, quality_used); dpi/quality are None when unchanged.
+    `timings` is filled as in encode_page_under_limit() (reading the file counts as render).
+    """
+    t0 = time.perf_counter()
+    data = Path(image_path).read_bytes()
+    width, height = Image.open(io.BytesIO(data)).size  # header only
+    if encoding == "rgb" and b64_size(len(data)) <= max_b64_bytes and max(width, height) <= MAX_CANVAS_SIDE:
+        if timings is not None:
+            timings["render_ms"] = timings.get("render_ms", 0.0) + (time.perf_counter() - t0) * 1000
+        return data, None, None
+
+    doc = fitz.open(image_path)
+    try:
+        native_dpi = width * 72.0 / doc.load_page(0).rect.width
+        dpi = int(native_dpi * min(1.0, MAX_CANVAS_SIDE / max(width, height)))
+        print(f"  [INFO] {Path(image_path).name} 需要重新编码 ({width}x{height}, {len(data)} bytes)")
+        return encode_page_under_limit(doc, 0, dpi=dpi, max_b64_bytes=max_b64_bytes, encoding=encoding,
+                                       timings=timings)
+    finally:
+        doc.close()
+
+
+def stitch_height(doc, idx, dpi):
+    """Pixel height of page `idx` at `dpi` if it is small enough to stitch, else None."""
+    rect = doc.load_page(idx).rect
+    if rect.width * rect.height > STITCH_MAX_PAGE_AREA:
+        return None
+    return int(math.ceil(rect.height * dpi / 72.0))
+
+
+def encode_stitched(page_bytes, encoding=DEFAULT_ENCODING, qualities=None):
+    """
+    Decode already-encoded page images, stack them on one canvas and encode it
+    in the same format. Returns (canvas_bytes, regions); see ocr_stitch.
+    `qualities` are the JPEG qualities the pages were encoded at (see
+    encode_page_under_limit()); the canvas is encoded at the highest of them so
+    the second pass loses no more than the pages already did.
+    """
+    images = [Image.open(io.BytesIO(b)) for b in page_bytes]
+    canvas, regions = stitch_images(images)
+    buf = io.BytesIO()
+    if encoding == "binary":
+        canvas.convert("1", dither=Image.Dither.NONE).save(buf, format="PNG")
+    else:
+        jpeg_quality = max((q for q in qualities or () if q is not None), default=DEFAULT_JPEG_QUALITY)
+        canvas.save(buf, format="JPEG", quality=jpeg_quality)
+    return buf.getvalue(), regions
+
+
+def ocr_pages_stitched(dispatcher, page_bytes, use_accurate=True, cache=None, cache_keys=None,
+                       encoding=DEFAULT_ENCODING, qualities=None):
+    """
+    OCR several small pages with one request on a stitched canvas and split the
+    detections back to their pages. If the canvas turns out too large, each page
+    is sent on its own instead. Every page result is cached under its own key,
+    so later runs hit the cache whether or not they stitch (Basic fallback
+    results are not cached, see ocr_page_cached()).
+    `qualities` are the pages' JPEG qualities, passed on to encode_stitched().
+    Returns one OCR JSON per page.
+    """
+    canvas_bytes, regions = encode_stitched(page_bytes, encoding, qualities=qualities)
+    canvas_w = max(w for _, _, w, _ in regions)
+    canvas_h = regions[-1][1] + regions[-1][3]
+    if b64_size(len(canvas_bytes)) <= MAX_B64_BYTES and max(canvas_w, canvas_h) <= MAX_CANVAS_SIDE:
+        stitched, endpoint = dispatcher.recognize_with_endpoint(image_bytes_to_b64(canvas_bytes),
+                                                                use_accurate=use_accurate)
+        results = split_detections(stitched, regions)
+        endpoints = [endpoint] * len(results)
+    else:
+        print(f"  [WARN] 拼接图 {canvas_w}x{canvas_h} 超出限制，改为逐页 OCR")
+        answers = [dispatcher.recognize_with_endpoint(image_bytes_to_b64(b), use_accurate=use_accurate)
+                   for b in page_bytes]
+        results = [ocr_json for ocr_json, _ in answers]
+        endpoints = [endpoint for _, endpoint in answers]
+    if cache is not None:
+        for key, ocr_json, endpoint in zip(cache_keys or [], results, endpoints):
+            if key is not None and (endpoint == "accurate" or not use_accurate):
+                cache.put(key, ocr_json)
+    return results
+
+
+def iter_page_records(pdf_path: str, dpi=DEFAULT_DPI, use_accurate=True,
+                      max_workers=DEFAULT_OCR_WORKERS, executor=None, cache=None,
+                      use_text_layer=True, start_page=0, backend=None, encoding=DEFAULT_ENCODING,
+                      stitch=False, pages=None, skip_blank=False, page_keywords=None):
+    """
+    Yield one record per page, in page order, as soon as that page is done:
+    {"page": idx (0-based), "markdown": "<!-- Page N -->\\n\\n<text>", "text": "<text>",
+     "source": "text"|"cache"|"ocr", "ocr": raw OCR JSON (None for text-layer pages),
+     "timings": {"render_ms", "encode_ms", "image_bytes"} ({} for text-layer pages)}.
+
+    Pages are rendered sequentially (a fitz document is not thread-safe) and the
+    OCR calls run on a bounded thread pool. At most 2x `max_workers` pages are
+    held at once (rendered or finished but waiting for an earlier page), so
+    memory stays flat however long the document is.
+    Pages before `start_page` are skipped (used to resume a partial run).
+    `pages` limits the run to a page-range spec ("1-3,7", see parse_page_ranges())
+    or a list of 0-based indexes; `skip_blank` / `page_keywords` then drop
+    blank pages and text-layer pages without any keyword (see select_pages()).
+    Pages that are not selected are never loaded or rendered.
+    `encoding` selects the upload image format (see encode_page_under_limit()).
+    With `stitch`, runs of consecutive small pages (ID cards, passport photo
+    pages) are sent as one stitched image and split back per page.
+    `backend` is an OcrBackend, a backend name or an OcrDispatcher (default: the
+    shared DEFAULT_OCR_BACKEND). Requests go through the backend's shared
+    dispatcher, so QPS limits hold across threads and documents in this process.
+    An image file (IMAGE_SUFFIXES) is a single page and skips rendering (see
+    encode_image_file()).
+    """
+    dispatcher = get_ocr_dispatcher(backend)
+    image_input = is_image_file(pdf_path)
+    doc = None if image_input else fitz.open(pdf_path)
+    n = 1 if image_input else doc.page_count
+    if image_input:
+        order = [0]
+    elif isinstance(pages, str):
+        order = parse_page_ranges(pages, n)
+    else:
+        order = sorted({i for i in (range(n) if pages is None else pages) if 0 <= i < n})
+    order = [i for i in order if i >= start_page]  # page indexes to process, ascending
+    if doc is not None and (skip_blank or page_keywords):
+        order = select_pages(doc, order, skip_blank=skip_blank, keywords=page_keywords)
+    max_workers = max(1, int(max_workers))
+    window = max_workers * 2
+
+    own_pool = executor is None
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr") if own_pool else executor
+    pending = {}  # future -> list of page indexes (more than one for a stitched request)
+    ready = {}  # finished pages waiting for an earlier page
+    batch = []  # small pages waiting to be stitched: (idx, img_bytes, cache_key, height, quality)
+    page_timings = {}  # render / encode cost of pages still in flight
+    pos = 0  # next position in `order` to yield
+
+    def record(idx, md, source, ocr_json=None):
+        return {"page": idx, "markdown": f"<!-- Page {idx+1} -->\n\n{md}", "text": md,
+                "source": source, "ocr": ocr_json, "timings": page_timings.pop(idx, {})}
+
+    def collect(return_when):
+        done, _ = wait(pending, return_when=return_when)
+        for fut in done:
+            idxs = pending.pop(fut)
+            results = fut.result() if len(idxs) > 1 else [fut.result()]
+            for idx, ocr_json in zip(idxs, results):
+                ready[idx] = record(idx, ocr_json_to_markdown(ocr_json), "ocr", ocr_json)
+
+    def submit(idx, img_bytes, cache_key):
+        fut = pool.submit(ocr_page_cached, dispatcher, image_bytes_to_b64(img_bytes),
+                          use_accurate=use_accurate, cache=cache, cache_key=cache_key)
+        pending[fut] = [idx]
+
+    def flush_batch():
+        if len(batch) == 1:
+            submit(*batch[0][:3])
+        elif batch:
+            idxs = [b[0] for b in batch]
+            print(f"[OCR] 第 {idxs[0]+1}-{idxs[-1]+1} 页拼接为一次 OCR 请求")
+            fut = pool.submit(ocr_pages_stitched, dispatcher, [b[1] for b in batch],
+                              use_accurate=use_accurate, cache=cache,
+                              cache_keys=[b[2] for b in batch], encoding=encoding,
+                              qualities=[b[4] for b in batch])
+            pending[fut] = idxs
+        batch.clear()
+
+    try:
+        for idx in order:
+            if use_text_layer and doc is not None:
+                text = extract_text_layer(doc, idx)
+                if text:
+                    print(f"[TEXT] 第 {idx+1}/{n} 页使用 PDF 文本层，跳过 OCR")
+                    ready[idx] = record(idx, text, "text")
+            if idx not in ready:
+                timings = page_timings[idx] = {"render_ms": 0.0, "encode_ms": 0.0}
+                if image_input:
+                    print(f"[OCR] 处理图片 {pdf_path} …")
+                    img_bytes, used_dpi, used_quality = encode_image_file(pdf_path, encoding=encoding,
+                                                                          timings=timings)
+                else:
+                    print(f"[OCR] 渲染并处理第 {idx+1}/{n} 页 (初始 DPI={dpi}) …")
+                    img_bytes, used_dpi, used_quality = encode_page_under_limit(doc, idx, dpi=dpi,
+                                                                                encoding=encoding,
+                                                                                timings=timings)
+                timings["image_bytes"] = len(img_bytes)
+                cache_key = None
+                cached = None
+                if cache is not None:
+                    cache_key = make_cache_key(img_bytes, use_accurate, used_dpi, used_quality,
+                                               backend=dispatcher.name, encoding=encoding)
+                    cached = cache.get(cache_key)
+                if cached is not None:
+                    print(f"  [CACHE] 第 {idx+1} 页命中 OCR 缓存")
+                    ready[idx] = record(idx, ocr_json_to_markdown(cached), "cache", cached)
+                else:
+                    height = stitch_height(doc, idx, used_dpi) if stitch and doc is not None else None
+                    if height is None:
+                        submit(idx, img_bytes, cache_key)
+                    else:
+                        if batch and (len(batch) >= STITCH_MAX_PAGES
+                                      or sum(b[3] + STITCH_GAP for b in batch) + height > MAX_CANVAS_SIDE
+                                      or b64_size(sum(len(b[1]) for b in batch) + len(img_bytes))
+                                      > MAX_B64_BYTES * 0.8):
+                            flush_batch()
+                        batch.append((idx, img_bytes, cache_key, height, used_quality))
+            # a batch only holds a run of consecutive pages, so later pages never wait on it
+            if batch and batch[-1][0] != idx:
+                flush_batch()
+
+            while pos < len(order) and order[pos] in ready:
+                yield ready.pop(order[pos])
+                pos += 1
+            # ready pages only pile up behind a pending one, so waiting always makes progress
+            while pending and len(pending) + len(ready) >= window:
+                collect(FIRST_COMPLETED)
+                while pos < len(order) and order[pos] in ready:
+                    yield ready.pop(order[pos])
+                    pos += 1
+
+        flush_batch()
+        while pending:
+            collect(FIRST_COMPLETED)
+            while pos < len(order) and order[pos] in ready:
+                yield ready.pop(order[pos])
+                pos += 1
+    finally:
+        if own_pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if doc is not None:
+            doc.close()
+
+
+def iter_pdf_markdown(pdf_path: str, start_page=0, **kwargs):
+    """
+    Streaming variant of pdf_to_markdown(): yields (page_index, markdown) in page
+    order as pages complete. `markdown` includes the "<!-- Page N -->" marker, so
+    "\\n\\n".join() of the yielded blocks equals pdf_to_markdown()'s result.
+    """
+    for rec in iter_page_records(pdf_path, start_page=start_page, **kwargs):
+        yield rec["page"], rec["markdown"]
+
+
+def pdf_to_markdown(pdf_path: str, dpi=DEFAULT_DPI, use_accurate=True,
+                    max_workers=DEFAULT_OCR_WORKERS, executor=None, cache=None,
+                    use_text_layer=True, report=None, backend=None, encoding=DEFAULT_ENCODING,
+                    stitch=False, pages=None, skip_blank=False, page_keywords=None):
+    """
+    Convert a PDF to markdown, OCR'ing up to `max_workers` pages concurrently.
+
+    Pass a shared `executor` to bound OCR concurrency across several PDFs.
+    With an `OcrCache`, pages whose rendered bytes were seen before skip the
+    network entirely; the OCR client is only created on the first cache miss.
+    `backend` selects the OCR engine (see get_ocr_backend()) and `encoding` the
+    uploaded image format: "rgb", "gray" or "binary" (see encode_page_under_limit()).
+    `stitch` packs consecutive small pages into one OCR request.
+    `pages` ("1-3,7"), `skip_blank` and `page_keywords` restrict which pages are
+    converted (see iter_page_records()); page markers keep the original numbers.
+    Pages with a usable text layer are read directly and never rendered.
+    `pdf_path` may also be a JPG / PNG / BMP scan, OCR'd as a single page.
+    If `report` is a dict, report["pages"] records the source of every page
+    ("text", "cache" or "ocr").
+    See iter_pdf_markdown() for the streaming variant.
+    """
     md_pages = []
+    page_sources = []
+    for rec in iter_page_records(pdf_path, dpi=dpi, use_accurate=use_accurate,
+                                 max_workers=max_workers, executor=executor, cache=cache,
+                                 use_text_layer=use_text_layer, backend=backend, encoding=encoding,
+                                 stitch=stitch, pages=pages, skip_blank=skip_blank,
+                                 page_keywords=page_keywords):
+        md_pages.append(rec["markdown"])
+        page_sources.append({"page": rec["page"] + 1, "source": rec["source"]})
+
+    if report is not None:
+        report["pages"] = page_sources
+    return "\n\n".join(md_pages)
 
-    for idx in range(n):
-        print(f"[OCR] 渲染并处理第 {idx+1}/{n} 页 (初始 DPI={dpi}) …")
-        # try rendering & encoding
-        current_dpi = dpi
-        current_quality = 85
-        # render JPEG bytes
-        img_bytes = render_page_to_jpeg_bytes(doc, idx, dpi=current_dpi, jpeg_quality=current_quality)
-        b64 = image_bytes_to_b64(img_bytes)
-        b64_size = len(b64.encode("utf-8"))
-        # if too large, progressively reduce quality and dpi
-        while b64_size > MAX_B64_BYTES and current_dpi > MIN_DPI:
-            # reduce dpi
-            current_dpi = max(MIN_DPI, current_dpi // 2)
-            current_quality = max(30, current_quality - 20)
-            print(f"  [INFO] 第 {idx+1} 页 base64 {b64_size} bytes > 7MB，降 DPI -> {current_dpi}, quality -> {current_quality}")
-            img_bytes = render_page_to_jpeg_bytes(doc, idx, dpi=current_dpi, jpeg_quality=current_quality)
-            b64 = image_bytes_to_b64(img_bytes)
-            b64_size = len(b64.encode("utf-8"))
-
-        if b64_size > MAX_B64_BYTES:
-            raise RuntimeError(f"第 {idx+1} 页图像经过压缩仍然超过 7MB，无法直接用 ImageBase64 识别。建议上传到 COS 并用 URL 识别或手动压缩页面。")
-
-        # call OCR
+
+def extract_document_fields(source_path: str, doc_type: str, backend=None, cache=None,
+                            dpi=DEFAULT_DPI, max_pages=STRUCTURED_MAX_PAGES):
+    """
+    Read a passport / ID card with the structured OCR endpoint for `doc_type`
+    and map the result onto the visa extraction schema (see doc_fields).
+    The first `max_pages` pages are tried (ID cards often have the front and
+    back on separate pages) and their fields merged; a page the endpoint
+    rejects is skipped. Returns the fields dict, or None if no page was read.
+    """
+    dispatcher = get_ocr_dispatcher(backend)
+    mapper = MAPPERS[doc_type]
+    fields, used_pages = {}, []
+    doc = None if is_image_file(source_path) else fitz.open(source_path)
+    try:
+        n = 1 if doc is None else min(max_pages, doc.page_count)
+        for idx in range(n):
+            if doc is None:
+                img_bytes, used_dpi, used_quality = encode_image_file(source_path, encoding="rgb")
+            else:
+                img_bytes, used_dpi, used_quality = encode_page_under_limit(doc, idx, dpi=dpi, encoding="rgb")
+            cache_key = None
+            resp = None
+            if cache is not None:
+                cache_key = make_cache_key(img_bytes, True, used_dpi, used_quality,
+                                           backend=dispatcher.name, doc_type=doc_type)
+                resp = cache.get(cache_key)
+            if resp is None:
+                try:
+                    resp = dispatcher.recognize_document(image_bytes_to_b64(img_bytes), doc_type)
+                except Exception as e:
+                    print(f"  [WARN] 第 {idx+1} 页 {doc_type} 结构化识别失败: {e}")
+                    continue
+                if cache_key is not None:
+                    cache.put(cache_key, resp)
+            fields = merge_fields(fields, mapper(resp))
+            used_pages.append(idx + 1)
+            if doc_type == "passport" and fields.get("Passport Information", {}).get("passport_number"):
+                break  # the data page has been read
+    finally:
+        if doc is not None:
+            doc.close()
+    if not used_pages:
+        return None
+    fields["_source"] = {"doc_type": doc_type, "backend": dispatcher.name, "pages": used_pages}
+    return fields
+
+
+def convert_document_fields(source_path: str, doc_type="auto", output_json=None, **kwargs):
+    """
+    Route passports / ID cards to structured OCR and write `<source>.fields.json`,
+    which llm_analysis uses instead of calling the LLM. With doc_type="auto" only
+    the file name decides (FILENAME_HINTS): text keywords such as "PASSPORT"
+    also appear in cover letters, and every routed file costs extra structured
+    OCR calls. `kwargs` go to extract_document_fields().
+    Returns the JSON path, or None when the document is not routed or unreadable.
+    """
+    if doc_type == "auto":
+        doc_type = detect_doc_type(source_path)
+    if doc_type not in DOC_TYPES:
+        return None
+    print(f"[OCR] {source_path} 识别为 {doc_type}，调用结构化 OCR")
+    fields = extract_document_fields(source_path, doc_type, **kwargs)
+    if fields is None:
+        print(f"[WARN] {source_path} 结构化 OCR 未得到结果，仍需 LLM 提取")
+        return None
+    output_json = output_json or fields_path_for(source_path)
+    tmp = output_json + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(fields, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, output_json)
+    return output_json
+
+
+def sidecar_path_for(output_md: str) -> str:
+    """`files/x.pdf.md` -> `files/x.pdf.ocr.jsonl.gz`"""
+    base = output_md[:-3] if output_md.endswith(".md") else output_md
+    return base + ".ocr.jsonl.gz"
+
+
+def sidecar_line(rec) -> bytes:
+    """One page of the raw OCR sidecar as a self-contained gzip member (so appends stay valid)."""
+    line = {"page": rec["page"] + 1, "source": rec["source"]}
+    if rec.get("ocr") is not None:
+        line["ocr"] = rec["ocr"]
+    else:
+        line["text"] = rec.get("text", "")
+    data = json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n"
+    return gzip.compress(data.encode("utf-8"))
+
+
+def read_sidecar(sidecar_path: str) -> list:
+    """Read a sidecar; returns its page lines in page order (a re-done page's last copy wins)."""
+    pages = {}
+    with gzip.open(sidecar_path, "rt", encoding="utf-8") as f:
+        for raw in f:
+            if raw.strip():
+                line = json.loads(raw)
+                pages[line["page"]] = line
+    return [pages[p] for p in sorted(pages)]
+
+
+def rerender_markdown_from_sidecar(sidecar_path: str, renderer=ocr_json_to_markdown) -> str:
+    """
+    Rebuild the markdown from a raw OCR sidecar without any OCR call.
+    `renderer(ocr_json) -> str` lets a different layout be produced from the same OCR.
+    """
+    blocks = []
+    for line in read_sidecar(sidecar_path):
+        md = renderer(line["ocr"]) if "ocr" in line else line.get("text", "")
+        blocks.append(f"<!-- Page {line['page']} -->\n\n{md}")
+    return "\n\n".join(blocks)
+
+
+def convert_pdf_file(pdf_path: str, output_md=None, resume=True, report=None, sidecar=True,
+                     doc_type=None, **kwargs):
+    """
+    Convert `pdf_path` to `output_md` (default `<pdf>.md`), appending each page to
+    the file as soon as it is finished.
+
+    Pages go to `<output>.part`; `<output>.progress.json` records how many pages
+    and bytes are safely on disk. If the process dies, the next call with
+    `resume=True` truncates the .part file to the last finished page and carries
+    on from there (provided the PDF itself is unchanged). On success the .part
+    file is renamed to `output_md`. With `sidecar`, the raw OCR JSON of every
+    page is kept next to it (see sidecar_path_for()) so the markdown can be
+    re-rendered later without paying for OCR again.
+    `doc_type` ("auto", "passport" or "id_card") also writes structured-OCR
+    fields for passports / ID cards (see convert_document_fields()).
+    `kwargs` are passed to iter_page_records(); a partial output made with a
+    different page selection (pages / skip_blank / page_keywords) is not resumed.
+    Returns the number of pages resumed from (0 for a fresh run).
+    """
+    output_md = output_md or pdf_path + ".md"
+    part_path = Path(output_md + ".part")
+    progress_path = Path(output_md + ".progress.json")
+    sidecar_final = Path(sidecar_path_for(output_md))
+    sidecar_part = Path(str(sidecar_final) + ".part")
+    source_sha = file_sha256(pdf_path)
+    pages = kwargs.get("pages")
+    selection = {"pages": pages if pages is None or isinstance(pages, str) else sorted(pages),
+                 "skip_blank": bool(kwargs.get("skip_blank")),
+                 "page_keywords": list(kwargs.get("page_keywords") or [])}
+
+    start_page, offset, sidecar_offset = 0, 0, 0
+    if resume and part_path.exists() and progress_path.exists():
+        try:
+            progress = json.loads(progress_path.read_text(encoding="utf-8"))
+            sidecar_ok = not sidecar or (sidecar_part.exists()
+                                         and sidecar_part.stat().st_size >= progress["sidecar_bytes"])
+            if (progress.get("sha256") == source_sha and sidecar_ok
+                    and progress.get("selection", selection) == selection
+                    and part_path.stat().st_size >= progress["bytes"]):
+                start_page, offset = progress["pages_done"], progress["bytes"]
+                sidecar_offset = progress.get("sidecar_bytes", 0)
+        except (ValueError, KeyError):
+            pass
+    if start_page:
+        print(f"[RESUME] {pdf_path}: 已完成 {start_page} 页，从第 {start_page+1} 页继续")
+
+    page_sources = []
+    side = None
+    with open(part_path, "r+b" if start_page else "wb") as out:
+        out.truncate(offset)
+        out.seek(offset)
+        if sidecar:
+            side = open(sidecar_part, "r+b" if start_page else "wb")
+            side.truncate(sidecar_offset)
+            side.seek(sidecar_offset)
         try:
-            ocr_json = call_ocr_image(client, b64, use_accurate=use_accurate)
-        except Exception as e:
-            # If accurate fails, try basic
-            print(f"  [WARN] 第 {idx+1} 页使用 Accurate OCR 失败，尝试 Basic OCR: {e}")
-            ocr_json = call_ocr_image(client, b64, use_accurate=False)
+            for rec in iter_page_records(pdf_path, start_page=start_page, **kwargs):
+                block = rec["markdown"].encode("utf-8")
+                out.write(block if out.tell() == 0 else b"\n\n" + block)
+                out.flush()
+                os.fsync(out.fileno())
+                progress = {"sha256": source_sha, "pages_done": rec["page"] + 1, "bytes": out.tell(),
+                            "selection": selection}
+                if side is not None:
+                    side.write(sidecar_line(rec))
+                    side.flush()
+                    os.fsync(side.fileno())
+                    progress["sidecar_bytes"] = side.tell()
+                page_sources.append({"page": rec["page"] + 1, "source": rec["source"]})
+                tmp = progress_path.with_suffix(".tmp")
+                tmp.write_text(json.dumps(progress), encoding="utf-8")
+                os.replace(tmp, progress_path)
+        finally:
+            if side is not None:
+                side.close()
 
-        md = ocr_json_to_markdown(ocr_json)
-        md_pages.append(f"<!-- Page {idx+1} -->\n\n{md}")
+    os.replace(part_path, output_md)
+    if side is not None:
+        os.replace(sidecar_part, sidecar_final)
+    progress_path.unlink(missing_ok=True)
+    if report is not None:
+        report["pages"] = page_sources
 
-    return "\n\n".join(md_pages)
+    if doc_type:
+        fields_json = convert_document_fields(pdf_path, doc_type, backend=kwargs.get("backend"),
+                                              cache=kwargs.get("cache"), dpi=kwargs.get("dpi", DEFAULT_DPI))
+        if report is not None and fields_json:
+            report["fields"] = fields_json
+    return start_page
+
+
+def file_sha256(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _convert_batch_file(pdf_path, sha256, cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES,
+                        ocr_qps=None, **convert_kwargs):
+    """Convert one PDF inside a batch worker; never raises, returns its manifest entry."""
+    start = time.perf_counter()
+    entry = {"sha256": sha256, "output": pdf_path + ".md"}
+    try:
+        if ocr_qps is not None:
+            get_ocr_dispatcher(convert_kwargs.get("backend"), qps=ocr_qps)
+        cache = OcrCache(cache_dir, cache_max_bytes) if cache_dir else None
+        report = {}
+        resumed = convert_pdf_file(pdf_path, entry["output"], cache=cache, report=report, **convert_kwargs)
+        if resumed:
+            entry["resumed_from_page"] = resumed + 1
+        sources = [p["source"] for p in report.get("pages", [])]
+        entry.update(status="converted", pages=len(sources),
+                     page_sources={src: sources.count(src) for src in sorted(set(sources))})
+        if report.get("fields"):
+            entry["fields"] = report["fields"]
+    except Exception as e:
+        entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def convert_folder(root, jobs=DEFAULT_BATCH_JOBS, force=False, manifest_path=None,
+                   cache_dir=None, cache_max_bytes=DEFAULT_CACHE_MAX_BYTES, ocr_qps=DEFAULT_OCR_QPS,
+                   **convert_kwargs):
+    """
+    Convert every PDF (and image scan, see IMAGE_SUFFIXES) under `root`
+    (recursively) to `<name>.pdf.md` / `<name>.jpg.md` across a process pool.
+
+    A PDF is skipped when its .pdf.md is newer than the source, or when its
+    content hash matches the one recorded in the previous manifest. The manifest
+    (MANIFEST_NAME in `root` by default) records status, sha256, page count and
+    timing for every file. `ocr_qps` is the total OCR request rate, split evenly
+    across the worker processes. `convert_kwargs` are passed on to iter_page_records().
+    Returns the manifest dict.
+    """
+    root = Path(root)
+    manifest_path = Path(manifest_path) if manifest_path else root / MANIFEST_NAME
+    previous = {}
+    if manifest_path.exists():
+        try:
+            previous = json.loads(manifest_path.read_text(encoding="utf-8")).get("files", {})
+        except ValueError:
+            print(f"[WARN] 无法读取旧的 manifest，将全部重新比对: {manifest_path}")
+
+    entries = {}
+    todo = []
+    for pdf in sorted(p for p in root.rglob("*")
+                      if p.is_file() and (p.suffix.lower() == ".pdf" or is_image_file(p))):
+        rel = pdf.relative_to(root).as_posix()
+        md = Path(str(pdf) + ".md")
+        old = previous.get(rel, {})
+        if not force and md.exists():
+            if md.stat().st_mtime >= pdf.stat().st_mtime:
+                entries[rel] = dict(old, status="skipped", reason="output newer than source", seconds=0.0)
+                entries[rel].setdefault("sha256", file_sha256(pdf))
+                continue
+            sha = file_sha256(pdf)
+            if old.get("sha256") == sha and old.get("status") in ("converted", "skipped"):
+                entries[rel] = dict(old, status="skipped", reason="content hash unchanged", seconds=0.0)
+                continue
+        else:
+            sha = file_sha256(pdf)
+        todo.append((rel, str(pdf), sha))
+
+    print(f"[BATCH] {root}: 共 {len(entries) + len(todo)} 个文件，需转换 {len(todo)} 个，跳过 {len(entries)} 个")
+    start = time.perf_counter()
+    kwargs = dict(convert_kwargs, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes)
+    if jobs <= 1 or len(todo) <= 1:
+        kwargs["ocr_qps"] = ocr_qps
+        for rel, pdf, sha in todo:
+            entries[rel] = _convert_batch_file(pdf, sha, **kwargs)
+    else:
+        kwargs["ocr_qps"] = ocr_qps / jobs
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {pool.submit(_convert_batch_file, pdf, sha, **kwargs): rel for rel, pdf, sha in todo}
+            for fut in futures:
+                entries[futures[fut]] = fut.result()
+
+    for rel, entry in entries.items():
+        if entry["status"] == "failed":
+            print(f"  [ERROR] {rel}: {entry['error']}")
+
+    manifest = {
+        "root": str(root),
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "total_seconds": round(time.perf_counter() - start, 3),
+        "counts": {status: sum(1 for e in entries.values() if e["status"] == status)
+                   for status in ("converted", "skipped", "failed")},
+        "files": {rel: entries[rel] for rel in sorted(entries)},
+    }
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"[BATCH] 完成 {manifest['counts']}，manifest → {manifest_path}")
+    return manifest
 
 
 if __name__ == "__main__":
-    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="PDF -> Markdown (PyMuPDF + 腾讯云 OCR)")
+    parser.add_argument("pdf_files", nargs="+",
+                        help="PDF 或图片 (jpg/png/bmp) 文件，或目录，例如 files/cover_letter.pdf、scans/passport.jpg；目录会递归批量转换")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI, help=f"渲染 DPI (默认 {DEFAULT_DPI})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_OCR_WORKERS,
+                        help=f"并发 OCR 请求数 (默认 {DEFAULT_OCR_WORKERS}，环境变量 OCR_WORKERS)")
+    parser.add_argument("--force-ocr", action="store_true",
+                        help="忽略 PDF 文本层，所有页面都渲染后 OCR")
+    parser.add_argument("--no-cache", action="store_true", help="不使用 OCR 结果缓存")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"OCR 缓存目录 (默认 {DEFAULT_CACHE_DIR}，环境变量 OCR_CACHE_DIR)")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="OCR 缓存容量上限 (MB)，超出后按 LRU 淘汰")
+    parser.add_argument("--restart", action="store_true",
+                        help="不从上次中断的页继续，重新转换整个文件")
+    parser.add_argument("--ocr-backend", choices=["tencent", "offline"], default=DEFAULT_OCR_BACKEND,
+                        help="OCR 后端: tencent (默认，环境变量 OCR_BACKEND) 或 offline (离线回放，无需网络/凭证)")
+    parser.add_argument("--fixture-dir", default=None,
+                        help="offline 后端回放的 OCR JSON 目录 (环境变量 OCR_FIXTURE_DIR)")
+    parser.add_argument("--qps", type=float, default=DEFAULT_OCR_QPS,
+                        help=f"OCR 请求速率上限 (次/秒，默认 {DEFAULT_OCR_QPS:g}，环境变量 OCR_QPS；0 表示不限)")
+    parser.add_argument("--hedge", choices=HEDGE_MODES, default=DEFAULT_HEDGE,
+                        help="Accurate OCR 超过延迟分位数仍未返回时，再发一个对冲请求 (basic 或 accurate)，"
+                             "取先到的结果 (环境变量 OCR_HEDGE，默认关闭)")
+    parser.add_argument("--hedge-percentile", type=float, default=DEFAULT_HEDGE_PERCENTILE,
+                        help=f"触发对冲的延迟分位数 (默认 p{DEFAULT_HEDGE_PERCENTILE:g}，环境变量 OCR_HEDGE_PERCENTILE)")
+    parser.add_argument("--encoding", choices=ENCODINGS, default=DEFAULT_ENCODING,
+                        help="上传图片格式: rgb 彩色 JPEG / gray 灰度 JPEG / binary 自适应二值化 PNG "
+                             "(默认 rgb，扫描件用 gray/binary 可大幅减少上传量)")
+    parser.add_argument("--stitch", action="store_true",
+                        help="把连续的小页面（≤A5，如身份证正反面）拼成一张图，一次 OCR 请求识别多页")
+    parser.add_argument("--doc-type", choices=("auto",) + DOC_TYPES + ("none",), default="auto",
+                        help="护照 / 身份证走腾讯结构化 OCR，另存 <文件>.fields.json，llm_analysis 对其跳过 LLM；"
+                             "auto 只按文件名判断 (默认，如 passport / 身份证)，none 关闭")
+    parser.add_argument("--pages", default=None,
+                        help="只转换指定页，例如 1-3,7 或 10- (页码从 1 开始，对每个输入文件生效)")
+    parser.add_argument("--skip-blank", action="store_true",
+                        help="先用低分辨率缩略图快速判断，跳过空白页")
+    parser.add_argument("--page-keywords", default=None,
+                        help="逗号分隔的关键词，只保留文本层包含任一关键词的页 (无文本层的扫描页始终保留)，"
+                             "例如 余额,Balance")
+    parser.add_argument("--no-sidecar", action="store_true",
+                        help="不保存原始 OCR JSON (<文件>.pdf.ocr.jsonl.gz)")
+    parser.add_argument("--rerender", action="store_true",
+                        help="参数为 .ocr.jsonl.gz 文件：直接从原始 OCR JSON 重新生成 Markdown，不调用 OCR")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_BATCH_JOBS,
+                        help=f"目录批量模式的并行进程数 (默认 {DEFAULT_BATCH_JOBS}，环境变量 PDF_BATCH_JOBS)")
+    parser.add_argument("--force", action="store_true", help="目录批量模式下忽略增量判断，全部重新转换")
+    parser.add_argument("--manifest", default=None, help=f"批量模式 manifest 路径 (默认 <目录>/{MANIFEST_NAME})")
+    args = parser.parse_args()
+    if args.pages:
+        try:
+            parse_page_ranges(args.pages, 0)
+        except ValueError as e:
+            parser.error(str(e))
+    page_keywords = [k.strip() for k in args.page_keywords.split(",") if k.strip()] if args.page_keywords else None
+
+    if args.rerender:
+        for sidecar_file in args.pdf_files:
+            output_md = sidecar_file[:-len(".ocr.jsonl.gz")] + ".md" if sidecar_file.endswith(".ocr.jsonl.gz") \
+                else sidecar_file + ".md"
+            Path(output_md).write_text(rerender_markdown_from_sidecar(sidecar_file), encoding="utf-8")
+            print(f"重新生成完成 → {output_md}")
+        raise SystemExit(0)
+
+    cache_max_bytes = args.cache_max_mb * 1024 * 1024
+    ocr_cache = None if args.no_cache else OcrCache(args.cache_dir, cache_max_bytes)
+    if args.fixture_dir:
+        # environment so that batch worker processes build the same backend
+        os.environ["OCR_FIXTURE_DIR"] = args.fixture_dir
+    if args.hedge:
+        os.environ["OCR_HEDGE"] = args.hedge
+        os.environ["OCR_HEDGE_PERCENTILE"] = str(args.hedge_percentile)
+    convert_kwargs = dict(dpi=args.dpi, max_workers=args.workers, use_text_layer=not args.force_ocr,
+                          backend=args.ocr_backend, encoding=args.encoding, stitch=args.stitch,
+                          sidecar=not args.no_sidecar, doc_type=None if args.doc_type == "none" else args.doc_type,
+                          pages=args.pages, skip_blank=args.skip_blank, page_keywords=page_keywords)
+
+    folders = [p for p in args.pdf_files if os.path.isdir(p)]
+    pdf_files = [p for p in args.pdf_files if not os.path.isdir(p)]
+
+    dispatcher = get_ocr_dispatcher(args.ocr_backend, qps=args.qps)
+    dispatcher.set_hedging(args.hedge, args.hedge_percentile)
 
-    if len(sys.argv) < 2:
-        print("使用方式: python pdf_to_markdown.py files/cover_letter.pdf")
-        exit(1)
+    for folder in folders:
+        convert_folder(folder, jobs=args.jobs, force=args.force, manifest_path=args.manifest,
+                       cache_dir=None if args.no_cache else args.cache_dir,
+                       cache_max_bytes=cache_max_bytes, ocr_qps=args.qps, **convert_kwargs)
 
-    pdf_file = sys.argv[1]
-    output_md = pdf_file + ".md"
+    def convert(pdf_file):
+        output_md = pdf_file + ".md"
+        convert_pdf_file(pdf_file, output_md, resume=not args.restart,
+                         executor=ocr_pool, cache=ocr_cache, **convert_kwargs)
+        print(f"\n转换完成 → {output_md}")
 
-    markdown = pdf_to_markdown(pdf_file)
-    Path(output_md).write_text(markdown, encoding="utf-8")
-    print(f"\n转换完成 → {output_md}")
+    if pdf_files:
+        # one OCR pool shared by all files: total time is bounded by the slowest pages
+        workers = max(1, args.workers)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr") as ocr_pool, \
+                ThreadPoolExecutor(max_workers=len(pdf_files), thread_name_prefix="pdf") as file_pool:
+            for f in [file_pool.submit(convert, p) for p in pdf_files]:
+                f.result()
+        if ocr_cache is not None:
+            print(f"[CACHE] {ocr_cache.stats()}")
+        print(f"[OCR] {dispatcher.stats()}")
+        print(f"[OCR] 每页延迟 {dispatcher.latency_percentiles()}")
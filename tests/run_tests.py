@@ -23,7 +23,17 @@ def run_all_tests():
         'test_page_detection',
         'test_fill_pages',
         'test_pdf_to_markdown',
-        'test_llm_analysis'
+        'test_ocr_cache',
+        'test_ocr_dispatch',
+        'test_ocr_stitch',
+        'test_doc_fields',
+        'test_mrz_parser',
+        'test_llm_analysis',
+        'test_llm_cache',
+        'test_applicant_profile',
+        'test_visa_template',
+        'test_llm_json',
+        'test_visa_schema'
     ]
     
     for module_name in test_modules:
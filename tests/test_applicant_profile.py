@@ -0,0 +1,152 @@
+"""
+Unit tests for applicant_profile.py module
+"""
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from applicant_profile import (
+    document_source, precedence_for, merge_profile, merge_chunk_fields, IDENTITY_PRECEDENCE,
+)
+
+
+def doc(name, source, fields):
+    return {"name": name, "source": source, "fields": fields}
+
+
+class TestApplicantProfile(unittest.TestCase):
+    """Test cases for merging per-document extractions into one profile"""
+
+    def test_document_source(self):
+        self.assertEqual(document_source("files/passport.pdf.md"), "passport")
+        self.assertEqual(document_source("files/id_card.pdf.md"), "id_card")
+        self.assertEqual(document_source("files/cover_letter.pdf.md"), "cover_letter")
+        self.assertEqual(document_source("files/Cover_Letter.pdf"), "cover_letter")
+        self.assertEqual(document_source("files/offer_letter.pdf.md"), "offer")
+        self.assertEqual(document_source("files/bank_statement.pdf.md"), "other")
+
+    def test_precedence_for(self):
+        self.assertEqual(precedence_for(("Personal Information", "surname")), IDENTITY_PRECEDENCE)
+        self.assertEqual(precedence_for(("Personal Information", "current_address"))[0], "id_card")
+        self.assertEqual(precedence_for(("Study Details in Ireland", "course_name"))[:2], ("offer", "cover_letter"))
+
+    def test_identity_fields_follow_passport_over_id_card_over_letter(self):
+        """Test identity fields take the highest-ranked document regardless of order"""
+        result = merge_profile([
+            doc("letter", "cover_letter", {"Personal Information": {"surname": "Lei", "date_of_birth": "1992-10-18"}}),
+            doc("id", "id_card", {"Personal Information": {"surname": "雷", "date_of_birth": "1992-10-17",
+                                                            "place_of_birth": None}}),
+            doc("passport", "passport", {"Personal Information": {"surname": "LEI", "date_of_birth": None}}),
+        ])
+
+        personal = result["profile"]["Personal Information"]
+        self.assertEqual(personal["surname"], "LEI")
+        self.assertEqual(personal["date_of_birth"], "1992-10-17")
+        self.assertIsNone(personal["place_of_birth"])
+        self.assertEqual(result["sources"]["Personal Information.surname"], "passport")
+        self.assertEqual(result["sources"]["Personal Information.date_of_birth"], "id")
+        self.assertNotIn("Personal Information.place_of_birth", result["sources"])
+
+    def test_conflicts_reported_ignoring_case_and_whitespace(self):
+        result = merge_profile([
+            doc("passport", "passport", {"Personal Information": {"surname": "LEI", "forename": "NANKUN"}}),
+            doc("id", "id_card", {"Personal Information": {"surname": "雷", "forename": " Nankun "}}),
+            doc("letter", "cover_letter", {"Personal Information": {"surname": "lei"}}),
+        ])
+
+        self.assertEqual(result["conflicts"], [{
+            "field": "Personal Information.surname",
+            "chosen": {"document": "passport", "value": "LEI"},
+            "others": [{"document": "id", "value": "雷"}],
+        }])
+
+    def test_non_identity_fields_prefer_cover_letter(self):
+        result = merge_profile([
+            doc("passport", "passport", {"Contact Information": {"email": None, "address_line_1": "Beijing"}}),
+            doc("letter", "cover_letter", {"Contact Information": {"email": "a@b.com", "address_line_1": "Dublin"},
+                                           "Study Details in Ireland": {"course_name": "General English"}}),
+        ])
+
+        self.assertEqual(result["profile"]["Contact Information"], {"email": "a@b.com", "address_line_1": "Beijing"})
+        self.assertEqual(result["profile"]["Study Details in Ireland"]["course_name"], "General English")
+
+    def test_nested_sections_and_full_schema(self):
+        """Test nested dicts merge per field and a null never hides another document's section"""
+        result = merge_profile([
+            doc("letter", "cover_letter", {"Family Information": {"personal_status": "Single", "spouse_details": None},
+                                           "Employment History": []}),
+            doc("other", "other", {"Family Information": {"spouse_details": {"surname": "Wang", "gender": None}},
+                                   "Employment History": [{"employer_name": "ACME"}]}),
+        ])
+
+        family = result["profile"]["Family Information"]
+        self.assertEqual(family["personal_status"], "Single")
+        self.assertEqual(family["spouse_details"], {"surname": "Wang", "gender": None})
+        self.assertEqual(result["profile"]["Employment History"], [{"employer_name": "ACME"}])
+        self.assertEqual(result["conflicts"], [])
+
+    def test_list_and_object_sections_merge_by_position(self):
+        """Test a list section in one document and an object in another are merged item by item, not dropped"""
+        result = merge_profile([
+            doc("letter", "cover_letter", {"Employment History": [
+                {"employer_name": "ACME", "job_title": "Engineer"},
+                {"employer_name": "Initech", "job_title": "Intern"}]}),
+            doc("certificate", "other", {"Employment History": {
+                "employer_name": "ACME Ltd", "job_title": None, "start_date": "2019-07-01"}}),
+        ])
+
+        self.assertEqual(result["profile"]["Employment History"], [
+            {"employer_name": "ACME", "job_title": "Engineer", "start_date": "2019-07-01"},
+            {"employer_name": "Initech", "job_title": "Intern"}])
+        self.assertEqual(result["sources"]["Employment History[1].employer_name"], "letter")
+        self.assertEqual(result["sources"]["Employment History[0].start_date"], "certificate")
+        self.assertEqual(result["conflicts"], [{
+            "field": "Employment History[0].employer_name",
+            "chosen": {"document": "letter", "value": "ACME"},
+            "others": [{"document": "certificate", "value": "ACME Ltd"}],
+        }])
+
+    def test_same_source_ties_go_to_first_document(self):
+        result = merge_profile([
+            doc("p1", "passport", {"Passport Information": {"passport_number": "E1"}}),
+            doc("p2", "passport", {"Passport Information": {"passport_number": "E2"}}),
+        ])
+        self.assertEqual(result["profile"]["Passport Information"]["passport_number"], "E1")
+        self.assertEqual(len(result["conflicts"]), 1)
+
+    def test_empty(self):
+        self.assertEqual(merge_profile([]), {"profile": {}, "sources": {}, "conflicts": []})
+
+    def test_merge_chunk_fields(self):
+        """Test chunk results reduce in page order, lists concatenate and conflicts are reported"""
+        result = merge_chunk_fields([
+            {"Personal Information": {"surname": "LEI", "forename": None},
+             "Employment History": {"employer_name": "A"},
+             "Education / Qualification": {"education_history": [{"school_name": "X"}]}},
+            {"Personal Information": {"surname": "Lei ", "forename": "NANKUN"},
+             "Employment History": [{"employer_name": "B"}],
+             "Education / Qualification": {"education_history": [{"school_name": "X"}, {"school_name": None}]}},
+            {"Personal Information": {"surname": "雷"},
+             "Employment History": {"employer_name": None}},
+        ])
+
+        self.assertEqual(result["fields"], {
+            "Personal Information": {"surname": "LEI", "forename": "NANKUN"},
+            "Employment History": [{"employer_name": "A"}, {"employer_name": "B"}],
+            "Education / Qualification": {"education_history": [{"school_name": "X"}]},
+        })
+        self.assertEqual(result["conflicts"], [
+            {"field": "Personal Information.surname", "chosen": "LEI", "others": ["雷"]}])
+
+    def test_merge_chunk_fields_keeps_null_schema(self):
+        result = merge_chunk_fields([{"Travel Details": {"proposed_entry_date": None}},
+                                     {"Travel Details": {"proposed_entry_date": None}}])
+        self.assertEqual(result, {"fields": {"Travel Details": {"proposed_entry_date": None}}, "conflicts": []})
+        self.assertEqual(merge_chunk_fields([]), {"fields": {}, "conflicts": []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Unit tests for doc_fields.py module
+"""
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from doc_fields import (
+    detect_doc_type,
+    normalize_date,
+    normalize_gender,
+    passport_to_fields,
+    id_card_to_fields,
+    merge_fields,
+    fields_path_for,
+    nationality_name,
+)
+
+
+class TestDocFields(unittest.TestCase):
+    """Test cases for document-type routing and structured field mapping"""
+
+    def setUp(self):
+        """Set up sample structured OCR responses"""
+        self.passport_resp = {
+            "ID": "EQ5921220",
+            "Name": "LEI,NANKUN",
+            "Surname": "LEI",
+            "GivenName": "NANKUN",
+            "DateOfBirth": "1992-10-17",
+            "Sex": "M",
+            "DateOfExpiration": "2035-09-08",
+            "IssuingCountry": "CHN",
+            "Nationality": "CHN",
+            "Type": "PO",
+            "PassportRecognizeInfos": {
+                "DateOfIssuance": "09 SEP 2025",
+                "IssuingAuthority": "National Immigration Administration,PRC",
+                "BirthPlace": "GUANGDONG",
+            },
+        }
+        self.id_front = {
+            "Name": "雷南坤", "Sex": "男", "Nation": "汉", "Birth": "1992/10/17",
+            "Address": "广东省翁源县周陂镇集义村五组新大街31号", "IdNum": "440229199210171315",
+            "Authority": "", "ValidDate": "",
+        }
+        self.id_back = {"Name": "", "IdNum": "", "Authority": "翁源县公安局", "ValidDate": "2022.07.18-2042.07.18"}
+
+    def test_detect_doc_type_by_filename(self):
+        self.assertEqual(detect_doc_type("files/passport.pdf"), "passport")
+        self.assertEqual(detect_doc_type("scans/Applicant_IDCard.jpg"), "id_card")
+        self.assertEqual(detect_doc_type("files/身份证.pdf"), "id_card")
+        self.assertIsNone(detect_doc_type("files/cover_letter.pdf"))
+
+    def test_normalize_date(self):
+        for value in ("1992-10-17", "1992/10/17", "1992.10.17", "19921017", "921017",
+                      "17 OCT 1992", "17 October 1992", "1992年10月17日"):
+            self.assertEqual(normalize_date(value), "1992-10-17", value)
+        self.assertEqual(normalize_date("长期"), "长期")
+        self.assertIsNone(normalize_date(""))
+        self.assertEqual(normalize_date("1992-13-40"), "1992-13-40")
+
+    def test_normalize_gender(self):
+        self.assertEqual(normalize_gender("M"), "Male")
+        self.assertEqual(normalize_gender("女"), "Female")
+        self.assertIsNone(normalize_gender(""))
+
+    def test_passport_to_fields(self):
+        """Test an MLIDPassportOCR response maps onto the Personal / Passport sections"""
+        fields = passport_to_fields(self.passport_resp)
+
+        self.assertEqual(fields["Personal Information"]["surname"], "LEI")
+        self.assertEqual(fields["Personal Information"]["forename"], "NANKUN")
+        self.assertEqual(fields["Personal Information"]["date_of_birth"], "1992-10-17")
+        self.assertEqual(fields["Personal Information"]["gender"], "Male")
+        self.assertEqual(fields["Personal Information"]["place_of_birth"], "GUANGDONG")
+        self.assertEqual(fields["Personal Information"]["nationality"], "China")
+        passport = fields["Passport Information"]
+        self.assertEqual(passport["passport_number"], "EQ5921220")
+        self.assertEqual(passport["passport_type"], "National Passport")
+        self.assertEqual(passport["date_of_issue"], "2025-09-09")
+        self.assertEqual(passport["date_of_expiry"], "2035-09-08")
+        self.assertEqual(fields["Travel Document Details"]["passport_1"]["passport_number"], "EQ5921220")
+
+    def test_passport_name_fallback(self):
+        """Test the surname / given name are split from Name when not returned separately"""
+        fields = passport_to_fields({"Name": "LEI,NANKUN", "ID": "EQ5921220"})
+
+        self.assertEqual(fields["Personal Information"]["surname"], "LEI")
+        self.assertEqual(fields["Personal Information"]["forename"], "NANKUN")
+        self.assertIsNone(fields["Passport Information"]["passport_type"])
+
+    def test_passport_nationality_code_mapped(self):
+        """Test the ICAO nationality code becomes a country name, and an unlisted code is left empty"""
+        self.assertEqual(passport_to_fields({"Nationality": "GBR"})["Personal Information"]["nationality"],
+                         "United Kingdom")
+        self.assertIsNone(passport_to_fields({"Nationality": "XXA"})["Personal Information"]["nationality"])
+        self.assertEqual(nationality_name(" chn "), "China")
+        self.assertIsNone(nationality_name(None))
+
+    def test_id_card_front_and_back_merge(self):
+        """Test the two sides of an ID card merge into one set of fields"""
+        fields = merge_fields(id_card_to_fields(self.id_front), id_card_to_fields(self.id_back))
+
+        personal = fields["Personal Information"]
+        self.assertEqual(personal["other_name"], "雷南坤")
+        self.assertNotIn("surname", personal)
+        self.assertNotIn("forename", personal)
+        self.assertEqual(personal["date_of_birth"], "1992-10-17")
+        self.assertEqual(fields["Contact Information"]["address_line_1"], self.id_front["Address"])
+        card = fields["ID Card Information"]
+        self.assertEqual(card["id_number"], "440229199210171315")
+        self.assertEqual(card["issuing_authority"], "翁源县公安局")
+        self.assertEqual((card["date_of_issue"], card["date_of_expiry"]), ("2022-07-18", "2042-07-18"))
+
+    def test_id_card_compound_surname_not_split(self):
+        fields = id_card_to_fields({"Name": "欧阳娜娜", "IdNum": "110101200008070021"})
+        self.assertEqual(fields["Personal Information"]["other_name"], "欧阳娜娜")
+        self.assertNotIn("surname", fields["Personal Information"])
+
+    def test_merge_fields_keeps_known_values(self):
+        merged = merge_fields({"A": {"x": 1, "y": None}}, {"A": {"x": 2, "y": 3, "z": None}, "B": {"k": "v"}})
+
+        self.assertEqual(merged, {"A": {"x": 1, "y": 3, "z": None}, "B": {"k": "v"}})
+
+    def test_fields_path_for(self):
+        self.assertEqual(fields_path_for("files/passport.pdf"), "files/passport.pdf.fields.json")
+        self.assertEqual(fields_path_for("files/passport.pdf.md"), "files/passport.pdf.fields.json")
+
+
+if __name__ == '__main__':
+    unittest.main()
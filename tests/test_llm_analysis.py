@@ -7,6 +7,10 @@ import sys
 import os
 import json
 import re
+import tempfile
+import shutil
+import time
+import threading
 
 # Mock dependencies before importing llm_analysis
 mock_dotenv = MagicMock()
@@ -20,7 +24,13 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 # Mock os.environ before importing (llm_analysis uses os.environ.get("MODEL"))
 with patch.dict(os.environ, {'MODEL': 'gpt-4'}):
-    from llm_analysis import extract_visa_fields, irish_visa_template_prompt
+    from llm_analysis import (
+        extract_visa_fields, extract_visa_fields_for_file, irish_visa_template_prompt,
+        extract_documents_async, extract_applicant_profile,
+        split_markdown_chunks, extract_visa_fields_chunked, structured_fields_to_schema, visa_prompt_sections,
+        LLM_CHUNK_CHARS,
+    )
+from llm_cache import LlmCache
 
 
 class TestLlmAnalysis(unittest.TestCase):
@@ -28,6 +38,10 @@ class TestLlmAnalysis(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures"""
+        # keep the persistent LLM cache out of the tests unless a test installs one
+        cache_patcher = patch('llm_analysis.get_llm_cache', return_value=None)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
         self.sample_markdown = """
         Passport Number: AB123456
         Name: John Doe
@@ -101,9 +115,9 @@ class TestLlmAnalysis(unittest.TestCase):
     @patch('llm_analysis.llm')
     @patch('builtins.print')  # Suppress warning output during test
     def test_extract_visa_fields_invalid_json_fixes(self, mock_print, mock_llm):
-        """Test extract_visa_fields when JSON is invalid and gets fixed"""
+        """Test extract_visa_fields when JSON is invalid beyond local repair and the LLM fixes it"""
         # First response has invalid JSON
-        invalid_json = '{"key": "value",}'  # trailing comma
+        invalid_json = '{"key": "value" "other": 1}'  # missing comma
         mock_response1 = Mock()
         mock_response1.content = invalid_json
         
@@ -136,7 +150,7 @@ class TestLlmAnalysis(unittest.TestCase):
     def test_extract_visa_fields_fix_fails(self, mock_print, mock_llm):
         """Test extract_visa_fields when JSON fix also fails"""
         # Both responses have invalid JSON
-        invalid_json1 = '{"key": "value",}'
+        invalid_json1 = '{"key": "value" "other": 1}'
         invalid_json2 = '{"key": "value", "missing": }'
         
         mock_response1 = Mock()
@@ -287,6 +301,611 @@ class TestLlmAnalysis(unittest.TestCase):
         self.assertEqual(result["Personal Information"]["surname"], "张")
 
 
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_for_file_uses_structured_fields(self, mock_print, mock_llm):
+        """Test a structured-OCR fields.json next to the markdown replaces the LLM call"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        md_path = os.path.join(workdir, "passport.pdf.md")
+        with open(md_path, "w", encoding="utf-8") as f:
+            f.write(self.sample_markdown)
+        with open(os.path.join(workdir, "passport.pdf.fields.json"), "w", encoding="utf-8") as f:
+            json.dump(dict(self.sample_fields, _source={"doc_type": "passport"}), f)
+
+        structured = extract_visa_fields_for_file(md_path)
+        mock_llm.invoke.assert_not_called()
+        self.assertEqual(structured["Personal Information"]["surname"], "Doe")
+        self.assertNotIn("_source", structured)
+        self.assertEqual(list(structured), list(visa_prompt_sections))
+
+        os.remove(os.path.join(workdir, "passport.pdf.fields.json"))
+        mock_response = Mock()
+        mock_response.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.return_value = mock_response
+        result = extract_visa_fields_for_file(md_path)
+        mock_llm.invoke.assert_called_once()
+        # a passport only gets the passport sections of the prompt
+        self.assertEqual(result["Personal Information"], self.sample_fields["Personal Information"])
+        self.assertIsNone(result["Application Information"]["visa_type"])
+        self.assertNotIn("Study Details in Ireland:", mock_llm.invoke.call_args[0][0])
+
+    @patch('builtins.print')
+    def test_structured_fields_to_schema(self, mock_print):
+        """Test structured-OCR fields are padded to the full schema, validated and stripped of extra sections"""
+        raw = {
+            "Personal Information": {"other_name": "雷南坤", "date_of_birth": "1992/10/17",
+                                     "gender": "male"},
+            "Contact Information": {"address_line_1": "广东省翁源县"},
+            "ID Card Information": {"id_number": "440229199210171315"},
+            "_source": {"doc_type": "id_card", "backend": "tencent", "pages": [1, 2]},
+        }
+
+        fields = structured_fields_to_schema(raw)
+
+        self.assertEqual(list(fields), list(visa_prompt_sections))
+        personal = fields["Personal Information"]
+        self.assertEqual((personal["other_name"], personal["date_of_birth"], personal["gender"]),
+                         ("雷南坤", "1992-10-17", "Male"))
+        self.assertIsNone(personal["surname"])
+        self.assertIsNone(personal["nationality"])
+        self.assertIsNone(fields["Contact Information"]["phone"])
+        self.assertIsNone(fields["Passport Information"]["passport_number"])
+
+    @patch('llm_analysis.llm')
+    def test_extract_visa_fields_doc_type_slices_prompt(self, mock_llm):
+        """Test an ID card prompt only carries its sections and the result keeps the full schema"""
+        from llm_analysis import visa_prompt_sections
+        mock_response = Mock()
+        mock_response.content = json.dumps({"Personal Information": {"surname": "雷", "forename": "南坤"},
+                                            "Study Details in Ireland": {"course_name": "made up"}})
+        mock_llm.invoke.return_value = mock_response
+
+        result = extract_visa_fields("姓名 雷南坤\n公民身份号码 110101199210170011", doc_type="id_card")
+
+        prompt = mock_llm.invoke.call_args[0][0]
+        self.assertIn("2. Personal Information:", prompt)
+        self.assertIn("3. Contact Information:", prompt)
+        self.assertNotIn("4. Passport Information:", prompt)
+        self.assertIn("爱尔兰签证材料字段识别专家", prompt)
+        self.assertIn("公民身份号码 110101199210170011", prompt)
+        self.assertLess(len(prompt), len(irish_visa_template_prompt) / 3)
+
+        self.assertEqual(list(result), list(visa_prompt_sections))
+        self.assertEqual(result["Personal Information"], {"surname": "雷", "forename": "南坤"})
+        self.assertIsNone(result["Contact Information"]["phone"])
+        self.assertIsNone(result["Study Details in Ireland"]["course_name"])  # not requested, not trusted
+        self.assertIsNone(result["Family Information"]["spouse_details"]["surname"])
+
+    @patch('llm_analysis.llm')
+    def test_extract_visa_fields_unknown_doc_type_uses_full_template(self, mock_llm):
+        mock_response = Mock()
+        mock_response.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.return_value = mock_response
+
+        result = extract_visa_fields(self.sample_markdown, doc_type="cover_letter")
+
+        self.assertEqual(mock_llm.invoke.call_args[0][0], irish_visa_template_prompt.format(text=self.sample_markdown))
+        self.assertEqual(result, self.sample_fields)
+
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_fills_from_valid_mrz(self, mock_print, mock_llm):
+        """Test a passport MRZ that passes its checks fills those fields and is left out of the LLM task"""
+        markdown = ("姓名/Name\nLEI,\nNANKUN\n签发日期/Date of issue\n09 9月/SEP\n2025\n"
+                    "POCHNLEI<<NANKUN<<<<<<<<<<<\n<<<<<<<<<<<<<<<<<<<<<<<\n"
+                    "EQ59212201CHN9210170M3509087MANHMEMPMAKEA988")
+        llm_fields = {
+            "Personal Information": {"surname": None, "forename": "NAN", "place_of_birth": "GUANGDONG"},
+            "Passport Information": {"passport_number": None, "date_of_issue": "2025-09-09"},
+        }
+        mock_response = Mock()
+        mock_response.content = json.dumps(llm_fields)
+        mock_llm.invoke.return_value = mock_response
+
+        result = extract_visa_fields(markdown)
+        prompt = mock_llm.invoke.call_args[0][0]
+        extract_visa_fields(markdown, use_mrz=False)
+        plain_prompt = mock_llm.invoke.call_args[0][0]
+
+        self.assertLess(len(prompt), len(plain_prompt))
+        passport_section = prompt.split("4. Passport Information:")[1].split("5. ")[0]
+        self.assertNotIn("- passport_number", passport_section)
+        self.assertIn("- date_of_issue", passport_section)
+        self.assertNotIn("- surname", prompt.split("3. Contact Information")[0])
+        self.assertIn("- place_of_birth", prompt)
+        personal = result["Personal Information"]
+        self.assertEqual((personal["surname"], personal["forename"]), ("LEI", "NANKUN"))
+        self.assertEqual(personal["place_of_birth"], "GUANGDONG")
+        self.assertEqual(result["Passport Information"]["passport_number"], "EQ5921220")
+        self.assertEqual(result["Passport Information"]["date_of_issue"], "2025-09-09")
+        self.assertEqual(result["Travel Document Details"]["passport_1"]["date_of_expiry"], "2035-09-08")
+        self.assertEqual(personal["nationality"], "China")
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_keeps_llm_nationality_for_unknown_mrz_code(self, mock_print, mock_llm):
+        """Test an MRZ nationality code without a country name neither overwrites nor nulls the LLM value"""
+        mock_response = Mock()
+        mock_response.content = json.dumps({"Personal Information": {"nationality": "Utopian"}})
+        mock_llm.invoke.return_value = mock_response
+
+        with patch.dict('doc_fields.NATIONALITY_NAMES', clear=True):
+            result = extract_visa_fields("POCHNLEI<<NANKUN<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n"
+                                         "EQ59212201CHN9210170M3509087MANHMEMPMAKEA988")
+
+        prompt = mock_llm.invoke.call_args[0][0]
+        self.assertIn("- nationality", prompt.split("3. Contact Information")[0])
+        self.assertNotIn("- surname", prompt.split("3. Contact Information")[0])
+        self.assertEqual(result["Personal Information"]["nationality"], "Utopian")
+        self.assertEqual(result["Personal Information"]["surname"], "LEI")
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_skips_llm_when_mrz_covers_request(self, mock_print, mock_llm):
+        """Test no LLM call is made when every requested field is already known from the MRZ"""
+        known = {"Passport Information": {"passport_number": "EQ5921220", "passport_type": "P",
+                                          "issuing_authority": "MPS", "date_of_issue": "2025-09-09",
+                                          "date_of_expiry": "2035-09-08", "first_passport": True}}
+
+        with patch('llm_analysis.mrz_fields_from_text', return_value=known), \
+                patch('llm_analysis.sections_for_doc_type', return_value=["Passport Information"]):
+            result = extract_visa_fields("passport text", doc_type="passport")
+
+        mock_llm.invoke.assert_not_called()
+        self.assertEqual(result["Passport Information"], known["Passport Information"])
+        self.assertIsNone(result["Personal Information"]["surname"])
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_ignores_mrz_with_bad_check_digit(self, mock_print, mock_llm):
+        """Test an MRZ failing a check digit is not used and the LLM extracts everything"""
+        markdown = ("POCHNLEI<<NANKUN<<<<<<<<<<<<<<<<<<<<<<<<<<<<\n"
+                    "EQ59212281CHN9210170M3509087MANHMEMPMAKEA988")
+        mock_response = Mock()
+        mock_response.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.return_value = mock_response
+
+        result = extract_visa_fields(markdown)
+
+        self.assertNotIn("MRZ", mock_llm.invoke.call_args[0][0])
+        self.assertEqual(result, self.sample_fields)
+        self.assertIn("校验位不符", str(mock_print.call_args_list))
+
+    def _use_temp_cache(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        cache = LlmCache(os.path.join(tmpdir, "llm.sqlite3"))
+        self.addCleanup(cache.close)
+        patcher = patch('llm_analysis.get_llm_cache', return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return cache
+
+    @patch('llm_analysis.llm')
+    def test_extract_visa_fields_cache_hit_skips_llm(self, mock_llm):
+        """Test the same input is answered from the cache on the second call"""
+        cache = self._use_temp_cache()
+        mock_response = Mock()
+        mock_response.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.return_value = mock_response
+
+        first = extract_visa_fields(self.sample_markdown)
+        second = extract_visa_fields(self.sample_markdown)
+
+        self.assertEqual(mock_llm.invoke.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+        # different input text is a miss
+        extract_visa_fields(self.sample_markdown + "\nExtra line")
+        self.assertEqual(mock_llm.invoke.call_count, 2)
+
+        # use_cache=False always calls the LLM
+        extract_visa_fields(self.sample_markdown, use_cache=False)
+        self.assertEqual(mock_llm.invoke.call_count, 3)
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_caches_repair_response(self, mock_print, mock_llm):
+        """Test a response needing the LLM JSON repair is cached together with the repair"""
+        self._use_temp_cache()
+        mock_response1 = Mock()
+        mock_response1.content = '{"key": "value" "other": 1}'
+        mock_response2 = Mock()
+        mock_response2.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.side_effect = [mock_response1, mock_response2]
+
+        self.assertEqual(extract_visa_fields(self.sample_markdown), self.sample_fields)
+        self.assertEqual(extract_visa_fields(self.sample_markdown), self.sample_fields)
+
+        self.assertEqual(mock_llm.invoke.call_count, 2)
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_does_not_cache_unparseable_response(self, mock_print, mock_llm):
+        """Test a response that could not be parsed is not cached, so a retry asks the LLM again"""
+        cache = self._use_temp_cache()
+        bad = Mock()
+        bad.content = '{"key": "value" "other": 1}'
+        still_bad = Mock()
+        still_bad.content = '{"key": }'
+        good = Mock()
+        good.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.side_effect = [bad, still_bad, good]
+
+        with self.assertRaises(ValueError):
+            extract_visa_fields(self.sample_markdown)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+        self.assertEqual(extract_visa_fields(self.sample_markdown), self.sample_fields)
+        self.assertEqual(mock_llm.invoke.call_count, 3)
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    @patch('builtins.print')
+    def test_extract_documents_async_limits_concurrency(self, mock_print):
+        """Test documents are extracted concurrently, at most max_concurrency at a time, in input order"""
+        import asyncio
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def fake_extract(md_path):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.05)
+            with lock:
+                state["running"] -= 1
+            if md_path == "bad.md":
+                raise ValueError("响应中未找到JSON格式")
+            return {"Personal Information": {"surname": md_path}}
+
+        paths = ["a.md", "bad.md", "c.md", "d.md", "e.md"]
+        with patch('llm_analysis.extract_visa_fields_for_file', side_effect=fake_extract):
+            docs = asyncio.run(extract_documents_async(paths, max_concurrency=2))
+
+        self.assertEqual(state["peak"], 2)
+        self.assertEqual([d["name"] for d in docs], paths)
+        self.assertEqual(docs[0]["fields"], {"Personal Information": {"surname": "a.md"}})
+        self.assertIsNone(docs[1]["fields"])
+        self.assertIn("未找到JSON格式", docs[1]["error"])
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_llm_calls_limited_across_batch_and_chunks(self, mock_print, mock_llm):
+        """Test concurrent files times concurrent chunks never exceeds the process-wide LLM limit"""
+        import asyncio
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+
+        def invoke(prompt, **kwargs):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.02)
+            with lock:
+                state["running"] -= 1
+            response = Mock()
+            response.content = json.dumps(self.sample_fields)
+            return response
+
+        mock_llm.invoke.side_effect = invoke
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir, True)
+        paths = []
+        for name in ("a", "b", "c"):
+            path = os.path.join(tmpdir, f"{name}.pdf.md")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("\n\n".join(f"<!-- Page {i} -->\n\n" + "x" * (LLM_CHUNK_CHARS - 100) for i in range(1, 4)))
+            paths.append(path)
+
+        with patch('llm_analysis._llm_slots', threading.BoundedSemaphore(2)):
+            docs = asyncio.run(extract_documents_async(paths, max_concurrency=3))
+
+        self.assertEqual(mock_llm.invoke.call_count, 9)
+        self.assertEqual(state["peak"], 2)
+        self.assertTrue(all(d["fields"] is not None for d in docs))
+
+    @patch('builtins.print')
+    def test_extract_applicant_profile_merges_by_source(self, mock_print):
+        """Test the batch API merges documents with passport precedence and reports conflicts"""
+        extracted = {
+            "files/passport.pdf.md": {"Personal Information": {"surname": "LEI", "phone": None}},
+            "files/id_card.pdf.md": {"Personal Information": {"surname": "雷"}},
+            "files/cover_letter.pdf.md": {"Personal Information": {"surname": "Lei"},
+                                          "Study Details in Ireland": {"course_name": "General English"}},
+        }
+        with patch('llm_analysis.extract_visa_fields_for_file', side_effect=extracted.__getitem__):
+            result = extract_applicant_profile(list(reversed(list(extracted))))
+
+        self.assertEqual(result["profile"]["Personal Information"], {"surname": "LEI", "phone": None})
+        self.assertEqual(result["profile"]["Study Details in Ireland"]["course_name"], "General English")
+        self.assertEqual([d["source"] for d in result["documents"]], ["cover_letter", "id_card", "passport"])
+        self.assertEqual(len(result["conflicts"]), 1)
+        self.assertEqual(result["conflicts"][0]["others"], [{"document": "files/id_card.pdf.md", "value": "雷"}])
+
+    def test_get_llm_is_lazy_and_shared_across_threads(self):
+        """Test the client is created on first use only, once, even when threads race for it"""
+        import llm_analysis
+        chat_openai = sys.modules['langchain_openai'].ChatOpenAI
+        chat_openai.reset_mock()
+        chat_openai.side_effect = lambda **kwargs: (time.sleep(0.02), Mock())[1]
+        self.addCleanup(setattr, chat_openai, 'side_effect', None)
+        fake_http = {'httpx': MagicMock(), 'openai': MagicMock()}
+
+        with patch.object(llm_analysis, 'llm', None), patch.dict(sys.modules, fake_http):
+            self.assertIsNone(llm_analysis.llm)  # importing the module created nothing
+            clients = []
+            threads = [threading.Thread(target=lambda: clients.append(llm_analysis.get_llm())) for _ in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+            self.assertEqual(chat_openai.call_count, 1)
+            self.assertEqual(len({id(c) for c in clients}), 1)
+            self.assertIs(llm_analysis.get_llm(), clients[0])
+            kwargs = chat_openai.call_args.kwargs
+            self.assertEqual(kwargs['temperature'], llm_analysis.LLM_TEMPERATURE)
+            self.assertIn('http_client', kwargs)
+
+    @patch('llm_analysis.llm')
+    def test_extract_visa_fields_repairs_json_locally(self, mock_llm):
+        """Test fences, trailing commas and Python literals are repaired without a second LLM call"""
+        import llm_analysis
+        before = dict(llm_analysis.json_parse_stats)
+        mock_response = Mock()
+        mock_response.content = ("好的，提取结果如下：\n```json\n"
+                                 "{'Personal Information': {'surname': 'Doe', 'other_name': None,},\n"
+                                 " \"Passport Information\": {\"first_passport\": True},}\n```")
+        mock_llm.invoke.return_value = mock_response
+
+        result = extract_visa_fields(self.sample_markdown)
+
+        mock_llm.invoke.assert_called_once()
+        self.assertEqual(result, {"Personal Information": {"surname": "Doe", "other_name": None},
+                                  "Passport Information": {"first_passport": True}})
+        self.assertEqual(llm_analysis.json_parse_stats["local_repair"], before["local_repair"] + 1)
+        self.assertEqual(llm_analysis.json_parse_stats["llm_repair"], before["llm_repair"])
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_counts_llm_repairs(self, mock_print, mock_llm):
+        import llm_analysis
+        before = dict(llm_analysis.json_parse_stats)
+        mock_response1 = Mock()
+        mock_response1.content = '{"key": "value" "other": 1}'
+        mock_response2 = Mock()
+        mock_response2.content = '```json\n{"key": "value", "other": 1,}\n```'
+        mock_llm.invoke.side_effect = [mock_response1, mock_response2]
+
+        self.assertEqual(extract_visa_fields(self.sample_markdown), {"key": "value", "other": 1})
+        self.assertEqual(llm_analysis.json_parse_stats["llm_repair"], before["llm_repair"] + 1)
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_retries_only_failing_sections(self, mock_print, mock_llm):
+        """Test a section failing validation is re-requested alone and merged back"""
+        first = Mock()
+        first.content = json.dumps({
+            "Application Information": {"visa_type": "long stay (d)", "journey_type": "Twice"},
+            "Personal Information": {"surname": "Doe", "date_of_birth": "1990/01/01"},
+        })
+        retry = Mock()
+        retry.content = json.dumps({"Application Information": {"visa_type": "Long Stay (D)", "journey_type": "Multiple"},
+                                    "Personal Information": {"surname": "Changed"}})
+        mock_llm.invoke.side_effect = [first, retry]
+
+        result = extract_visa_fields(self.sample_markdown)
+
+        self.assertEqual(mock_llm.invoke.call_count, 2)
+        retry_prompt = mock_llm.invoke.call_args_list[1][0][0]
+        self.assertIn("1. Application Information:", retry_prompt)
+        self.assertNotIn("2. Personal Information:", retry_prompt)
+        self.assertIn("Twice", retry_prompt)
+        self.assertIn(self.sample_markdown, retry_prompt)
+        self.assertLess(len(retry_prompt), len(mock_llm.invoke.call_args_list[0][0][0]) / 3)
+        self.assertEqual(result["Application Information"], {"visa_type": "Long Stay (D)", "journey_type": "Multiple"})
+        # valid sections keep the first answer (normalised), they are not replaced by the retry
+        self.assertEqual(result["Personal Information"], {"surname": "Doe", "date_of_birth": "1990-01-01"})
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_nulls_fields_still_invalid_after_retry(self, mock_print, mock_llm):
+        response = Mock()
+        response.content = json.dumps({"Financial Support": {"sponsor_count": "two", "self_funded": "No"}})
+        mock_llm.invoke.return_value = response
+
+        result = extract_visa_fields(self.sample_markdown)
+
+        self.assertEqual(mock_llm.invoke.call_count, 2)
+        self.assertEqual(result["Financial Support"], {"sponsor_count": None, "self_funded": "No"})
+        self.assertIn("已置为 null", str(mock_print.call_args_list))
+
+    @patch('llm_analysis.llm')
+    def test_extract_visa_fields_requests_structured_output(self, mock_llm):
+        """Test JSON mode is requested, and json_schema mode sends the schema of the requested sections"""
+        import llm_analysis
+        mock_response = Mock()
+        mock_response.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.return_value = mock_response
+
+        extract_visa_fields(self.sample_markdown)
+        self.assertEqual(mock_llm.invoke.call_args.kwargs["response_format"], {"type": "json_object"})
+
+        with patch.object(llm_analysis, 'LLM_JSON_MODE', 'json_schema'):
+            extract_visa_fields(self.sample_markdown, doc_type="id_card")
+        schema = mock_llm.invoke.call_args.kwargs["response_format"]["json_schema"]["schema"]
+        self.assertEqual(schema["required"], ["Personal Information", "Contact Information"])
+        self.assertEqual(schema["properties"]["Personal Information"]["properties"]["gender"]["enum"],
+                         ["Male", "Female", "Other", None])
+
+        with patch.object(llm_analysis, 'LLM_JSON_MODE', 'off'):
+            extract_visa_fields(self.sample_markdown + " ")
+        self.assertNotIn("response_format", mock_llm.invoke.call_args.kwargs)
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_falls_back_when_json_mode_unsupported(self, mock_print, mock_llm):
+        import llm_analysis
+        rejected = Exception("Error code: 400 - response_format is not supported by this model")
+        rejected.status_code = 400
+        mock_response = Mock()
+        mock_response.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.side_effect = [rejected, mock_response, mock_response]
+
+        with patch.object(llm_analysis, '_json_mode_supported', True):
+            self.assertEqual(extract_visa_fields(self.sample_markdown), self.sample_fields)
+            self.assertNotIn("response_format", mock_llm.invoke.call_args.kwargs)
+            extract_visa_fields(self.sample_markdown + " ")
+
+        self.assertEqual(mock_llm.invoke.call_count, 3)
+        self.assertNotIn("response_format", mock_llm.invoke.call_args.kwargs)
+
+    @patch('llm_analysis.llm')
+    def test_other_400_errors_keep_json_mode(self, mock_llm):
+        """Test a 400 unrelated to response_format (context length) is raised and JSON mode stays on"""
+        import llm_analysis
+        too_long = Exception("Error code: 400 - This model's maximum context length is 8192 tokens")
+        too_long.status_code = 400
+        mock_llm.invoke.side_effect = too_long
+
+        with patch.object(llm_analysis, '_json_mode_supported', True):
+            with self.assertRaises(Exception) as context:
+                extract_visa_fields(self.sample_markdown)
+            self.assertIs(context.exception, too_long)
+            self.assertTrue(llm_analysis._json_mode_supported)
+
+        mock_llm.invoke.assert_called_once()
+        self.assertIn("response_format", mock_llm.invoke.call_args.kwargs)
+
+    @patch('llm_analysis.llm')
+    def test_extract_visa_fields_other_errors_propagate(self, mock_llm):
+        mock_llm.invoke.side_effect = ConnectionError("network down")
+        with self.assertRaises(ConnectionError):
+            extract_visa_fields(self.sample_markdown)
+        self.assertEqual(mock_llm.invoke.call_count, 1)
+
+    def test_split_markdown_chunks(self):
+        """Test pages are packed into chunks at page markers and an oversized page splits on paragraphs"""
+        pages = [f"<!-- Page {i} -->\n\n" + f"page {i} text\n" * 20 for i in range(1, 5)]
+        text = "\n\n".join(pages)
+
+        chunks = split_markdown_chunks(text, max_chars=len(pages[0]) * 2 + 10)
+        self.assertEqual(len(chunks), 2)
+        self.assertTrue(chunks[1].startswith("<!-- Page 3 -->"))
+        self.assertEqual("".join(chunks), text)
+
+        self.assertEqual(split_markdown_chunks(text, max_chars=100000), [text])
+
+        long_page = "<!-- Page 1 -->\n\n" + "\n\n".join("paragraph %d " % i + "x" * 80 for i in range(10))
+        chunks = split_markdown_chunks(long_page, max_chars=300)
+        self.assertGreater(len(chunks), 3)
+        self.assertEqual("".join(chunks), long_page)
+        self.assertTrue(all(len(c) <= 300 for c in chunks[1:]))
+        self.assertNotEqual(chunks[0].strip(), "<!-- Page 1 -->")
+
+    def test_split_markdown_chunks_hard_splits_long_lines(self):
+        """Test a line longer than max_chars (OCR output without newlines) is cut, and the chunks still rejoin"""
+        marker = "<!-- Page 1 -->\n\n"
+        text = marker + "x" * 30017 + "\n\n<!-- Page 2 -->\n\nend\n"
+
+        chunks = split_markdown_chunks(text, max_chars=12000)
+
+        self.assertEqual("".join(chunks), text)
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(all(len(c) <= 12000 + len(marker) for c in chunks))
+
+        no_breaks = "y" * 30017
+        chunks = split_markdown_chunks(no_breaks, max_chars=12000)
+        self.assertEqual([len(c) for c in chunks], [12000, 12000, 6017])
+        self.assertEqual("".join(chunks), no_breaks)
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_chunked_map_reduce(self, mock_print, mock_llm):
+        """Test chunks are extracted concurrently and reduced with page order and list merging"""
+        lock = threading.Lock()
+        state = {"running": 0, "peak": 0}
+        answers = {
+            "Page 1": {"Personal Information": {"surname": "Doe", "forename": None},
+                       "Education / Qualification": {"education_history": [{"school_name": "A"}]}},
+            "Page 2": {"Personal Information": {"surname": "DOE", "forename": "John"},
+                       "Education / Qualification": {"education_history": [{"school_name": "B"}]}},
+            "Page 3": {"Personal Information": {"surname": "Smith"},
+                       "Education / Qualification": {"education_history": [{"school_name": "A"}]}},
+        }
+
+        def invoke(prompt, **kwargs):
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.05)
+            with lock:
+                state["running"] -= 1
+            page = next(p for p in answers if f"<!-- {p} -->" in prompt)
+            response = Mock()
+            response.content = json.dumps(answers[page])
+            return response
+
+        mock_llm.invoke.side_effect = invoke
+        text = "\n\n".join(f"<!-- Page {i} -->\n\n" + f"statement line {i}\n" * 30 for i in range(1, 4))
+
+        result = extract_visa_fields_chunked(text, max_chars=len(text) // 3 + 5, max_concurrency=3)
+
+        self.assertEqual(mock_llm.invoke.call_count, 3)
+        self.assertEqual(state["peak"], 3)
+        self.assertEqual(result["Personal Information"], {"surname": "Doe", "forename": "John"})
+        self.assertEqual(result["Education / Qualification"]["education_history"],
+                         [{"school_name": "A"}, {"school_name": "B"}])
+        self.assertIn("分块结果不一致 Personal Information.surname", str(mock_print.call_args_list))
+
+    @patch('llm_analysis.llm')
+    def test_extract_visa_fields_chunked_short_text_single_call(self, mock_llm):
+        mock_response = Mock()
+        mock_response.content = json.dumps(self.sample_fields)
+        mock_llm.invoke.return_value = mock_response
+
+        result = extract_visa_fields_chunked("<!-- Page 1 -->\n\n" + self.sample_markdown)
+
+        mock_llm.invoke.assert_called_once()
+        self.assertEqual(result, self.sample_fields)
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_chunked_applies_mrz_after_reduce(self, mock_print, mock_llm):
+        """Test the MRZ parsed from the whole text overrides whatever the chunks said"""
+        mock_response = Mock()
+        mock_response.content = json.dumps({"Personal Information": {"surname": "WRONG", "nationality": None}})
+        mock_llm.invoke.return_value = mock_response
+        text = ("<!-- Page 1 -->\n\n" + "Passport data page\n" * 20 + "\n\n<!-- Page 2 -->\n\n"
+                "POCHNLEI<<NANKUN<<<<<<<<<<<<<<<<<<<<<<<<<<<<\nEQ59212201CHN9210170M3509087MANHMEMPMAKEA988\n")
+
+        result = extract_visa_fields_chunked(text, max_chars=400)
+
+        self.assertEqual(mock_llm.invoke.call_count, 2)
+        self.assertNotIn("MRZ", mock_llm.invoke.call_args_list[1][0][0])
+        self.assertEqual(result["Personal Information"]["surname"], "LEI")
+        self.assertEqual(result["Personal Information"]["nationality"], "China")
+
+    @patch('llm_analysis.llm')
+    @patch('builtins.print')
+    def test_extract_visa_fields_chunked_skips_failed_chunk(self, mock_print, mock_llm):
+        good = Mock()
+        good.content = json.dumps(self.sample_fields)
+        bad = Mock()
+        bad.content = "抱歉，无法识别。"
+        mock_llm.invoke.side_effect = lambda prompt, **kw: bad if "<!-- Page 2 -->" in prompt else good
+        text = "\n\n".join(f"<!-- Page {i} -->\n\n" + "line\n" * 40 for i in (1, 2))
+
+        self.assertEqual(extract_visa_fields_chunked(text, max_chars=250), self.sample_fields)
+
+        mock_llm.invoke.side_effect = lambda prompt, **kw: bad
+        with self.assertRaises(ValueError):
+            extract_visa_fields_chunked(text, max_chars=250)
+
+
 if __name__ == '__main__':
     unittest.main()
 
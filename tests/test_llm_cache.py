@@ -0,0 +1,103 @@
+"""
+Unit tests for llm_cache.py module
+"""
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm_cache import LlmCache, make_llm_cache_key
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestLlmCache(unittest.TestCase):
+    """Test cases for the persistent LLM response cache"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "llm.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _cache(self, **kwargs):
+        cache = LlmCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_key_depends_on_model_temperature_template_and_text(self):
+        base = make_llm_cache_key("gpt-4", 0.4, "template {text}", "input")
+        self.assertEqual(base, make_llm_cache_key("gpt-4", 0.4, "template {text}", "input"))
+        self.assertNotEqual(base, make_llm_cache_key("gpt-4o", 0.4, "template {text}", "input"))
+        self.assertNotEqual(base, make_llm_cache_key("gpt-4", 0.0, "template {text}", "input"))
+        self.assertNotEqual(base, make_llm_cache_key("gpt-4", 0.4, "template v2 {text}", "input"))
+        self.assertNotEqual(base, make_llm_cache_key("gpt-4", 0.4, "template {text}", "input "))
+        self.assertNotEqual(base, make_llm_cache_key("gpt-4", 0.4, "template {text}", "input", section="a"))
+
+    def test_get_put_and_counters(self):
+        cache = self._cache()
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", '{"a": 1}')
+        self.assertEqual(cache.get("k"), '{"a": 1}')
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 1, 1))
+        self.assertEqual(stats["bytes"], len('{"a": 1}'))
+
+    def test_persists_across_instances(self):
+        cache = self._cache()
+        cache.put("k", "响应")
+        cache.close()
+
+        self.assertEqual(self._cache().get("k"), "响应")
+
+    def test_ttl_expiry(self):
+        clock = FakeClock()
+        cache = self._cache(ttl_seconds=60, clock=clock)
+        cache.put("k", "v")
+
+        clock.now += 59
+        self.assertEqual(cache.get("k"), "v")
+        clock.now += 2
+        self.assertIsNone(cache.get("k"))
+
+        stats = cache.stats()
+        self.assertEqual((stats["expired"], stats["misses"], stats["entries"]), (1, 1, 0))
+
+    def test_lru_eviction_by_size(self):
+        clock = FakeClock()
+        cache = self._cache(max_bytes=25, clock=clock)
+        for key in ("a", "b"):
+            cache.put(key, "x" * 10)
+            clock.now += 1
+        cache.get("a")  # "b" is now the least recently used
+        clock.now += 1
+        cache.put("c", "x" * 10)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), "x" * 10)
+        self.assertEqual(cache.get("c"), "x" * 10)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertLessEqual(cache.stats()["bytes"], 25)
+
+    def test_clear(self):
+        cache = self._cache()
+        cache.put("k", "v")
+        cache.clear()
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Unit tests for llm_json.py module
+"""
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from llm_json import extract_json_block, repair_json, parse_llm_json
+
+
+class TestLlmJson(unittest.TestCase):
+    """Test cases for tolerant parsing of LLM JSON output"""
+
+    def test_valid_json_unchanged(self):
+        self.assertEqual(parse_llm_json('{"a": [1, 2], "b": null}'), {"a": [1, 2], "b": None})
+
+    def test_markdown_fence(self):
+        self.assertEqual(parse_llm_json('```json\n{"a": 1}\n```'), {"a": 1})
+        self.assertEqual(parse_llm_json('```\n{"a": 1}\n```'), {"a": 1})
+
+    def test_prose_around_object(self):
+        text = '以下是提取结果：\n{"a": {"b": "}"}}\n如有需要请告诉我。{不是JSON}'
+        self.assertEqual(extract_json_block(text), '{"a": {"b": "}"}}')
+        self.assertEqual(parse_llm_json(text), {"a": {"b": "}"}})
+
+    def test_trailing_commas(self):
+        self.assertEqual(parse_llm_json('{"a": [1, 2,], "b": {"c": 3,},}'), {"a": [1, 2], "b": {"c": 3}})
+
+    def test_python_literals_and_single_quotes(self):
+        self.assertEqual(parse_llm_json("{'a': True, 'b': False, 'c': None, 'd': 'it\\'s \"x\"'}"),
+                         {"a": True, "b": False, "c": None, "d": 'it\'s "x"'})
+
+    def test_comments_removed(self):
+        text = '{\n  "visa_type": "Long Stay (D)",  // choose from the list\n  "phone": null, # extra info\n}'
+        self.assertEqual(parse_llm_json(text), {"visa_type": "Long Stay (D)", "phone": None})
+
+    def test_string_contents_untouched(self):
+        text = '{"url": "http://example.com//a#b", "t": "True, None,]", "s": \'He said "hi"\',}'
+        self.assertEqual(parse_llm_json(text), {"url": "http://example.com//a#b", "t": "True, None,]",
+                                                "s": 'He said "hi"'})
+
+    def test_raw_newline_in_string(self):
+        self.assertEqual(parse_llm_json('{"address": "Line 1\nLine 2",}'), {"address": "Line 1\nLine 2"})
+
+    def test_unrepairable_raises(self):
+        with self.assertRaises(ValueError):
+            parse_llm_json('{"a": 1 "b": 2}')
+        with self.assertRaises(ValueError):
+            parse_llm_json("no json here")
+
+    def test_repair_json_output_is_json(self):
+        self.assertEqual(repair_json("```json\n{'a': None,}\n```"), '{"a": null}')
+
+
+if __name__ == '__main__':
+    unittest.main()
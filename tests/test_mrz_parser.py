@@ -0,0 +1,101 @@
+"""
+Unit tests for mrz_parser.py module
+"""
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from mrz_parser import check_digit, parse_td3, find_mrz, mrz_to_fields
+
+LINE1 = "POCHNLEI<<NANKUN<<<<<<<<<<<<<<<<<<<<<<<<<<<<"
+LINE2 = "EQ59212201CHN9210170M3509087MANHMEMPMAKEA988"
+
+
+class TestMrzParser(unittest.TestCase):
+    """Test cases for TD3 MRZ detection, parsing and check digits"""
+
+    def test_check_digit(self):
+        """Test ICAO 9303 check digits (specimen values from the standard)"""
+        self.assertEqual(check_digit("L898902C3"), "6")
+        self.assertEqual(check_digit("740812"), "2")
+        self.assertEqual(check_digit("120415"), "9")
+        self.assertEqual(check_digit("ZE184226B<<<<<"), "1")
+        self.assertEqual(check_digit("<<<<<<<<<<<<<<"), "0")
+
+    def test_parse_td3_icao_specimen(self):
+        """Test the ICAO specimen passport parses with every check passing"""
+        mrz = parse_td3("P<UTOERIKSSON<<ANNA<MARIA<<<<<<<<<<<<<<<<<<<",
+                        "L898902C36UTO7408122F1204159ZE184226B<<<<<10")
+
+        self.assertTrue(mrz["valid"])
+        self.assertEqual((mrz["surname"], mrz["given_names"]), ("ERIKSSON", "ANNA MARIA"))
+        self.assertEqual(mrz["passport_number"], "L898902C3")
+        self.assertEqual(mrz["date_of_birth"], "1974-08-12")
+        self.assertEqual(mrz["date_of_expiry"], "2012-04-15")
+        self.assertEqual(mrz["sex"], "F")
+        self.assertEqual(mrz["issuing_country"], "UTO")
+
+    def test_find_mrz_in_ocr_text_with_split_first_line(self):
+        """Test line 1 split across OCR lines is re-joined (as in files/passport.pdf.md)"""
+        text = ("签发机关/Authority\nNational Immigration Administration,PRC\n"
+                "POCHNLEI<<NANKUN<<<<<<<<<<<\n<<<<<<<<<<<<<<<<<<<<<<<\n" + LINE2 + "\n\n<!-- Page 2 -->")
+
+        mrz = find_mrz(text)
+
+        self.assertTrue(mrz["valid"])
+        self.assertEqual(mrz["lines"], [LINE1, LINE2])
+        self.assertEqual(mrz["document_code"], "PO")
+        self.assertEqual((mrz["surname"], mrz["given_names"]), ("LEI", "NANKUN"))
+        self.assertEqual(mrz["date_of_birth"], "1992-10-17")
+        self.assertEqual(mrz["date_of_expiry"], "2035-09-08")
+
+    def test_find_mrz_repairs_digits_only_in_numeric_fields(self):
+        """Test O/0 and I/1 confusions in numeric positions are repaired before checking"""
+        mrz = find_mrz(LINE1 + "\n" + "EQ59212201CHN92IO170M35O9087MANHMEMPMAKEA988")
+
+        self.assertTrue(mrz["valid"])
+        self.assertEqual(mrz["date_of_birth"], "1992-10-17")
+        self.assertEqual(mrz["passport_number"], "EQ5921220")
+
+    def test_find_mrz_check_digit_failure(self):
+        """Test a misread passport number is reported, not silently accepted"""
+        mrz = find_mrz(LINE1 + "\n" + "EQ59212281CHN9210170M3509087MANHMEMPMAKEA988")
+
+        self.assertFalse(mrz["valid"])
+        self.assertFalse(mrz["checks"]["passport_number"])
+        self.assertFalse(mrz["checks"]["composite"])
+        self.assertTrue(mrz["checks"]["date_of_birth"])
+
+    def test_find_mrz_absent(self):
+        self.assertIsNone(find_mrz("Dear Visa Officer,\nI am writing to apply for a study visa."))
+
+    def test_find_mrz_without_first_line(self):
+        """Test line 2 alone still yields the checked fields, without names"""
+        mrz = find_mrz("Passport\n" + LINE2)
+
+        self.assertTrue(mrz["valid"])
+        self.assertIsNone(mrz["surname"])
+        self.assertEqual(mrz["nationality"], "CHN")
+
+    def test_mrz_to_fields(self):
+        """Test MRZ fields map onto the Personal / Passport sections"""
+        fields = mrz_to_fields(parse_td3(LINE1, LINE2))
+
+        self.assertEqual(fields["Personal Information"], {
+            "surname": "LEI", "forename": "NANKUN", "date_of_birth": "1992-10-17",
+            "gender": "Male", "nationality": "China"})
+        self.assertEqual(fields["Passport Information"], {
+            "passport_number": "EQ5921220", "date_of_expiry": "2035-09-08", "passport_type": "National Passport"})
+        self.assertEqual(fields["Travel Document Details"]["passport_1"]["passport_number"], "EQ5921220")
+
+    def test_mrz_to_fields_unknown_nationality_code(self):
+        """Test an unlisted nationality code is left empty rather than filled in as a bare code"""
+        mrz = dict(parse_td3(LINE1, LINE2), nationality="XXA")
+        self.assertIsNone(mrz_to_fields(mrz)["Personal Information"]["nationality"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Unit tests for ocr_cache.py module
+"""
+import unittest
+import sys
+import os
+import tempfile
+import shutil
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ocr_cache import OcrCache, make_cache_key
+
+
+class TestOcrCache(unittest.TestCase):
+    """Test cases for the on-disk OCR result cache"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.ocr_json = {"TextDetections": [{"DetectedText": "Line 1"}]}
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_make_cache_key_depends_on_params(self):
+        """Test cache key changes with image bytes, OCR mode, DPI and quality"""
+        base = make_cache_key(b"img", True, 150, 85)
+        self.assertEqual(base, make_cache_key(b"img", True, 150, 85))
+        self.assertNotEqual(base, make_cache_key(b"img2", True, 150, 85))
+        self.assertNotEqual(base, make_cache_key(b"img", False, 150, 85))
+        self.assertNotEqual(base, make_cache_key(b"img", True, 75, 85))
+        self.assertNotEqual(base, make_cache_key(b"img", True, 150, 65))
+
+    def test_get_miss_then_hit(self):
+        """Test a stored entry is returned and counted as a hit"""
+        cache = OcrCache(self.cache_dir)
+        key = make_cache_key(b"img", True, 150, 85)
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, self.ocr_json)
+        self.assertEqual(cache.get(key), self.ocr_json)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "evictions": 0})
+
+    def test_persists_across_instances(self):
+        """Test entries survive a new cache object on the same directory"""
+        key = make_cache_key(b"img", True, 150, 85)
+        OcrCache(self.cache_dir).put(key, self.ocr_json)
+
+        self.assertEqual(OcrCache(self.cache_dir).get(key), self.ocr_json)
+
+    def test_corrupt_entry_is_a_miss(self):
+        """Test an unreadable entry is treated as a miss"""
+        cache = OcrCache(self.cache_dir)
+        key = make_cache_key(b"img", True, 150, 85)
+        cache.put(key, self.ocr_json)
+        cache._path(key).write_text("{not json", encoding="utf-8")
+
+        self.assertIsNone(cache.get(key))
+
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted once over the size cap"""
+        entry_size = len(b'{"TextDetections": [{"DetectedText": "Line 1"}]}')
+        cache = OcrCache(self.cache_dir, max_bytes=entry_size * 2)
+        keys = [make_cache_key(f"img{i}".encode(), True, 150, 85) for i in range(3)]
+
+        cache.put(keys[0], self.ocr_json)
+        cache.put(keys[1], self.ocr_json)
+        # key 1 is older than key 0 after this
+        os.utime(cache._path(keys[0]), (2000, 2000))
+        os.utime(cache._path(keys[1]), (1000, 1000))
+        cache.put(keys[2], self.ocr_json)
+
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[0]), self.ocr_json)
+        self.assertEqual(cache.get(keys[2]), self.ocr_json)
+        self.assertEqual(cache.evictions, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
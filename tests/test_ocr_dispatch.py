@@ -0,0 +1,296 @@
+"""
+Unit tests for ocr_dispatch.py module
+"""
+import unittest
+from unittest.mock import Mock, patch
+import sys
+import os
+import threading
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ocr_dispatch import OcrDispatcher, TokenBucket, is_throttle_error, percentile, HEDGE_MIN_SAMPLES
+
+
+class FakeSdkError(Exception):
+    """Mimics TencentCloudSDKException (code attribute + get_code())"""
+
+    def __init__(self, code, message=""):
+        super().__init__(message or code)
+        self.code = code
+
+    def get_code(self):
+        return self.code
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestIsThrottleError(unittest.TestCase):
+    """Test cases for throttling error classification"""
+
+    def test_throttle_codes(self):
+        self.assertTrue(is_throttle_error(FakeSdkError("RequestLimitExceeded")))
+        self.assertTrue(is_throttle_error(FakeSdkError("RequestLimitExceeded.UinLimitExceeded")))
+        self.assertTrue(is_throttle_error(FakeSdkError(429)))
+
+    def test_other_errors(self):
+        self.assertFalse(is_throttle_error(FakeSdkError("FailedOperation.ImageDecodeFailed")))
+        self.assertFalse(is_throttle_error(ValueError("boom")))
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for the QPS token bucket"""
+
+    def test_burst_then_paced(self):
+        """Test the bucket allows a burst of `capacity` then paces at `rate`"""
+        clock = FakeClock()
+        bucket = TokenBucket(2, clock=clock, sleep=clock.sleep)
+
+        for _ in range(4):
+            bucket.acquire()
+
+        # 2 immediate tokens, then one every 0.5s
+        self.assertAlmostEqual(clock.now, 1.0)
+
+    def test_zero_rate_unlimited(self):
+        """Test rate 0 disables limiting"""
+        sleep = Mock()
+        bucket = TokenBucket(0, sleep=sleep)
+        for _ in range(100):
+            bucket.acquire()
+        sleep.assert_not_called()
+
+
+@patch('builtins.print')
+class TestOcrDispatcher(unittest.TestCase):
+    """Test cases for the throttle-aware OCR dispatcher"""
+
+    def setUp(self):
+        """Set up test fixtures"""
+        self.backend = Mock()
+        self.backend.name = "tencent"
+        self.ocr_json = {"TextDetections": [{"DetectedText": "Line 1"}]}
+        self.sleep = Mock()
+
+    def _dispatcher(self, **kwargs):
+        return OcrDispatcher(self.backend, qps=0, sleep=self.sleep, rng=lambda: 1.0, **kwargs)
+
+    def test_success(self, mock_print):
+        self.backend.recognize.return_value = self.ocr_json
+        dispatcher = self._dispatcher()
+
+        self.assertEqual(dispatcher.recognize("b64"), self.ocr_json)
+        self.backend.recognize.assert_called_once_with("b64", use_accurate=True)
+        self.assertEqual(dispatcher.stats(), {"requests": 1, "throttles": 0, "retries": 0, "fallbacks": 0,
+                                              "hedges_fired": 0, "hedges_won": 0})
+
+    def test_throttle_retries_with_backoff_no_fallback(self, mock_print):
+        """Test throttling is retried on the Accurate endpoint with growing delays"""
+        self.backend.recognize.side_effect = [FakeSdkError("RequestLimitExceeded")] * 2 + [self.ocr_json]
+        dispatcher = self._dispatcher(backoff_base=0.5)
+
+        self.assertEqual(dispatcher.recognize("b64"), self.ocr_json)
+
+        self.assertEqual([c[0][0] for c in self.sleep.call_args_list], [0.5, 1.0])
+        for c in self.backend.recognize.call_args_list:
+            self.assertTrue(c[1]["use_accurate"])
+        self.assertEqual(dispatcher.stats(), {"requests": 3, "throttles": 2, "retries": 2, "fallbacks": 0,
+                                              "hedges_fired": 0, "hedges_won": 0})
+
+    def test_throttle_exhausted_raises(self, mock_print):
+        """Test persistent throttling is raised rather than silently downgraded to Basic"""
+        self.backend.recognize.side_effect = FakeSdkError("RequestLimitExceeded")
+        dispatcher = self._dispatcher(max_retries=2)
+
+        with self.assertRaises(FakeSdkError):
+            dispatcher.recognize("b64")
+
+        self.assertEqual(self.backend.recognize.call_count, 3)
+        self.assertEqual(dispatcher.fallbacks, 0)
+        self.assertEqual(dispatcher.throttles, 3)
+        self.assertEqual(dispatcher.retries, 2)
+
+    def test_backoff_capped(self, mock_print):
+        """Test backoff delay never exceeds backoff_max"""
+        self.backend.recognize.side_effect = [FakeSdkError("RequestLimitExceeded")] * 6 + [self.ocr_json]
+        dispatcher = self._dispatcher(max_retries=6, backoff_base=1.0, backoff_max=4.0)
+
+        dispatcher.recognize("b64")
+
+        self.assertEqual([c[0][0] for c in self.sleep.call_args_list], [1.0, 2.0, 4.0, 4.0, 4.0, 4.0])
+
+    def test_accurate_failure_falls_back_to_basic(self, mock_print):
+        """Test a real Accurate failure falls back to Basic OCR"""
+        self.backend.recognize.side_effect = [FakeSdkError("FailedOperation.OcrFailed"), self.ocr_json]
+        dispatcher = self._dispatcher()
+
+        self.assertEqual(dispatcher.recognize("b64"), self.ocr_json)
+
+        self.assertFalse(self.backend.recognize.call_args_list[1][1]["use_accurate"])
+        self.assertEqual(dispatcher.fallbacks, 1)
+
+    def test_recognize_with_endpoint_reports_fallback(self, mock_print):
+        """Test the endpoint that actually answered is reported"""
+        self.backend.recognize.side_effect = [self.ocr_json, FakeSdkError("FailedOperation.OcrFailed"),
+                                              self.ocr_json, self.ocr_json]
+        dispatcher = self._dispatcher()
+
+        self.assertEqual(dispatcher.recognize_with_endpoint("b64"), (self.ocr_json, "accurate"))
+        self.assertEqual(dispatcher.recognize_with_endpoint("b64"), (self.ocr_json, "basic"))
+        self.assertEqual(dispatcher.recognize_with_endpoint("b64", use_accurate=False), (self.ocr_json, "basic"))
+
+    def test_basic_failure_raises(self, mock_print):
+        """Test a Basic OCR failure is not retried"""
+        self.backend.recognize.side_effect = ValueError("boom")
+        dispatcher = self._dispatcher()
+
+        with self.assertRaises(ValueError):
+            dispatcher.recognize("b64", use_accurate=False)
+        self.assertEqual(self.backend.recognize.call_count, 1)
+
+    def test_recognize_document_retries_throttle_without_fallback(self, mock_print):
+        """Test structured OCR shares throttle retries but never falls back to general OCR"""
+        fields = {"ID": "EQ5921220"}
+        self.backend.recognize_document.side_effect = [FakeSdkError("RequestLimitExceeded"), fields]
+        dispatcher = self._dispatcher()
+
+        self.assertEqual(dispatcher.recognize_document("b64", "passport"), fields)
+        self.backend.recognize_document.assert_called_with("b64", "passport")
+        self.assertEqual(dispatcher.retries, 1)
+
+        self.backend.recognize_document.side_effect = FakeSdkError("FailedOperation.NoPassport")
+        with self.assertRaises(FakeSdkError):
+            dispatcher.recognize_document("b64", "passport")
+        self.backend.recognize.assert_not_called()
+        self.assertEqual(dispatcher.fallbacks, 0)
+
+
+class ScriptedBackend:
+    """Backend whose n-th call waits `delay` seconds (or until `release` is set) then answers"""
+    name = "tencent"
+
+    def __init__(self, *script):
+        self.script = list(script)  # [(delay, result_or_exception), ...]
+        self.calls = []
+        self.release = threading.Event()
+        self.release_on_call = None  # set `release` shortly after this call index starts
+        self._lock = threading.Lock()
+
+    def recognize(self, image_b64, use_accurate=True):
+        with self._lock:
+            delay, result = self.script[len(self.calls)]
+            self.calls.append(use_accurate)
+            if len(self.calls) - 1 == self.release_on_call:
+                threading.Timer(0.02, self.release.set).start()
+        if delay is None:
+            self.release.wait(5)
+        else:
+            self.release.wait(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+@patch('builtins.print')
+class TestOcrHedging(unittest.TestCase):
+    """Test cases for hedged Accurate OCR requests"""
+
+    ACCURATE = {"TextDetections": [{"DetectedText": "accurate"}]}
+    BASIC = {"TextDetections": [{"DetectedText": "basic"}]}
+
+    def _dispatcher(self, backend, hedge="basic", delay=0.05):
+        return OcrDispatcher(backend, qps=0, hedge=hedge, hedge_initial_delay=delay)
+
+    def test_fast_call_not_hedged(self, mock_print):
+        backend = ScriptedBackend((0, self.ACCURATE))
+        dispatcher = self._dispatcher(backend)
+
+        self.assertEqual(dispatcher.recognize("b64"), self.ACCURATE)
+        self.assertEqual(backend.calls, [True])
+        self.assertEqual(dispatcher.hedges_fired, 0)
+
+    def test_stalled_accurate_hedged_with_basic(self, mock_print):
+        """Test a stalled Accurate call is hedged and the Basic result used after the grace period"""
+        backend = ScriptedBackend((None, self.ACCURATE), (0, self.BASIC))
+        dispatcher = self._dispatcher(backend)
+
+        self.assertEqual(dispatcher.recognize_with_endpoint("b64"), (self.BASIC, "basic"))
+        backend.release.set()
+
+        self.assertEqual(backend.calls, [True, False])
+        self.assertEqual((dispatcher.hedges_fired, dispatcher.hedges_won), (1, 1))
+
+    def test_accurate_preferred_within_grace(self, mock_print):
+        """Test an Accurate result arriving shortly after the Basic hedge still wins"""
+        backend = ScriptedBackend((None, self.ACCURATE), (0, self.BASIC))
+        backend.release_on_call = 1
+        dispatcher = self._dispatcher(backend, delay=0.2)
+
+        self.assertEqual(dispatcher.recognize_with_endpoint("b64"), (self.ACCURATE, "accurate"))
+        self.assertEqual((dispatcher.hedges_fired, dispatcher.hedges_won), (1, 0))
+
+    def test_accurate_hedge_first_result_wins(self, mock_print):
+        """Test hedging with a second Accurate request returns whichever finishes first"""
+        backend = ScriptedBackend((None, self.ACCURATE), (0, {"TextDetections": [{"DetectedText": "retry"}]}))
+        dispatcher = self._dispatcher(backend, hedge="accurate")
+
+        result = dispatcher.recognize("b64")
+        backend.release.set()
+
+        self.assertEqual(result["TextDetections"][0]["DetectedText"], "retry")
+        self.assertEqual(backend.calls, [True, True])
+        self.assertEqual(dispatcher.stats()["hedges_won"], 1)
+
+    def test_all_attempts_fail_falls_back(self, mock_print):
+        """Test when the Accurate call and its hedge both fail, the usual Basic fallback runs"""
+        backend = ScriptedBackend((None, FakeSdkError("FailedOperation.OcrFailed")),
+                                  (0, ValueError("hedge failed")), (0, self.BASIC))
+        backend.release_on_call = 1
+        dispatcher = self._dispatcher(backend)
+
+        self.assertEqual(dispatcher.recognize("b64"), self.BASIC)
+        self.assertEqual(dispatcher.fallbacks, 1)
+        self.assertEqual(dispatcher.hedges_won, 0)
+
+    def test_hedge_delay_follows_percentile(self, mock_print):
+        """Test the hedge delay switches from the initial delay to the observed percentile"""
+        dispatcher = self._dispatcher(ScriptedBackend(), delay=3.0)
+        self.assertEqual(dispatcher.hedge_delay(), 3.0)
+
+        dispatcher._accurate_latencies.extend([0.1] * (HEDGE_MIN_SAMPLES - 1) + [2.0])
+        dispatcher.set_hedging("basic", hedge_percentile=90)
+        self.assertEqual(dispatcher.hedge_delay(), 0.1)
+        dispatcher.set_hedging("basic", hedge_percentile=100)
+        self.assertEqual(dispatcher.hedge_delay(), 2.0)
+
+        with self.assertRaises(ValueError):
+            dispatcher.set_hedging("twice")
+
+    def test_latency_percentiles(self, mock_print):
+        backend = ScriptedBackend(*[(0, self.ACCURATE)] * 3)
+        dispatcher = self._dispatcher(backend, hedge=None)
+        self.assertEqual(dispatcher.latency_percentiles()["p99_ms"], None)
+
+        for _ in range(3):
+            dispatcher.recognize("b64")
+
+        stats = dispatcher.latency_percentiles()
+        self.assertEqual(stats["samples"], 3)
+        self.assertGreaterEqual(stats["p99_ms"], stats["p50_ms"])
+        self.assertEqual(percentile([5, 1, 3, 2, 4], 50), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
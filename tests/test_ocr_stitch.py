@@ -0,0 +1,83 @@
+"""
+Unit tests for ocr_stitch.py module
+"""
+import unittest
+from unittest.mock import Mock, patch
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from ocr_stitch import layout_vertical, stitch_images, split_detections, STITCH_GAP
+
+
+def _detection(text, x, y, w=40, h=10):
+    return {"DetectedText": text,
+            "Polygon": [{"X": x, "Y": y}, {"X": x + w, "Y": y}, {"X": x + w, "Y": y + h}, {"X": x, "Y": y + h}]}
+
+
+class TestOcrStitch(unittest.TestCase):
+    """Test cases for page stitching and result splitting"""
+
+    def test_layout_vertical(self):
+        """Test pages are stacked top to bottom with a gap"""
+        size, regions = layout_vertical([(100, 50), (80, 60)], gap=10)
+
+        self.assertEqual(size, (100, 120))
+        self.assertEqual(regions, [(0, 0, 100, 50), (0, 60, 80, 60)])
+
+    @patch('ocr_stitch.Image')
+    def test_stitch_images_pastes_at_regions(self, mock_image):
+        """Test stitch_images pastes every page at its region on a grayscale canvas"""
+        pages = [Mock(mode="L", size=(100, 50)), Mock(mode="1", size=(100, 50))]
+        for page in pages:
+            page.convert.return_value = page
+
+        canvas, regions = stitch_images(pages)
+
+        mock_image.new.assert_called_once_with("L", (100, 100 + STITCH_GAP), "white")
+        pasted = [c[0][1] for c in canvas.paste.call_args_list]
+        self.assertEqual(pasted, [(0, 0), (0, 50 + STITCH_GAP)])
+        pages[1].convert.assert_called_once_with("L")
+
+    def test_split_detections_by_polygon_centre(self):
+        """Test detections go to the page containing their centre, in page coordinates"""
+        regions = [(0, 0, 200, 100), (0, 148, 200, 100)]
+        ocr_json = {
+            "TextDetections": [
+                _detection("front", 10, 20),
+                _detection("back", 10, 160),
+                _detection("front 2", 10, 80),
+            ],
+            "Angle": 0,
+        }
+
+        pages = split_detections(ocr_json, regions)
+
+        self.assertEqual([d["DetectedText"] for d in pages[0]["TextDetections"]], ["front", "front 2"])
+        self.assertEqual([d["DetectedText"] for d in pages[1]["TextDetections"]], ["back"])
+        self.assertEqual(pages[1]["TextDetections"][0]["Polygon"][0], {"X": 10, "Y": 12})
+        self.assertEqual(pages[1]["Angle"], 0)
+        # the stitched result is left untouched
+        self.assertEqual(ocr_json["TextDetections"][1]["Polygon"][0]["Y"], 160)
+
+    def test_split_detections_gap_and_missing_coordinates(self):
+        """Test centres in the gap go to the nearest page and coordinate-less items to the first"""
+        regions = [(0, 0, 200, 100), (0, 148, 200, 100)]
+        ocr_json = {"TextDetections": [
+            _detection("near bottom page", 10, 135, h=6),
+            {"DetectedText": "boxed", "ItemPolygon": {"X": 5, "Y": 150, "Width": 30, "Height": 10}},
+            {"DetectedText": "no coords"},
+        ]}
+
+        pages = split_detections(ocr_json, regions)
+
+        self.assertEqual([d["DetectedText"] for d in pages[0]["TextDetections"]], ["no coords"])
+        self.assertEqual([d["DetectedText"] for d in pages[1]["TextDetections"]],
+                         ["near bottom page", "boxed"])
+        self.assertEqual(pages[1]["TextDetections"][1]["ItemPolygon"]["Y"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,11 @@ import os
 import json
 import base64
 import io
+import threading
+import time
+import tempfile
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 
 # Mock dependencies before importing pdf_to_markdown
 sys.modules['fitz'] = MagicMock()
@@ -28,14 +33,46 @@ from pdf_to_markdown import (
     init_ocr_client,
     image_bytes_to_b64,
     call_ocr_image,
+    call_document_ocr,
     ocr_json_to_markdown,
     render_page_to_jpeg_bytes,
-    ensure_under_limit,
+    pixmap_to_image,
+    extract_text_layer,
+    parse_page_ranges,
+    is_blank_page,
+    select_pages,
+    encode_page_under_limit,
+    b64_size,
+    encode_stitched,
+    ocr_page_cached,
+    get_ocr_dispatcher,
+    TencentOcrBackend,
+    ReplayOcrBackend,
+    RecordingOcrBackend,
+    get_ocr_backend,
+    reset_ocr_backends,
     pdf_to_markdown,
+    iter_pdf_markdown,
+    iter_page_records,
+    convert_pdf_file,
+    sidecar_path_for,
+    encode_image_file,
+    read_sidecar,
+    rerender_markdown_from_sidecar,
+    extract_document_fields,
+    convert_document_fields,
+    convert_folder,
+    OcrCache,
     MAX_B64_BYTES,
     DEFAULT_DPI,
-    MIN_DPI
+    MIN_DPI,
+    DEFAULT_JPEG_QUALITY,
+    MIN_JPEG_QUALITY,
+    JPEG_QUALITY_STEP,
+    MIN_TEXT_LAYER_CHARS,
+    MANIFEST_NAME
 )
+from ocr_dispatch import OcrDispatcher
 
 
 class TestPdfToMarkdown(unittest.TestCase):
@@ -43,6 +80,7 @@ class TestPdfToMarkdown(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures"""
+        reset_ocr_backends()
         self.test_image_bytes = b"fake_image_data"
         self.test_b64 = base64.b64encode(self.test_image_bytes).decode("utf-8")
         self.test_ocr_json = {
@@ -126,6 +164,23 @@ class TestPdfToMarkdown(unittest.TestCase):
         mock_client.GeneralBasicOCR.assert_called_once_with(mock_request)
         self.assertEqual(result, self.test_ocr_json)
 
+    @patch('pdf_to_markdown.models.IDCardOCRRequest')
+    @patch('pdf_to_markdown.models.MLIDPassportOCRRequest')
+    def test_call_document_ocr_routes_by_type(self, mock_passport_req, mock_id_req):
+        """Test passports and ID cards go to their own structured endpoints"""
+        mock_client = Mock()
+        mock_client.MLIDPassportOCR.return_value.to_json_string.return_value = json.dumps({"ID": "EQ5921220"})
+        mock_client.IDCardOCR.return_value.to_json_string.return_value = json.dumps({"IdNum": "440229"})
+
+        self.assertEqual(call_document_ocr(mock_client, self.test_b64, "passport"), {"ID": "EQ5921220"})
+        self.assertEqual(call_document_ocr(mock_client, self.test_b64, "id_card"), {"IdNum": "440229"})
+
+        mock_client.MLIDPassportOCR.assert_called_once_with(mock_passport_req.return_value)
+        mock_client.IDCardOCR.assert_called_once_with(mock_id_req.return_value)
+        mock_client.GeneralAccurateOCR.assert_not_called()
+        with self.assertRaises(ValueError):
+            call_document_ocr(mock_client, self.test_b64, "visa")
+
     def test_ocr_json_to_markdown(self):
         """Test ocr_json_to_markdown conversion"""
         result = ocr_json_to_markdown(self.test_ocr_json)
@@ -156,77 +211,165 @@ class TestPdfToMarkdown(unittest.TestCase):
     @patch('pdf_to_markdown.Image')
     @patch('pdf_to_markdown.fitz')
     def test_render_page_to_jpeg_bytes(self, mock_fitz, mock_image):
-        """Test render_page_to_jpeg_bytes"""
+        """Test render_page_to_jpeg_bytes encodes the pixmap samples directly"""
         # Setup mocks
         mock_doc = Mock()
         mock_page = Mock()
         mock_pixmap = Mock()
-        mock_pixmap.tobytes.return_value = b"png_bytes"
+        mock_pixmap.width = 10
+        mock_pixmap.height = 20
+        mock_pixmap.stride = 30
         mock_page.get_pixmap.return_value = mock_pixmap
         mock_doc.load_page.return_value = mock_page
-        
+
         mock_img = Mock()
-        mock_img.convert.return_value = mock_img
-        mock_image.open.return_value = mock_img
-        
-        mock_buf = io.BytesIO()
-        mock_buf.write(b"jpeg_bytes")
-        mock_buf.seek(0)
-        
-        with patch('pdf_to_markdown.io.BytesIO', return_value=mock_buf):
-            result = render_page_to_jpeg_bytes(mock_doc, 0, dpi=150, jpeg_quality=85)
-        
+        mock_img.save.side_effect = lambda buf, **kw: buf.write(b"jpeg_bytes")
+        mock_image.frombuffer.return_value = mock_img
+
+        result = render_page_to_jpeg_bytes(mock_doc, 0, dpi=150, jpeg_quality=85)
+
         mock_doc.load_page.assert_called_once_with(0)
         mock_page.get_pixmap.assert_called_once()
-        mock_image.open.assert_called_once()
-        mock_img.convert.assert_called_once_with("RGB")
+        mock_image.frombuffer.assert_called_once_with(
+            "RGB", (10, 20), mock_pixmap.samples_mv, "raw", "RGB", 30, 1)
+        # no PNG round-trip
+        mock_pixmap.tobytes.assert_not_called()
+        mock_image.open.assert_not_called()
         mock_img.save.assert_called_once()
+        self.assertEqual(mock_img.save.call_args[1], {"format": "JPEG", "quality": 85})
+        self.assertEqual(result, b"jpeg_bytes")
 
-    @patch('pdf_to_markdown.render_page_to_jpeg_bytes')
-    def test_ensure_under_limit_within_limit(self, mock_render):
-        """Test ensure_under_limit when already within limit"""
-        small_bytes = b"small_image"
-        mock_render.return_value = small_bytes
-        
-        # Mock the b64 encoding to return small size
-        with patch('pdf_to_markdown.image_bytes_to_b64', return_value="small_base64"):
-            result_bytes, result_dpi = ensure_under_limit(small_bytes, DEFAULT_DPI, 0)
-        
-        self.assertEqual(result_bytes, small_bytes)
-        self.assertEqual(result_dpi, DEFAULT_DPI)
+    @patch('pdf_to_markdown.pixmap_to_jpeg_bytes')
+    @patch('pdf_to_markdown.render_page_pixmap')
+    def test_encode_page_under_limit_within_limit(self, mock_pixmap, mock_encode):
+        """Test encode_page_under_limit renders and encodes once when already within limit"""
+        mock_encode.return_value = b"small_image"
 
-    @patch('pdf_to_markdown.render_page_to_jpeg_bytes')
-    @patch('pdf_to_markdown.image_bytes_to_b64')
-    def test_ensure_under_limit_exceeds_limit(self, mock_b64, mock_render):
-        """Test ensure_under_limit when exceeds limit"""
-        large_b64 = "x" * (MAX_B64_BYTES + 1)
-        mock_b64.return_value = large_b64
-        
-        # First call returns large, subsequent calls return small
-        small_bytes = b"small"
-        small_b64 = "small_base64"
-        mock_render.side_effect = [small_bytes, small_bytes]
-        mock_b64.side_effect = [large_b64, small_b64]
-        
-        # Mock doc for re-rendering
-        mock_doc = Mock()
-        with patch('pdf_to_markdown.fitz.open', return_value=mock_doc):
-            # Note: ensure_under_limit requires doc and page_idx, but the function signature
-            # in the code seems incomplete. We'll skip this test or adjust it.
-            # For now, we'll test the logic that can be tested
-            pass
+        result = encode_page_under_limit(Mock(), 0, dpi=DEFAULT_DPI)
 
-    @patch('pdf_to_markdown.render_page_to_jpeg_bytes')
-    @patch('pdf_to_markdown.image_bytes_to_b64')
-    def test_ensure_under_limit_cannot_reduce(self, mock_b64, mock_render):
-        """Test ensure_under_limit when cannot reduce further"""
-        # This test is skipped because ensure_under_limit has incomplete implementation
-        # that references a non-existent function
-        pass
+        self.assertEqual(result, (b"small_image", DEFAULT_DPI, DEFAULT_JPEG_QUALITY))
+        mock_pixmap.assert_called_once()
+        mock_encode.assert_called_once()
+
+    @patch('pdf_to_markdown.pixmap_to_jpeg_bytes')
+    @patch('pdf_to_markdown.render_page_pixmap')
+    def test_encode_page_under_limit_accumulates_timings(self, mock_pixmap, mock_encode):
+        """Test render / encode time is added to a caller-supplied timings dict"""
+        mock_encode.return_value = b"small_image"
+        timings = {"render_ms": 5.0}
+
+        encode_page_under_limit(Mock(), 0, timings=timings)
+
+        self.assertEqual(sorted(timings), ["encode_ms", "render_ms"])
+        self.assertGreaterEqual(timings["render_ms"], 5.0)
+        self.assertGreaterEqual(timings["encode_ms"], 0.0)
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.pixmap_to_jpeg_bytes')
+    @patch('pdf_to_markdown.render_page_pixmap')
+    def test_encode_page_under_limit_bisects_quality(self, mock_pixmap, mock_encode, mock_print):
+        """Test encode_page_under_limit keeps DPI and finds the highest fitting quality"""
+        # raw size grows linearly with quality; only quality <= 60 fits
+        limit = 600
+        mock_encode.side_effect = lambda pix, q: b"x" * (q * 7)
+
+        img_bytes, used_dpi, used_quality = encode_page_under_limit(
+            Mock(), 0, dpi=DEFAULT_DPI, max_b64_bytes=limit)
+
+        mock_pixmap.assert_called_once()  # rendered once, only re-encoded
+        self.assertEqual(used_dpi, DEFAULT_DPI)
+        self.assertLessEqual(b64_size(len(img_bytes)), limit)
+        self.assertGreater(used_quality, 60 - JPEG_QUALITY_STEP - 1)
+        self.assertLessEqual(mock_encode.call_count, 2 + 4)
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.pixmap_to_jpeg_bytes')
+    @patch('pdf_to_markdown.render_page_pixmap')
+    def test_encode_page_under_limit_predicts_dpi(self, mock_pixmap, mock_encode, mock_print):
+        """Test encode_page_under_limit predicts a lower DPI in one step when quality is not enough"""
+        # JPEG size ~ dpi^2 * quality
+        mock_pixmap.side_effect = lambda doc, idx, dpi, **kw: dpi
+        mock_encode.side_effect = lambda dpi, q: b"x" * (dpi * dpi * q // 100)
+        limit = b64_size(100 * 100 * MIN_JPEG_QUALITY // 100)
+
+        img_bytes, used_dpi, used_quality = encode_page_under_limit(
+            Mock(), 0, dpi=300, max_b64_bytes=limit)
+
+        rendered_dpis = [c[1]['dpi'] for c in mock_pixmap.call_args_list]
+        self.assertEqual(len(rendered_dpis), 2)
+        self.assertEqual(rendered_dpis[0], 300)
+        self.assertLess(used_dpi, 100)
+        self.assertGreater(used_dpi, 90)
+        self.assertLessEqual(b64_size(len(img_bytes)), limit)
+
+    @patch('pdf_to_markdown.Image')
+    def test_pixmap_to_image_grayscale(self, mock_image):
+        """Test single-channel pixmaps are wrapped as mode L, not RGB"""
+        pix = Mock(width=10, height=20, stride=10, n=1)
+
+        pixmap_to_image(pix)
+
+        mock_image.frombuffer.assert_called_once_with("L", (10, 20), pix.samples_mv, "raw", "L", 10, 1)
+
+    @patch('pdf_to_markdown.pixmap_to_binary_png_bytes')
+    @patch('pdf_to_markdown.pixmap_to_jpeg_bytes')
+    @patch('pdf_to_markdown.render_page_pixmap')
+    def test_encode_page_under_limit_gray_and_binary(self, mock_pixmap, mock_jpeg, mock_png):
+        """Test gray renders a grayscale JPEG and binary a thresholded PNG with no JPEG quality"""
+        mock_jpeg.return_value = b"gray_jpeg"
+        mock_png.return_value = b"bilevel_png"
+
+        gray = encode_page_under_limit(Mock(), 0, dpi=DEFAULT_DPI, encoding="gray")
+        self.assertEqual(gray, (b"gray_jpeg", DEFAULT_DPI, DEFAULT_JPEG_QUALITY))
+        self.assertTrue(mock_pixmap.call_args[1]["gray"])
+
+        binary = encode_page_under_limit(Mock(), 0, dpi=DEFAULT_DPI, encoding="binary")
+        self.assertEqual(binary, (b"bilevel_png", DEFAULT_DPI, None))
+        self.assertTrue(mock_pixmap.call_args[1]["gray"])
+        mock_jpeg.assert_called_once()  # only for the gray page
+
+        with self.assertRaises(ValueError):
+            encode_page_under_limit(Mock(), 0, encoding="cmyk")
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.pixmap_to_binary_png_bytes')
+    @patch('pdf_to_markdown.pixmap_to_jpeg_bytes')
+    @patch('pdf_to_markdown.render_page_pixmap')
+    def test_encode_page_under_limit_binary_shrinks_dpi(self, mock_pixmap, mock_jpeg, mock_png, mock_print):
+        """Test an oversized binary page goes straight to a lower DPI"""
+        mock_pixmap.side_effect = lambda doc, idx, dpi, **kw: dpi
+        mock_png.side_effect = lambda dpi, used_dpi: b"x" * (dpi * dpi)
+        limit = b64_size(100 * 100)
+
+        img_bytes, used_dpi, used_quality = encode_page_under_limit(
+            Mock(), 0, dpi=300, max_b64_bytes=limit, encoding="binary")
+
+        self.assertLessEqual(used_dpi, 100)
+        self.assertIsNone(used_quality)
+        self.assertLessEqual(b64_size(len(img_bytes)), limit)
+        mock_jpeg.assert_not_called()
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.pixmap_to_jpeg_bytes')
+    @patch('pdf_to_markdown.render_page_pixmap')
+    def test_encode_page_under_limit_cannot_reduce(self, mock_pixmap, mock_encode, mock_print):
+        """Test encode_page_under_limit raises when even MIN_DPI at MIN_JPEG_QUALITY is too large"""
+        mock_encode.return_value = b"x" * MAX_B64_BYTES
+
+        with self.assertRaises(RuntimeError) as context:
+            encode_page_under_limit(Mock(), 0, dpi=DEFAULT_DPI)
+        self.assertIn("超过 7MB", str(context.exception))
+        self.assertEqual(mock_pixmap.call_args_list[-1][1]['dpi'], MIN_DPI)
+
+        with self.assertRaises(RuntimeError) as context:
+            encode_page_under_limit(Mock(), 0, dpi=DEFAULT_DPI, max_b64_bytes=600)
+        self.assertIn("超过 600 bytes", str(context.exception))
+
+        self.assertIn("bytes > 600 bytes", str(mock_print.call_args_list))
 
     @patch('pdf_to_markdown.init_ocr_client')
     @patch('pdf_to_markdown.fitz.open')
-    @patch('pdf_to_markdown.render_page_to_jpeg_bytes')
+    @patch('pdf_to_markdown.encode_page_under_limit')
     @patch('pdf_to_markdown.image_bytes_to_b64')
     @patch('pdf_to_markdown.call_ocr_image')
     @patch('pdf_to_markdown.ocr_json_to_markdown')
@@ -240,9 +383,10 @@ class TestPdfToMarkdown(unittest.TestCase):
         
         mock_doc = Mock()
         mock_doc.page_count = 2
+        mock_doc.load_page.return_value.get_text.return_value = ""
         mock_fitz_open.return_value = mock_doc
         
-        mock_render.return_value = b"image_bytes"
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
         mock_b64.return_value = "base64_string"
         
         mock_call_ocr.return_value = self.test_ocr_json
@@ -258,7 +402,7 @@ class TestPdfToMarkdown(unittest.TestCase):
 
     @patch('pdf_to_markdown.init_ocr_client')
     @patch('pdf_to_markdown.fitz.open')
-    @patch('pdf_to_markdown.render_page_to_jpeg_bytes')
+    @patch('pdf_to_markdown.encode_page_under_limit')
     @patch('pdf_to_markdown.image_bytes_to_b64')
     @patch('pdf_to_markdown.call_ocr_image')
     @patch('pdf_to_markdown.ocr_json_to_markdown')
@@ -273,9 +417,10 @@ class TestPdfToMarkdown(unittest.TestCase):
         
         mock_doc = Mock()
         mock_doc.page_count = 1
+        mock_doc.load_page.return_value.get_text.return_value = ""
         mock_fitz_open.return_value = mock_doc
         
-        mock_render.return_value = b"image_bytes"
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
         mock_b64.return_value = "base64_string"
         
         # First call (accurate) fails, second call (basic) succeeds
@@ -292,55 +437,16 @@ class TestPdfToMarkdown(unittest.TestCase):
 
     @patch('pdf_to_markdown.init_ocr_client')
     @patch('pdf_to_markdown.fitz.open')
-    @patch('pdf_to_markdown.render_page_to_jpeg_bytes')
-    @patch('pdf_to_markdown.image_bytes_to_b64')
-    def test_pdf_to_markdown_large_image_reduces_dpi(self, mock_b64, mock_render, 
-                                                     mock_fitz_open, mock_init_client):
-        """Test pdf_to_markdown reduces DPI when image is too large"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_init_client.return_value = mock_client
-        
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_pdf_to_markdown_image_still_too_large(self, mock_render, mock_fitz_open,
+                                                   mock_init_client):
+        """Test pdf_to_markdown propagates the error when a page cannot be shrunk enough"""
         mock_doc = Mock()
         mock_doc.page_count = 1
+        mock_doc.load_page.return_value.get_text.return_value = ""
         mock_fitz_open.return_value = mock_doc
-        
-        # First render returns large image, subsequent renders return smaller
-        large_b64 = "x" * (MAX_B64_BYTES + 1)
-        small_b64 = "small_base64"
-        mock_b64.side_effect = [large_b64, small_b64]
-        mock_render.side_effect = [b"large_image", b"small_image"]
-        
-        mock_call_ocr = Mock(return_value=self.test_ocr_json)
-        mock_ocr_to_md = Mock(return_value="Extracted text")
-        
-        with patch('pdf_to_markdown.call_ocr_image', mock_call_ocr), \
-             patch('pdf_to_markdown.ocr_json_to_markdown', mock_ocr_to_md):
-            result = pdf_to_markdown("test.pdf", dpi=DEFAULT_DPI, use_accurate=True)
-        
-        # Should have rendered twice (once with high DPI, once with lower)
-        self.assertGreaterEqual(mock_render.call_count, 2)
+        mock_render.side_effect = RuntimeError("第 1 页图像经过压缩仍然超过 7MB")
 
-    @patch('pdf_to_markdown.init_ocr_client')
-    @patch('pdf_to_markdown.fitz.open')
-    @patch('pdf_to_markdown.render_page_to_jpeg_bytes')
-    @patch('pdf_to_markdown.image_bytes_to_b64')
-    def test_pdf_to_markdown_image_still_too_large(self, mock_b64, mock_render, 
-                                                   mock_fitz_open, mock_init_client):
-        """Test pdf_to_markdown raises error when image still too large after reduction"""
-        # Setup mocks
-        mock_client = Mock()
-        mock_init_client.return_value = mock_client
-        
-        mock_doc = Mock()
-        mock_doc.page_count = 1
-        mock_fitz_open.return_value = mock_doc
-        
-        # Always returns large image even after reduction
-        large_b64 = "x" * (MAX_B64_BYTES + 1)
-        mock_b64.return_value = large_b64
-        mock_render.return_value = b"large_image"
-        
         with self.assertRaises(RuntimeError) as context:
             pdf_to_markdown("test.pdf", dpi=DEFAULT_DPI, use_accurate=True)
         self.assertIn("超过 7MB", str(context.exception))
@@ -355,6 +461,7 @@ class TestPdfToMarkdown(unittest.TestCase):
         
         mock_doc = Mock()
         mock_doc.page_count = 0
+        mock_doc.load_page.return_value.get_text.return_value = ""
         mock_fitz_open.return_value = mock_doc
         
         result = pdf_to_markdown("empty.pdf", dpi=DEFAULT_DPI, use_accurate=True)
@@ -362,6 +469,891 @@ class TestPdfToMarkdown(unittest.TestCase):
         self.assertEqual(result, "")
 
 
+    def test_get_ocr_dispatcher_shared_per_backend(self):
+        """Test one dispatcher (one QPS bucket) is shared per backend in a process"""
+        dispatcher = get_ocr_dispatcher("offline")
+
+        self.assertIs(get_ocr_dispatcher("offline"), dispatcher)
+        self.assertIs(dispatcher.backend, get_ocr_backend("offline"))
+        self.assertIs(get_ocr_dispatcher(dispatcher), dispatcher)
+        get_ocr_dispatcher("offline", qps=2.5)
+        self.assertEqual(dispatcher.bucket.rate, 2.5)
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_tencent_backend_reuses_client(self, mock_call_ocr, mock_init_client):
+        """Test the shared Tencent backend builds its client once, on first use"""
+        mock_call_ocr.return_value = self.test_ocr_json
+        backend = get_ocr_backend("tencent")
+        mock_init_client.assert_not_called()
+
+        backend.recognize(self.test_b64)
+        get_ocr_backend("tencent").recognize(self.test_b64, use_accurate=False)
+
+        self.assertIs(get_ocr_backend("tencent"), backend)
+        self.assertIsInstance(backend, TencentOcrBackend)
+        mock_init_client.assert_called_once()
+        mock_call_ocr.assert_called_with(mock_init_client.return_value, self.test_b64, use_accurate=False)
+
+    def test_get_ocr_backend_unknown(self):
+        """Test get_ocr_backend rejects unknown backend names"""
+        with self.assertRaises(ValueError):
+            get_ocr_backend("nope")
+
+    def test_replay_backend_fixture_and_synthetic(self):
+        """Test the offline backend replays recorded fixtures and synthesizes the rest"""
+        fixture_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, fixture_dir, True)
+        inner = Mock()
+        inner.name = "tencent"
+        inner.recognize.return_value = self.test_ocr_json
+
+        recorder = RecordingOcrBackend(inner, fixture_dir)
+        self.assertEqual(recorder.recognize(self.test_b64), self.test_ocr_json)
+
+        replay = ReplayOcrBackend(fixture_dir)
+        self.assertEqual(replay.recognize(self.test_b64), self.test_ocr_json)
+        other = replay.recognize(base64.b64encode(b"unseen").decode())
+        self.assertIn("offline OCR", other["TextDetections"][0]["DetectedText"])
+        self.assertEqual(replay.calls, 2)
+
+    def test_replay_backend_structured_fixture_and_synthetic(self):
+        """Test structured OCR is recorded per doc type and synthesized when unseen"""
+        fixture_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, fixture_dir, True)
+        inner = Mock()
+        inner.recognize_document.return_value = {"ID": "EQ5921220"}
+
+        RecordingOcrBackend(inner, fixture_dir).recognize_document(self.test_b64, "passport")
+        self.assertTrue(any(name.endswith(".passport.json") for name in os.listdir(fixture_dir)))
+
+        replay = ReplayOcrBackend(fixture_dir)
+        self.assertEqual(replay.recognize_document(self.test_b64, "passport"), {"ID": "EQ5921220"})
+        card = replay.recognize_document(self.test_b64, "id_card")
+        self.assertEqual(card["Name"], "离线测试")
+        with self.assertRaises(ValueError):
+            replay.recognize_document(self.test_b64, "visa")
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.call_ocr_image')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_pdf_to_markdown_offline_backend(self, mock_render, mock_fitz_open,
+                                             mock_call_ocr, mock_init_client):
+        """Test the pipeline runs on the offline backend without touching Tencent"""
+        mock_doc = Mock()
+        mock_doc.page_count = 2
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+
+        result = pdf_to_markdown("test.pdf", backend="offline")
+
+        self.assertEqual(result.count("offline OCR"), 2)
+        mock_init_client.assert_not_called()
+        mock_call_ocr.assert_not_called()
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.extract_text_layer')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_iter_page_records_carry_timings(self, mock_render, mock_fitz_open, mock_text_layer, mock_print):
+        """Test OCR'd page records report render / encode time and image size; text pages report none"""
+        mock_doc = Mock()
+        mock_doc.page_count = 2
+        mock_fitz_open.return_value = mock_doc
+        mock_text_layer.side_effect = ["Dear Sir", ""]
+
+        def render(doc, idx, timings=None, **kw):
+            timings["render_ms"] += 12.0
+            timings["encode_ms"] += 3.0
+            return b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY
+        mock_render.side_effect = render
+
+        records = list(iter_page_records("test.pdf", backend="offline"))
+
+        self.assertEqual(records[0]["timings"], {})
+        self.assertEqual(records[1]["timings"], {"render_ms": 12.0, "encode_ms": 3.0,
+                                                 "image_bytes": len(b"image_bytes")})
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_pdf_to_markdown_concurrent_keeps_page_order(self, mock_render, mock_fitz_open,
+                                                         mock_init_client):
+        """Test pages OCR'd concurrently are reassembled in page order"""
+        mock_doc = Mock()
+        mock_doc.page_count = 4
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        mock_render.side_effect = lambda doc, idx, **kw: (f"page{idx}".encode(), DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def fake_ocr(client, b64, use_accurate=True):
+            text = base64.b64decode(b64).decode()
+            with lock:
+                active.append(text)
+                peak.append(len(active))
+            # earlier pages finish last
+            time.sleep(0.02 * (4 - int(text[-1])))
+            with lock:
+                active.remove(text)
+            return {"TextDetections": [{"DetectedText": text}]}
+
+        with patch('pdf_to_markdown.call_ocr_image', side_effect=fake_ocr):
+            result = pdf_to_markdown("test.pdf", max_workers=4)
+
+        positions = [result.index(f"<!-- Page {i} -->") for i in range(1, 5)]
+        self.assertEqual(positions, sorted(positions))
+        for i in range(4):
+            self.assertIn(f"<!-- Page {i+1} -->\n\npage{i}", result)
+        self.assertGreater(max(peak), 1)
+        self.assertLessEqual(max(peak), 4)
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_pdf_to_markdown_shared_executor(self, mock_call_ocr, mock_render,
+                                             mock_fitz_open, mock_init_client):
+        """Test pdf_to_markdown uses a caller-provided executor and leaves it open"""
+        mock_doc = Mock()
+        mock_doc.page_count = 3
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+        mock_call_ocr.return_value = self.test_ocr_json
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            result = pdf_to_markdown("test.pdf", executor=pool)
+            # executor still usable after the call
+            self.assertEqual(pool.submit(lambda: 1).result(), 1)
+
+        self.assertEqual(mock_call_ocr.call_count, 3)
+        self.assertIn("<!-- Page 3 -->", result)
+
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_pdf_to_markdown_repeat_run_uses_cache(self, mock_call_ocr, mock_render,
+                                                   mock_fitz_open, mock_init_client):
+        """Test a repeat run with an OCR cache makes no OCR calls and creates no client"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        mock_doc = Mock()
+        mock_doc.page_count = 2
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        mock_render.side_effect = lambda doc, idx, **kw: (f"page{idx}".encode(), DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+        mock_call_ocr.return_value = self.test_ocr_json
+
+        first = pdf_to_markdown("test.pdf", cache=OcrCache(cache_dir))
+        self.assertEqual(mock_call_ocr.call_count, 2)
+        self.assertEqual(mock_init_client.call_count, 1)
+
+        mock_call_ocr.reset_mock()
+        mock_init_client.reset_mock()
+        second = pdf_to_markdown("test.pdf", cache=OcrCache(cache_dir))
+
+        self.assertEqual(first, second)
+        mock_call_ocr.assert_not_called()
+        mock_init_client.assert_not_called()
+
+        # same bytes under another encoding are a different cache entry
+        pdf_to_markdown("test.pdf", cache=OcrCache(cache_dir), encoding="gray")
+        self.assertEqual(mock_call_ocr.call_count, 2)
+        self.assertEqual(mock_render.call_args[1]["encoding"], "gray")
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_basic_fallback_result_not_cached_as_accurate(self, mock_call_ocr, mock_render,
+                                                          mock_fitz_open, mock_init_client, mock_print):
+        """Test a Basic fallback result is used but not cached, so the next run retries Accurate"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        mock_doc = Mock()
+        mock_doc.page_count = 1
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"page0", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+        basic = {"TextDetections": [{"DetectedText": "basic"}]}
+        accurate = {"TextDetections": [{"DetectedText": "accurate"}]}
+        mock_call_ocr.side_effect = [Exception("Accurate OCR failed"), basic]
+
+        self.assertIn("basic", pdf_to_markdown("test.pdf", cache=OcrCache(cache_dir)))
+
+        mock_call_ocr.reset_mock(side_effect=True)
+        mock_call_ocr.return_value = accurate
+        self.assertIn("accurate", pdf_to_markdown("test.pdf", cache=OcrCache(cache_dir)))
+        mock_call_ocr.assert_called_once()
+        self.assertTrue(mock_call_ocr.call_args[1]["use_accurate"])
+
+        # the Accurate result is cached as usual
+        mock_call_ocr.reset_mock()
+        self.assertIn("accurate", pdf_to_markdown("test.pdf", cache=OcrCache(cache_dir)))
+        mock_call_ocr.assert_not_called()
+
+
+    @patch('builtins.print')
+    def test_basic_hedge_result_not_cached_as_accurate(self, mock_print):
+        """Test a Basic hedge that wins over a stalled Accurate call is not cached under the Accurate key"""
+        release = threading.Event()
+        basic = {"TextDetections": [{"DetectedText": "basic"}]}
+        accurate = {"TextDetections": [{"DetectedText": "accurate"}]}
+
+        class StalledAccurate:
+            name = "tencent"
+
+            def recognize(self, image_b64, use_accurate=True):
+                if use_accurate:
+                    release.wait(5)
+                    return accurate
+                return basic
+
+        self.addCleanup(release.set)
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        cache = OcrCache(cache_dir)
+        dispatcher = OcrDispatcher(StalledAccurate(), qps=0, hedge="basic", hedge_initial_delay=0.02)
+
+        self.assertEqual(ocr_page_cached(dispatcher, "b64", cache=cache, cache_key="k"), basic)
+        self.assertEqual(dispatcher.hedges_won, 1)
+        self.assertIsNone(cache.get("k"))
+
+        release.set()
+        self.assertEqual(ocr_page_cached(dispatcher, "b64", cache=cache, cache_key="k"), accurate)
+        self.assertEqual(cache.get("k"), accurate)
+
+    @patch('pdf_to_markdown.stitch_images')
+    @patch('pdf_to_markdown.Image')
+    def test_encode_stitched_keeps_page_quality(self, mock_image, mock_stitch_images):
+        """Test the canvas is encoded at the highest page quality, not a fixed default"""
+        canvas = Mock()
+        mock_stitch_images.return_value = (canvas, [(0, 0, 10, 10), (0, 58, 10, 10)])
+
+        encode_stitched([b"a", b"b"], "rgb", qualities=[62, 93])
+        self.assertEqual(canvas.save.call_args[1]["quality"], 93)
+
+        encode_stitched([b"a", b"b"], "gray")
+        self.assertEqual(canvas.save.call_args[1]["quality"], DEFAULT_JPEG_QUALITY)
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_stitched')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_pdf_to_markdown_stitches_small_pages(self, mock_call_ocr, mock_render, mock_stitch,
+                                                  mock_fitz_open, mock_init_client):
+        """Test consecutive small pages share one OCR call and results are split back per page"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        card = Mock()
+        card.get_text.return_value = ""
+        card.rect.width, card.rect.height = 243, 153  # ID card
+        a4 = Mock()
+        a4.get_text.return_value = ""
+        a4.rect.width, a4.rect.height = 595, 842
+        mock_doc = Mock()
+        mock_doc.page_count = 3
+        mock_doc.load_page.side_effect = lambda idx: a4 if idx == 2 else card
+        mock_fitz_open.return_value = mock_doc
+        mock_render.side_effect = lambda doc, idx, **kw: (f"page{idx}".encode(), DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+        mock_stitch.return_value = (b"canvas", [(0, 0, 507, 319), (0, 367, 507, 319)])
+
+        def fake_ocr(client, b64, use_accurate=True):
+            if base64.b64decode(b64) == b"canvas":
+                return {"TextDetections": [
+                    {"DetectedText": "front", "Polygon": [{"X": 10, "Y": 10}, {"X": 90, "Y": 30}]},
+                    {"DetectedText": "back", "Polygon": [{"X": 10, "Y": 400}, {"X": 90, "Y": 420}]},
+                ]}
+            return {"TextDetections": [{"DetectedText": "letter"}]}
+
+        mock_call_ocr.side_effect = fake_ocr
+        result = pdf_to_markdown("id_card.pdf", stitch=True, cache=OcrCache(cache_dir))
+
+        self.assertEqual(mock_call_ocr.call_count, 2)  # pages 1+2 stitched, page 3 alone
+        self.assertEqual(mock_stitch.call_args[0][0], [b"page0", b"page1"])
+        self.assertEqual(mock_stitch.call_args[1]["qualities"], [DEFAULT_JPEG_QUALITY] * 2)
+        self.assertEqual(result, "<!-- Page 1 -->\n\nfront\n\n<!-- Page 2 -->\n\nback"
+                                 "\n\n<!-- Page 3 -->\n\nletter")
+
+        # split results were cached per page, so an unstitched run makes no calls
+        mock_call_ocr.reset_mock()
+        self.assertEqual(pdf_to_markdown("id_card.pdf", cache=OcrCache(cache_dir)), result)
+        mock_call_ocr.assert_not_called()
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    @patch('pdf_to_markdown.Image')
+    def test_pdf_to_markdown_image_sent_unchanged(self, mock_image, mock_call_ocr, mock_render,
+                                                  mock_fitz_open, mock_init_client):
+        """Test a JPG scan that fits the limit is OCR'd from its original bytes without rendering"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        image_path = os.path.join(workdir, "passport.JPG")
+        with open(image_path, "wb") as f:
+            f.write(b"\xff\xd8 original jpeg")
+        mock_image.open.return_value.size = (1200, 800)
+        mock_call_ocr.return_value = self.test_ocr_json
+
+        result = pdf_to_markdown(image_path)
+
+        self.assertEqual(result, "<!-- Page 1 -->\n\nLine 1\nLine 2\nLine 3")
+        self.assertEqual(mock_call_ocr.call_args[0][1], base64.b64encode(b"\xff\xd8 original jpeg").decode())
+        mock_fitz_open.assert_not_called()
+        mock_render.assert_not_called()
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.Image')
+    def test_encode_image_file_reencodes_when_needed(self, mock_image, mock_render, mock_fitz_open, mock_print):
+        """Test oversized or over-wide scans, and gray/binary requests, are re-encoded at native resolution"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        image_path = os.path.join(workdir, "id_card.png")
+        with open(image_path, "wb") as f:
+            f.write(b"x" * 300)
+        mock_image.open.return_value.size = (600, 400)
+        mock_fitz_open.return_value.load_page.return_value.rect.width = 288  # 150 dpi image
+        mock_render.return_value = (b"small", 150, DEFAULT_JPEG_QUALITY)
+
+        self.assertEqual(encode_image_file(image_path), (b"x" * 300, None, None))
+        mock_fitz_open.assert_not_called()
+
+        self.assertEqual(encode_image_file(image_path, max_b64_bytes=100), (b"small", 150, DEFAULT_JPEG_QUALITY))
+        self.assertEqual(mock_render.call_args[1]["dpi"], 150)
+        encode_image_file(image_path, encoding="gray")
+        self.assertEqual(mock_render.call_args[1]["encoding"], "gray")
+
+        mock_image.open.return_value.size = (20000, 400)
+        mock_fitz_open.return_value.load_page.return_value.rect.width = 9600
+        encode_image_file(image_path)
+        self.assertEqual(mock_render.call_args[1]["dpi"], 75)  # 10000 px wide
+        mock_fitz_open.return_value.close.assert_called()
+
+    def test_extract_text_layer_digital_page(self):
+        """Test extract_text_layer returns cleaned lines for a born-digital page"""
+        mock_doc = Mock()
+        body = "Dear Visa Officer, I am writing to apply for an Irish study visa."
+        mock_doc.load_page.return_value.get_text.return_value = f"  Cover Letter  \n\n{body}\n"
+
+        result = extract_text_layer(mock_doc, 0)
+
+        mock_doc.load_page.assert_called_once_with(0)
+        self.assertEqual(result, f"Cover Letter\n{body}")
+
+    def test_extract_text_layer_too_little_text(self):
+        """Test extract_text_layer ignores pages with only a few stray characters"""
+        mock_doc = Mock()
+        mock_doc.load_page.return_value.get_text.return_value = "x " * (MIN_TEXT_LAYER_CHARS - 1)
+
+        self.assertEqual(extract_text_layer(mock_doc, 0), "")
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_pdf_to_markdown_text_layer_skips_ocr(self, mock_call_ocr, mock_render,
+                                                  mock_fitz_open, mock_init_client):
+        """Test digital pages use the text layer and only scanned pages are OCR'd"""
+        digital_text = "Born digital offer letter text " * 3
+        pages = {0: Mock(), 1: Mock()}
+        pages[0].get_text.return_value = digital_text
+        pages[1].get_text.return_value = ""
+        mock_doc = Mock()
+        mock_doc.page_count = 2
+        mock_doc.load_page.side_effect = lambda idx: pages[idx]
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+        mock_call_ocr.return_value = self.test_ocr_json
+
+        report = {}
+        result = pdf_to_markdown("test.pdf", report=report)
+
+        self.assertIn("<!-- Page 1 -->\n\n" + digital_text.strip(), result)
+        self.assertIn("<!-- Page 2 -->\n\nLine 1", result)
+        self.assertEqual(mock_render.call_count, 1)
+        self.assertEqual(mock_call_ocr.call_count, 1)
+        self.assertEqual(report["pages"], [{"page": 1, "source": "text"},
+                                           {"page": 2, "source": "ocr"}])
+
+    def test_parse_page_ranges(self):
+        """Test page-range specs become sorted 0-based indexes clipped to the document"""
+        self.assertEqual(parse_page_ranges("1-3,7", 10), [0, 1, 2, 6])
+        self.assertEqual(parse_page_ranges("9-, 2,2", 11), [1, 8, 9, 10])
+        self.assertEqual(parse_page_ranges("5-20", 6), [4, 5])
+        self.assertEqual(parse_page_ranges("12", 6), [])
+        for bad in ("0", "3-2", "a", "1-b"):
+            with self.assertRaises(ValueError):
+                parse_page_ranges(bad, 10)
+
+    @patch('pdf_to_markdown.pixmap_to_image')
+    def test_is_blank_page_compares_ink_to_paper(self, mock_to_image):
+        """Test a page is blank when almost nothing is darker than its own paper"""
+        doc = Mock()
+        doc.load_page.return_value.get_text.return_value = ""
+        pix = doc.load_page.return_value.get_pixmap.return_value
+        pix.width, pix.height = 100, 100
+        tinted_paper = [0] * 256
+        tinted_paper[230] = 10000
+        mock_to_image.return_value.histogram.return_value = tinted_paper
+        self.assertTrue(is_blank_page(doc, 0))
+
+        one_line = [0] * 256
+        one_line[255], one_line[150] = 9900, 100
+        mock_to_image.return_value.histogram.return_value = one_line
+        self.assertFalse(is_blank_page(doc, 0))
+
+        doc.load_page.return_value.get_text.return_value = "Page 3"
+        self.assertFalse(is_blank_page(doc, 0))
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.is_blank_page')
+    def test_select_pages_blank_and_keywords(self, mock_blank, mock_print):
+        """Test the first pass drops blank pages and text pages without a keyword, keeping scans"""
+        texts = {0: "Closing Balance 100", 1: "", 2: "Terms and conditions", 3: ""}
+        doc = Mock()
+        doc.load_page.side_effect = lambda i: Mock(get_text=Mock(return_value=texts[i]))
+        mock_blank.side_effect = lambda d, i: i == 3
+
+        kept = select_pages(doc, [0, 1, 2, 3], skip_blank=True, keywords=["balance"])
+
+        self.assertEqual(kept, [0, 1])
+        self.assertEqual(select_pages(doc, [0, 2]), [0, 2])
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_iter_page_records_page_selection(self, mock_render, mock_fitz_open, mock_print):
+        """Test only selected pages are loaded and rendered, keeping their original page markers"""
+        mock_doc = Mock()
+        mock_doc.page_count = 120
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+
+        records = list(iter_page_records("statement.pdf", pages="2,5-6,200", backend="offline"))
+
+        self.assertEqual([r["page"] for r in records], [1, 4, 5])
+        self.assertTrue(records[1]["markdown"].startswith("<!-- Page 5 -->"))
+        self.assertEqual([c[0][1] for c in mock_render.call_args_list], [1, 4, 5])
+        self.assertEqual(sorted({c[0][0] for c in mock_doc.load_page.call_args_list}), [1, 4, 5])
+        # resuming after page 5 only keeps the later selected pages
+        records = list(iter_page_records("statement.pdf", pages=[5, 1, 4], start_page=5, backend="offline"))
+        self.assertEqual([r["page"] for r in records], [5])
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_pdf_to_markdown_force_ocr(self, mock_call_ocr, mock_render,
+                                       mock_fitz_open, mock_init_client):
+        """Test use_text_layer=False OCRs pages even when they carry text"""
+        mock_doc = Mock()
+        mock_doc.page_count = 1
+        mock_doc.load_page.return_value.get_text.return_value = "Digital text " * 10
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+        mock_call_ocr.return_value = self.test_ocr_json
+
+        result = pdf_to_markdown("test.pdf", use_text_layer=False)
+
+        self.assertIn("Line 1", result)
+        mock_call_ocr.assert_called_once()
+        mock_doc.load_page.return_value.get_text.assert_not_called()
+
+
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_iter_pdf_markdown_streams_in_order_with_bounded_window(self, mock_render, mock_fitz_open,
+                                                                    mock_init_client):
+        """Test iter_pdf_markdown yields pages in order and never holds more than 2x workers pages"""
+        mock_doc = Mock()
+        mock_doc.page_count = 12
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        rendered = []
+        mock_render.side_effect = lambda doc, idx, **kw: (rendered.append(idx) or f"page{idx}".encode(),
+                                                          DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+
+        def fake_ocr(client, b64, use_accurate=True):
+            text = base64.b64decode(b64).decode()
+            time.sleep(0.001 * (int(text[4:]) % 3))
+            return {"TextDetections": [{"DetectedText": text}]}
+
+        yielded = []
+        with patch('pdf_to_markdown.call_ocr_image', side_effect=fake_ocr):
+            for idx, md in iter_pdf_markdown("test.pdf", max_workers=2):
+                # pages rendered but not yet consumed stay within the window
+                self.assertLessEqual(len(rendered) - len(yielded), 2 * 2 + 1)
+                yielded.append(idx)
+                self.assertEqual(md, f"<!-- Page {idx+1} -->\n\npage{idx}")
+
+        self.assertEqual(yielded, list(range(12)))
+        mock_doc.close.assert_called_once()
+
+    @patch('pdf_to_markdown.init_ocr_client')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    @patch('pdf_to_markdown.call_ocr_image')
+    def test_iter_pdf_markdown_start_page(self, mock_call_ocr, mock_render,
+                                          mock_fitz_open, mock_init_client):
+        """Test iter_pdf_markdown skips pages before start_page"""
+        mock_doc = Mock()
+        mock_doc.page_count = 3
+        mock_doc.load_page.return_value.get_text.return_value = ""
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"image_bytes", DEFAULT_DPI, DEFAULT_JPEG_QUALITY)
+        mock_call_ocr.return_value = self.test_ocr_json
+
+        pages = [idx for idx, _ in iter_pdf_markdown("test.pdf", start_page=2)]
+
+        self.assertEqual(pages, [2])
+        self.assertEqual(mock_render.call_count, 1)
+
+    def test_convert_pdf_file_resumes_after_crash(self):
+        """Test convert_pdf_file appends pages as they finish and resumes from the last finished page"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        pdf_path = os.path.join(workdir, "statement.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF fake")
+        output_md = pdf_path + ".md"
+        blocks = [f"<!-- Page {i+1} -->\n\n第 {i+1} 页" for i in range(4)]
+        calls = []
+
+        def crashing_pages(path, start_page=0, **kwargs):
+            calls.append(start_page)
+            for i in range(start_page, 4):
+                if len(calls) == 1 and i == 2:
+                    raise RuntimeError("network down")
+                yield {"page": i, "markdown": blocks[i], "text": f"第 {i+1} 页", "source": "ocr",
+                       "ocr": {"TextDetections": [{"DetectedText": f"第 {i+1} 页"}]}}
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=crashing_pages):
+            with self.assertRaises(RuntimeError):
+                convert_pdf_file(pdf_path)
+            # pages finished before the crash are already on disk
+            with open(output_md + ".part", encoding="utf-8") as f:
+                self.assertEqual(f.read(), "\n\n".join(blocks[:2]))
+            self.assertFalse(os.path.exists(output_md))
+
+            with patch('builtins.print'):
+                resumed = convert_pdf_file(pdf_path)
+
+        self.assertEqual(resumed, 2)
+        self.assertEqual(calls, [0, 2])
+        with open(output_md, encoding="utf-8") as f:
+            self.assertEqual(f.read(), "\n\n".join(blocks))
+        self.assertFalse(os.path.exists(output_md + ".part"))
+        self.assertFalse(os.path.exists(output_md + ".progress.json"))
+        # the raw OCR sidecar was truncated and resumed along with the markdown
+        sidecar = pdf_path + ".ocr.jsonl.gz"
+        self.assertEqual([line["page"] for line in read_sidecar(sidecar)], [1, 2, 3, 4])
+        self.assertEqual(rerender_markdown_from_sidecar(sidecar), "\n\n".join(blocks))
+
+    def test_rerender_markdown_from_sidecar(self):
+        """Test markdown can be rebuilt from the sidecar, with text-layer pages and a custom renderer"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        pdf_path = os.path.join(workdir, "letter.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF fake")
+
+        def pages(path, start_page=0, **kwargs):
+            yield {"page": 0, "markdown": "<!-- Page 1 -->\n\nDear Sir", "text": "Dear Sir",
+                   "source": "text", "ocr": None}
+            text = ocr_json_to_markdown(self.test_ocr_json)
+            yield {"page": 1, "markdown": f"<!-- Page 2 -->\n\n{text}", "text": text,
+                   "source": "ocr", "ocr": self.test_ocr_json}
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=pages):
+            convert_pdf_file(pdf_path)
+        with open(pdf_path + ".md", encoding="utf-8") as f:
+            original = f.read()
+
+        sidecar = sidecar_path_for(pdf_path + ".md")
+        self.assertEqual(sidecar, pdf_path + ".ocr.jsonl.gz")
+        self.assertEqual(rerender_markdown_from_sidecar(sidecar), original)
+        lines = read_sidecar(sidecar)
+        self.assertEqual(lines[0], {"page": 1, "source": "text", "text": "Dear Sir"})
+        self.assertEqual(lines[1]["ocr"], self.test_ocr_json)
+        joined = rerender_markdown_from_sidecar(sidecar, renderer=lambda j: " ".join(
+            d["DetectedText"] for d in j["TextDetections"]))
+        self.assertIn("<!-- Page 2 -->\n\n" + " ".join(
+            d["DetectedText"] for d in self.test_ocr_json["TextDetections"]), joined)
+
+    def test_convert_pdf_file_without_sidecar(self):
+        """Test sidecar=False writes only the markdown"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        pdf_path = os.path.join(workdir, "letter.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF fake")
+
+        def pages(path, start_page=0, **kwargs):
+            yield {"page": 0, "markdown": "<!-- Page 1 -->\n\nx", "text": "x", "source": "ocr",
+                   "ocr": self.test_ocr_json}
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=pages):
+            convert_pdf_file(pdf_path, sidecar=False)
+        self.assertEqual(sorted(os.listdir(workdir)), ["letter.pdf", "letter.pdf.md"])
+
+    def test_convert_pdf_file_restarts_when_page_selection_changed(self):
+        """Test a partial output made for other pages is not resumed"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        pdf_path = os.path.join(workdir, "statement.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF fake")
+        starts = []
+
+        def pages(path, start_page=0, pages=None, **kwargs):
+            starts.append(start_page)
+            if len(starts) == 1:
+                yield {"page": 0, "markdown": "<!-- Page 1 -->\n\none", "text": "one", "source": "ocr", "ocr": None}
+                raise RuntimeError("network down")
+            for idx in ([0, 6] if pages == "1,7" else [0, 1]):
+                if idx >= start_page:
+                    yield {"page": idx, "markdown": f"<!-- Page {idx+1} -->\n\nx", "text": "x",
+                           "source": "ocr", "ocr": None}
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=pages), patch('builtins.print'):
+            with self.assertRaises(RuntimeError):
+                convert_pdf_file(pdf_path, pages="1-2")
+            self.assertEqual(convert_pdf_file(pdf_path, pages="1,7"), 0)
+
+        self.assertEqual(starts, [0, 0])
+        with open(pdf_path + ".md", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "<!-- Page 1 -->\n\nx\n\n<!-- Page 7 -->\n\nx")
+
+    def test_convert_pdf_file_restarts_when_source_changed(self):
+        """Test a partial output is discarded when the PDF changed since the crash"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        pdf_path = os.path.join(workdir, "statement.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(b"%PDF v2")
+        with open(pdf_path + ".md.part", "w", encoding="utf-8") as f:
+            f.write("<!-- Page 1 -->\n\nold")
+        with open(pdf_path + ".md.progress.json", "w", encoding="utf-8") as f:
+            json.dump({"sha256": "old", "pages_done": 1, "bytes": 20}, f)
+
+        def pages(path, start_page=0, **kwargs):
+            self.assertEqual(start_page, 0)
+            yield {"page": 0, "markdown": "<!-- Page 1 -->\n\nnew", "source": "ocr"}
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=pages):
+            self.assertEqual(convert_pdf_file(pdf_path), 0)
+        with open(pdf_path + ".md", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "<!-- Page 1 -->\n\nnew")
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_extract_document_fields_merges_id_card_sides(self, mock_render, mock_fitz_open, mock_print):
+        """Test both ID card pages are read and merged, and results are cached per doc type"""
+        mock_doc = Mock()
+        mock_doc.page_count = 3
+        mock_fitz_open.return_value = mock_doc
+        mock_render.side_effect = lambda doc, idx, **kw: (f"side{idx}".encode(), DEFAULT_DPI, 90)
+        backend = Mock()
+        backend.name = "tencent"
+        backend.recognize_document.side_effect = lambda b64, doc_type: (
+            {"Name": "雷南坤", "Sex": "男", "Birth": "1992/10/17", "IdNum": "440229199210171315"}
+            if base64.b64decode(b64) == b"side0" else
+            {"Authority": "翁源县公安局", "ValidDate": "2022.07.18-2042.07.18"})
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        cache = OcrCache(cache_dir)
+
+        fields = extract_document_fields("scan.pdf", "id_card", backend=backend, cache=cache)
+
+        self.assertEqual(fields["Personal Information"]["other_name"], "雷南坤")
+        self.assertEqual(fields["ID Card Information"]["issuing_authority"], "翁源县公安局")
+        self.assertEqual(fields["_source"], {"doc_type": "id_card", "backend": "tencent", "pages": [1, 2]})
+        self.assertEqual(mock_render.call_args[1]["encoding"], "rgb")
+        # a second run is served from the cache
+        self.assertEqual(extract_document_fields("scan.pdf", "id_card", backend=backend, cache=cache), fields)
+        self.assertEqual(backend.recognize_document.call_count, 2)
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_extract_document_fields_passport_stops_at_data_page(self, mock_render, mock_fitz_open, mock_print):
+        """Test a rejected page is skipped and reading stops once the passport number is known"""
+        mock_doc = Mock()
+        mock_doc.page_count = 2
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"page", DEFAULT_DPI, 90)
+        backend = Mock()
+        backend.name = "tencent"
+        backend.recognize_document.side_effect = [{"ID": "EQ5921220", "Type": "P"}]
+
+        fields = extract_document_fields("passport.pdf", "passport", backend=backend)
+        self.assertEqual(fields["Passport Information"]["passport_number"], "EQ5921220")
+        self.assertEqual(fields["_source"]["pages"], [1])
+
+        backend.recognize_document.side_effect = ValueError("FailedOperation.NoPassport")
+        self.assertIsNone(extract_document_fields("passport.pdf", "passport", backend=backend))
+
+    @patch('builtins.print')
+    @patch('pdf_to_markdown.fitz.open')
+    @patch('pdf_to_markdown.encode_page_under_limit')
+    def test_convert_pdf_file_writes_structured_fields(self, mock_render, mock_fitz_open, mock_print):
+        """Test doc_type="auto" routes a passport to structured OCR next to the markdown"""
+        workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, workdir, True)
+        mock_doc = Mock()
+        mock_doc.page_count = 1
+        mock_fitz_open.return_value = mock_doc
+        mock_render.return_value = (b"page", DEFAULT_DPI, 90)
+
+        def pages(path, start_page=0, **kwargs):
+            yield {"page": 0, "markdown": "<!-- Page 1 -->\n\nPASSPORT", "text": "PASSPORT", "source": "ocr",
+                   "ocr": self.test_ocr_json}
+
+        paths = {}
+        for name in ("passport.pdf", "cover_letter.pdf"):
+            paths[name] = os.path.join(workdir, name)
+            with open(paths[name], "wb") as f:
+                f.write(b"%PDF fake")
+        report = {}
+        with patch('pdf_to_markdown.iter_page_records', side_effect=pages):
+            convert_pdf_file(paths["passport.pdf"], report=report, doc_type="auto", backend="offline")
+            convert_pdf_file(paths["cover_letter.pdf"], doc_type=None, backend="offline")
+
+        fields_json = paths["passport.pdf"] + ".fields.json"
+        self.assertEqual(report["fields"], fields_json)
+        with open(fields_json, encoding="utf-8") as f:
+            fields = json.load(f)
+        self.assertEqual(fields["Personal Information"]["surname"], "OFFLINE")
+        self.assertEqual(fields["_source"]["backend"], "offline")
+        self.assertTrue(os.path.exists(paths["passport.pdf"] + ".md"))
+        self.assertFalse(os.path.exists(paths["cover_letter.pdf"] + ".fields.json"))
+        # auto routing goes by file name only: a letter whose text mentions a passport is not routed
+        paths["scan.pdf"] = os.path.join(workdir, "scan.pdf")
+        with open(paths["scan.pdf"], "wb") as f:
+            f.write(b"%PDF fake")
+        with patch('pdf_to_markdown.iter_page_records', side_effect=pages):
+            convert_pdf_file(paths["scan.pdf"], report=report, doc_type="auto", backend="offline")
+        self.assertFalse(os.path.exists(paths["scan.pdf"] + ".fields.json"))
+        self.assertIsNone(convert_document_fields(paths["cover_letter.pdf"]))
+
+
+class TestConvertFolder(unittest.TestCase):
+    """Test cases for batch folder conversion"""
+
+    def setUp(self):
+        """Set up a folder tree with two PDFs"""
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+        os.makedirs(os.path.join(self.root, "applicant_1"))
+        self.pdf_a = os.path.join(self.root, "applicant_1", "passport.pdf")
+        self.pdf_b = os.path.join(self.root, "offer.PDF")
+        for path in (self.pdf_a, self.pdf_b):
+            with open(path, "wb") as f:
+                f.write(path.encode())
+        patcher = patch('builtins.print')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fake_convert(self, pdf_path, start_page=0, **kwargs):
+        yield {"page": 0, "markdown": f"<!-- Page 1 -->\n\n{os.path.basename(pdf_path)}", "source": "ocr"}
+        yield {"page": 1, "markdown": "<!-- Page 2 -->\n\ntext", "source": "text"}
+
+    def _age(self, path, seconds):
+        t = os.path.getmtime(path) - seconds
+        os.utime(path, (t, t))
+
+    def test_convert_folder_converts_and_writes_manifest(self):
+        """Test every PDF in the tree is converted and recorded in the manifest"""
+        with patch('pdf_to_markdown.iter_page_records', side_effect=self._fake_convert) as mock_convert:
+            manifest = convert_folder(self.root, jobs=1, dpi=200)
+
+        self.assertEqual(mock_convert.call_count, 2)
+        self.assertEqual(mock_convert.call_args[1]["dpi"], 200)
+        with open(self.pdf_a + ".md", encoding="utf-8") as f:
+            self.assertIn("passport.pdf", f.read())
+        self.assertEqual(manifest["counts"], {"converted": 2, "skipped": 0, "failed": 0})
+        entry = manifest["files"]["applicant_1/passport.pdf"]
+        self.assertEqual(entry["pages"], 2)
+        self.assertEqual(entry["page_sources"], {"ocr": 1, "text": 1})
+        self.assertIn("seconds", entry)
+        with open(os.path.join(self.root, MANIFEST_NAME), encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["counts"], manifest["counts"])
+
+    def test_convert_folder_includes_image_scans(self):
+        """Test JPG / PNG scans in the tree are converted too, other files are ignored"""
+        scan = os.path.join(self.root, "applicant_1", "id_card.jpeg")
+        for path in (scan, os.path.join(self.root, "notes.txt")):
+            with open(path, "wb") as f:
+                f.write(b"data")
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=self._fake_convert):
+            manifest = convert_folder(self.root, jobs=1)
+
+        self.assertEqual(sorted(manifest["files"]),
+                         ["applicant_1/id_card.jpeg", "applicant_1/passport.pdf", "offer.PDF"])
+        self.assertTrue(os.path.exists(scan + ".md"))
+
+    def test_convert_folder_incremental_skips(self):
+        """Test outputs newer than the source, or with an unchanged hash, are skipped"""
+        with patch('pdf_to_markdown.iter_page_records', side_effect=self._fake_convert):
+            convert_folder(self.root, jobs=1)
+        # output older than source but source content unchanged -> hash skip
+        self._age(self.pdf_a + ".md", 100)
+        # source content changed and output older -> reconvert
+        with open(self.pdf_b, "ab") as f:
+            f.write(b"changed")
+        self._age(self.pdf_b + ".md", 100)
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=self._fake_convert) as mock_convert:
+            manifest = convert_folder(self.root, jobs=1)
+
+        mock_convert.assert_called_once()
+        self.assertEqual(mock_convert.call_args[0][0], self.pdf_b)
+        self.assertEqual(manifest["files"]["applicant_1/passport.pdf"]["reason"], "content hash unchanged")
+        self.assertEqual(manifest["counts"], {"converted": 1, "skipped": 1, "failed": 0})
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=self._fake_convert) as mock_convert:
+            manifest = convert_folder(self.root, jobs=1)
+        mock_convert.assert_not_called()
+        self.assertEqual(manifest["files"]["offer.PDF"]["reason"], "output newer than source")
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=self._fake_convert) as mock_convert:
+            convert_folder(self.root, jobs=1, force=True)
+        self.assertEqual(mock_convert.call_count, 2)
+
+    def test_convert_folder_records_failures(self):
+        """Test a failing PDF is recorded and does not stop the batch"""
+        def convert(pdf_path, **kwargs):
+            if pdf_path == self.pdf_a:
+                raise RuntimeError("OCR down")
+            return self._fake_convert(pdf_path, **kwargs)
+
+        with patch('pdf_to_markdown.iter_page_records', side_effect=convert):
+            manifest = convert_folder(self.root, jobs=1)
+
+        self.assertEqual(manifest["files"]["applicant_1/passport.pdf"]["status"], "failed")
+        self.assertIn("OCR down", manifest["files"]["applicant_1/passport.pdf"]["error"])
+        self.assertEqual(manifest["files"]["offer.PDF"]["status"], "converted")
+        self.assertFalse(os.path.exists(self.pdf_a + ".md"))
+
+
 if __name__ == '__main__':
     unittest.main()
 
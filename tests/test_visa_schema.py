@@ -0,0 +1,91 @@
+"""
+Unit tests for visa_schema.py module
+"""
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+
+sys.modules.setdefault('dotenv', MagicMock())
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from visa_schema import field_schema, build_schema, validate_section
+from llm_analysis import visa_prompt_sections
+
+
+class TestVisaSchema(unittest.TestCase):
+    """Test cases for the typed extraction schema and section validation"""
+
+    def setUp(self):
+        self.schema = build_schema(visa_prompt_sections)
+        self.props = self.schema["properties"]
+
+    def test_field_schema_from_annotations(self):
+        self.assertEqual(field_schema("visa_type", ' (选项: "Long Stay (D)", "Short Stay (C)", null)   //choose'),
+                         {"type": ["string", "null"], "enum": ["Long Stay (D)", "Short Stay (C)", None]})
+        self.assertEqual(field_schema("currently_student", " (选项: Yes, No, null)")["enum"], ["Yes", "No", None])
+        self.assertEqual(field_schema("speaks_english", " (Yes/No/null)")["enum"], ["Yes", "No", None])
+        self.assertEqual(field_schema("first_passport", " (选项: True, False, null)"), {"type": ["boolean", "null"]})
+        self.assertEqual(field_schema("sponsor_count", " (整数/null)"), {"type": ["integer", "null"]})
+        self.assertIn("pattern", field_schema("date_of_issue", "   //passport"))
+        # an example value is not an option list
+        self.assertEqual(field_schema("study_visa_type", ' (如: "English Language (ILEP)", null)'),
+                         {"type": ["string", "null"]})
+
+    def test_build_schema_covers_all_sections(self):
+        self.assertEqual(len(self.props), 17)
+        self.assertEqual(self.schema["required"], list(visa_prompt_sections))
+        family = self.props["Family Information"]["properties"]
+        self.assertEqual(family["spouse_details"]["type"], ["object", "null"])
+        self.assertEqual(family["children_details"]["type"], ["array", "null"])
+        self.assertIn("nationality", family["children_details"]["items"]["properties"])
+        self.assertEqual(self.props["Education / Qualification"]["properties"]["education_history"]["type"],
+                         ["array", "null"])
+        subset = build_schema(visa_prompt_sections, ["Travel Details", "Personal Information"])
+        self.assertEqual(subset["required"], ["Personal Information", "Travel Details"])
+
+    def test_validate_section_normalises_near_misses(self):
+        fields = {
+            "Application Information": {"visa_type": "long stay (d)", "journey_type": "null"},
+            "Passport Information": {"first_passport": "yes", "date_of_issue": "2025/09/09", "passport_number": 123},
+            "Employment / Student Status": {"currently_employed": False},
+            "Financial Support": {"sponsor_count": "2"},
+        }
+        for name in list(fields):
+            self.assertEqual(validate_section(fields, name, self.props[name]), [])
+
+        self.assertEqual(fields["Application Information"], {"visa_type": "Long Stay (D)", "journey_type": None})
+        self.assertEqual(fields["Passport Information"],
+                         {"first_passport": True, "date_of_issue": "2025-09-09", "passport_number": "123"})
+        self.assertEqual(fields["Employment / Student Status"]["currently_employed"], "No")
+        self.assertEqual(fields["Financial Support"]["sponsor_count"], 2)
+
+    def test_validate_section_reports_and_drops_invalid(self):
+        fields = {"Family Information": {
+            "personal_status": "Complicated",
+            "spouse_details": "none given",
+            "children_details": [{"gender": "Boy", "date_of_birth": "2015-06-01"}],
+        }}
+        errors = validate_section(fields, "Family Information", self.props["Family Information"])
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(errors[0].startswith("Family Information.personal_status"))
+        self.assertIn("Family Information.children_details[0].gender", errors[2])
+
+        validate_section(fields, "Family Information", self.props["Family Information"], drop_invalid=True)
+        self.assertEqual(fields["Family Information"], {
+            "personal_status": None, "spouse_details": None,
+            "children_details": [{"gender": None, "date_of_birth": "2015-06-01"}]})
+
+    def test_validate_section_list_of_entries_and_missing(self):
+        fields = {"Employment History": [{"employer_name": "ACME", "from_date": "2020.01.05"},
+                                         {"employer_name": "B", "to_date": "last year"}]}
+        errors = validate_section(fields, "Employment History", self.props["Employment History"])
+        self.assertEqual(errors, ["Employment History[1].to_date: 'last year' 不是 YYYY-MM-DD 日期"])
+        self.assertEqual(fields["Employment History"][0]["from_date"], "2020-01-05")
+        self.assertEqual(validate_section({}, "Travel Details", self.props["Travel Details"]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
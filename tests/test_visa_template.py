@@ -0,0 +1,118 @@
+"""
+Unit tests for visa_template.py module
+"""
+import unittest
+import sys
+import os
+
+# Add parent directory to path to import modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from visa_template import (
+    split_template, section_hints, sections_for_doc_type, build_prompt, section_skeleton, fill_schema,
+    strip_known_fields,
+)
+
+TEMPLATE = '''
+你是一名专家。
+
+1. Personal Information:
+   - surname                  //passport or id_card or house registration file
+   - gender (选项: "Male", "Female", null)
+
+2. Travel Document Details (如有多本护照):
+    - passport_1:             //passport
+        - passport_number
+        - date_of_expiry
+
+3. Family Information:
+   - personal_status
+   - spouse_details:          //extra info
+       - surname
+   - children_details:
+       - for each child (最多6个):
+           - surname
+           - forename
+   - education_history: list of previous entries    //graduation certificate
+       - school_name
+   - speaks_english (Yes/No/null)
+
+4. Study Details in Ireland:  //offer
+    - course_name
+
+注意：
+- 缺失字段用 null。
+
+{text}
+'''
+
+
+class TestVisaTemplate(unittest.TestCase):
+    """Test cases for slicing the extraction prompt by section"""
+
+    def setUp(self):
+        self.header, self.sections, self.footer = split_template(TEMPLATE)
+
+    def test_split_template_round_trips(self):
+        self.assertEqual(list(self.sections), ["Personal Information", "Travel Document Details",
+                                               "Family Information", "Study Details in Ireland"])
+        self.assertTrue(self.header.strip().startswith("你是一名专家"))
+        self.assertTrue(self.footer.startswith("注意："))
+        self.assertEqual(build_prompt(self.header, self.sections, list(self.sections), self.footer), TEMPLATE)
+
+    def test_section_hints(self):
+        self.assertEqual(section_hints(self.sections["Study Details in Ireland"]), ["offer"])
+        self.assertEqual(section_hints(self.sections["Travel Document Details"]), ["passport"])
+
+    def test_sections_for_doc_type(self):
+        self.assertEqual(sections_for_doc_type(self.sections, "passport"),
+                         ["Personal Information", "Travel Document Details"])
+        self.assertEqual(sections_for_doc_type(self.sections, "id_card"), ["Personal Information"])
+        self.assertEqual(sections_for_doc_type(self.sections, "offer"), ["Study Details in Ireland"])
+        self.assertEqual(sections_for_doc_type(self.sections, "cover_letter"), list(self.sections))
+        self.assertEqual(sections_for_doc_type(self.sections, None), list(self.sections))
+
+    def test_build_prompt_keeps_order_and_footer(self):
+        prompt = build_prompt(self.header, self.sections, ["Study Details in Ireland", "Personal Information"],
+                              self.footer)
+        self.assertLess(prompt.index("1. Personal Information"), prompt.index("4. Study Details"))
+        self.assertNotIn("Family Information", prompt)
+        self.assertIn("{text}", prompt)
+
+    def test_section_skeleton(self):
+        self.assertEqual(section_skeleton(self.sections["Personal Information"]), {"surname": None, "gender": None})
+        self.assertEqual(section_skeleton(self.sections["Travel Document Details"]),
+                         {"passport_1": {"passport_number": None, "date_of_expiry": None}})
+        self.assertEqual(section_skeleton(self.sections["Family Information"]), {
+            "personal_status": None, "spouse_details": {"surname": None}, "children_details": None,
+            "education_history": None, "speaks_english": None})
+
+    def test_fill_schema(self):
+        fields = {"Personal Information": {"surname": "LEI"}, "Study Details in Ireland": {"course_name": "x"},
+                  "Notes": "extra"}
+        full = fill_schema(fields, self.sections, ["Personal Information", "Travel Document Details"])
+
+        self.assertEqual(list(full), list(self.sections) + ["Notes"])
+        self.assertEqual(full["Personal Information"], {"surname": "LEI"})
+        self.assertEqual(full["Travel Document Details"]["passport_1"]["passport_number"], None)
+        self.assertEqual(full["Study Details in Ireland"], {"course_name": None})
+
+
+    def test_strip_known_fields(self):
+        personal = strip_known_fields(self.sections["Personal Information"], {"surname": "LEI", "gender": None})
+        self.assertNotIn("- surname", personal)
+        self.assertIn("- gender", personal)
+        self.assertIn("1. Personal Information:", personal)
+
+        travel = self.sections["Travel Document Details"]
+        partial = strip_known_fields(travel, {"passport_1": {"passport_number": "EQ5921220"}})
+        self.assertNotIn("passport_number", partial)
+        self.assertIn("- date_of_expiry", partial)
+        self.assertIsNone(strip_known_fields(travel, {"passport_1": {"passport_number": "EQ5921220",
+                                                                    "date_of_expiry": "2035-09-08"}}))
+
+        family = strip_known_fields(self.sections["Family Information"], {"surname": "LEI"})
+        self.assertEqual(family, self.sections["Family Information"])
+
+if __name__ == '__main__':
+    unittest.main()
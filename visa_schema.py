@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Typed schema for the visa extraction result, built from the prompt template.
+
+Every field of the 17 template sections becomes a JSON-Schema node, typed from
+its annotation: `(选项: "A", "B", null)` is an enum, `(Yes/No/null)` the Yes/No
+enum, `(选项: True, False, null)` a boolean, `(整数/null)` an integer, fields
+named like dates a YYYY-MM-DD string, nested fields an object and repeated
+entries ("for each child", "list of ...") an array of objects. Everything is
+nullable. The schema can be sent as the model's response_format, and
+validate_section() checks (and lightly normalises) what came back so only the
+sections that fail need to be asked again.
+"""
+
+import re
+
+from doc_fields import normalize_date
+from visa_template import section_tree
+
+DATE_PATTERN = r"^\d{4}(-\d{2}(-\d{2})?)?$"
+_QUOTED = re.compile(r'"([^"]+)"')
+
+
+def field_schema(name: str, annotation: str) -> dict:
+    """Schema of a plain field from its name and template annotation."""
+    if "选项" in annotation and _QUOTED.search(annotation):
+        options = _QUOTED.findall(annotation)
+        return {"type": ["string", "null"], "enum": options + [None]}
+    if re.search(r"\bTrue\b.*\bFalse\b", annotation):
+        return {"type": ["boolean", "null"]}
+    if re.search(r"\bYes\s*[/,]\s*No\b", annotation):
+        return {"type": ["string", "null"], "enum": ["Yes", "No", None]}
+    if "整数" in annotation:
+        return {"type": ["integer", "null"]}
+    if "date" in name:
+        return {"type": ["string", "null"], "pattern": DATE_PATTERN}
+    return {"type": ["string", "null"]}
+
+
+def _object_schema(tree: dict) -> dict:
+    properties = {}
+    for name, (annotation, children, repeated) in tree.items():
+        if children is None:
+            properties[name] = field_schema(name, annotation)
+        elif repeated:
+            properties[name] = {"type": ["array", "null"], "items": _object_schema(children)}
+        else:
+            properties[name] = dict(_object_schema(children), type=["object", "null"])
+    return {"type": "object", "properties": properties}
+
+
+def section_schema(fragment: str) -> dict:
+    """Schema of one template section fragment."""
+    return _object_schema(section_tree(fragment))
+
+
+def build_schema(sections: dict, names=None) -> dict:
+    """Schema of the whole result (or of the `names` sections only) for {section name: fragment}."""
+    names = list(sections) if names is None else [n for n in sections if n in names]
+    return {
+        "type": "object",
+        "properties": {name: section_schema(sections[name]) for name in names},
+        "required": names,
+    }
+
+
+def _coerce(value, schema: dict):
+    """Map near-misses onto the schema (enum case, yes/no booleans, numeric strings, date formats)."""
+    types = schema["type"]
+    if isinstance(value, bool) and "Yes" in schema.get("enum", ()):
+        return "Yes" if value else "No"
+    if isinstance(value, str) and "pattern" in schema:
+        return normalize_date(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if "enum" in schema:
+            for option in schema["enum"]:
+                if option is not None and option.casefold() == text.casefold():
+                    return option
+            if text.lower() in ("null", "none", ""):
+                return None
+        if "boolean" in types and text.lower() in ("true", "false", "yes", "no"):
+            return text.lower() in ("true", "yes")
+        if "integer" in types and text.isdigit():
+            return int(text)
+    if "integer" in types and isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _check(value, schema: dict, path: str, errors: list, drop_invalid: bool):
+    """Validate `value` against `schema`; returns the (coerced, possibly nulled) value."""
+    value = _coerce(value, schema) if value is not None else None
+    if value is None:
+        return None
+    types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+    problem = None
+    if "object" in types:
+        if not isinstance(value, dict):
+            problem = f"应为对象，得到 {type(value).__name__}"
+        else:
+            for key, sub in schema["properties"].items():
+                if key in value:
+                    value[key] = _check(value[key], sub, f"{path}.{key}", errors, drop_invalid)
+            return value
+    elif "array" in types:
+        if not isinstance(value, list):
+            problem = f"应为列表，得到 {type(value).__name__}"
+        else:
+            return [_check(item, schema["items"], f"{path}[{i}]", errors, drop_invalid)
+                    for i, item in enumerate(value)]
+    elif "enum" in schema and value not in schema["enum"]:
+        problem = f"{value!r} 不在可选项 {[o for o in schema['enum'] if o is not None]} 中"
+    elif "boolean" in types and not isinstance(value, bool):
+        problem = f"应为 true / false，得到 {value!r}"
+    elif "integer" in types and (isinstance(value, bool) or not isinstance(value, int)):
+        problem = f"应为整数，得到 {value!r}"
+    elif "string" in types and not isinstance(value, str):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        else:
+            problem = f"应为字符串，得到 {type(value).__name__}"
+    elif "pattern" in schema and not re.match(schema["pattern"], value):
+        problem = f"{value!r} 不是 YYYY-MM-DD 日期"
+    if problem:
+        errors.append(f"{path}: {problem}")
+        return None if drop_invalid else value
+    return value
+
+
+def validate_section(fields: dict, name: str, schema: dict, drop_invalid=False) -> list:
+    """
+    Validate section `name` of `fields` in place against its section schema.
+    Near-misses are normalised; with `drop_invalid` the values that still do
+    not fit are set to None. A section given as a list of objects (several
+    employers, say) is checked item by item. A missing section is not an error.
+    Returns the error messages ("Section.field: problem").
+    """
+    errors = []
+    value = fields.get(name)
+    if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+        fields[name] = [_check(item, schema, f"{name}[{i}]", errors, drop_invalid) for i, item in enumerate(value)]
+    elif value is not None:
+        fields[name] = _check(value, schema, name, errors, drop_invalid)
+    return errors
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Slice the visa extraction prompt into per-section fragments.
+
+llm_analysis.irish_visa_template_prompt lists 17 numbered sections of fields,
+many annotated with the document they come from ("//passport", "//id_card",
+"//offer", ...). Sending all of them for a one-page ID card wastes most of the
+prompt, so split_template() cuts the template into header / sections / footer,
+sections_for_doc_type() picks the sections whose hints match a document type,
+and build_prompt() reassembles a prompt from just those. section_skeleton()
+turns a fragment into its fields with null values, so a result extracted from
+a slice can still be padded out to the full schema (fill_schema()), and
+strip_known_fields() drops the fields whose values are already known (e.g. from
+the passport MRZ) so the model is not asked for them.
+"""
+
+import re
+
+# document type -> hint substrings (lower-cased) of the sections it can fill;
+# types without an entry (cover letters, unknown documents) get every section
+DOC_TYPE_HINTS = {
+    "passport": ("passport",),
+    "id_card": ("id_card", "house registration"),
+    "offer": ("offer",),
+}
+
+_SECTION_START = re.compile(r"^(\d+)\. (.+?):", re.MULTILINE)
+_FOOTER_START = "注意："
+_FIELD_LINE = re.compile(r"^(\s*)- ([A-Za-z][A-Za-z0-9_]*)(.*)$")
+
+
+def split_template(template: str):
+    """
+    Split a numbered-section template into (header, {section name: fragment}, footer).
+    Section names drop any parenthetical note ("Travel Document Details (如有多本护照)"
+    -> "Travel Document Details"); fragments keep their original text and number.
+    """
+    footer_at = template.index(_FOOTER_START)
+    body, footer = template[:footer_at], template[footer_at:]
+    starts = list(_SECTION_START.finditer(body))
+    header = body[:starts[0].start()]
+    sections = {}
+    for m, nxt in zip(starts, starts[1:] + [None]):
+        name = re.sub(r"\s*\(.*?\)\s*$", "", m.group(2)).strip()
+        sections[name] = body[m.start():nxt.start() if nxt else len(body)]
+    return header, sections, footer
+
+
+def section_hints(fragment: str) -> list:
+    """The lower-cased "//..." source hints of a section fragment."""
+    return [hint.strip().lower() for hint in re.findall(r"//([^\n]+)", fragment)]
+
+
+def sections_for_doc_type(sections: dict, doc_type) -> list:
+    """Names of the sections a document of `doc_type` can fill (all of them for unknown types)."""
+    wanted = DOC_TYPE_HINTS.get(doc_type)
+    if not wanted:
+        return list(sections)
+    picked = [name for name, fragment in sections.items()
+              if any(w in hint for hint in section_hints(fragment) for w in wanted)]
+    return picked or list(sections)
+
+
+def build_prompt(header: str, sections: dict, names, footer: str) -> str:
+    """Reassemble a template from the chosen sections, in template order."""
+    return header + "".join(fragment for name, fragment in sections.items() if name in names) + footer
+
+
+def section_tree(fragment: str) -> dict:
+    """
+    Parse the field lines of a section into {name: (annotation, children, repeated)}:
+    `annotation` is the rest of the line ("(选项: ...)  //hint"), `children` the
+    same structure for indented sub-fields (None for a plain field) and
+    `repeated` is True for entries that hold a list ("for each child",
+    "list of ..."), whose children describe one item.
+    """
+    root = {}
+    stack = [(-1, root)]  # (indent, dict the next deeper fields go into)
+    lines = fragment.splitlines()[1:]
+    for i, line in enumerate(lines):
+        m = _FIELD_LINE.match(line)
+        if not m:
+            continue
+        indent, name, rest = len(m.group(1)), m.group(2), m.group(3)
+        while stack[-1][0] >= indent:
+            stack.pop()
+        if name == "for":
+            continue  # "for each child:" only introduces the fields of one list item
+        parent = stack[-1][1]
+        nxt = next((_FIELD_LINE.match(l) for l in lines[i + 1:] if _FIELD_LINE.match(l)), None)
+        if nxt is None or len(nxt.group(1)) <= indent:
+            parent[name] = (rest, None, False)
+            continue
+        children = {}
+        repeated = nxt.group(2) == "for" or "list of" in rest
+        parent[name] = (rest, children, repeated)
+        stack.append((indent, children))
+    return root
+
+
+def strip_known_fields(fragment: str, known: dict):
+    """
+    Remove the field lines of a section whose values are already known
+    (`known` is {field: value} for this section, nested like the fields; only
+    non-dict values count as known). A nested field whose sub-fields are all
+    known goes too. Returns the shorter fragment, or None when no field is left.
+    """
+    lines = fragment.splitlines(keepends=True)
+    entries = []  # (line index, indent, path)
+    stack = []    # (indent, name) of the enclosing fields
+    for i, line in enumerate(lines):
+        m = _FIELD_LINE.match(line)
+        if not m:
+            continue
+        indent, name = len(m.group(1)), m.group(2)
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        path = tuple(n for _, n in stack if n != "for") + (name,)
+        entries.append((i, indent, path))
+        stack.append((indent, name))
+
+    def is_known(path):
+        value = known
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return False
+            value = value[key]
+        return value is not None and not isinstance(value, dict)
+
+    dropped = set()
+    for pos in range(len(entries) - 1, -1, -1):
+        i, indent, path = entries[pos]
+        subtree = []
+        for j, sub_indent, _ in entries[pos + 1:]:
+            if sub_indent <= indent:
+                break
+            subtree.append(j)
+        if subtree and all(j in dropped for j in subtree) or not subtree and is_known(path):
+            dropped.add(i)
+    if len(dropped) == len(entries):
+        return None
+    return "".join(line for i, line in enumerate(lines) if i not in dropped)
+
+
+def section_skeleton(fragment: str) -> dict:
+    """
+    Fields of a section with null values. Nested fields ("spouse_details:" with
+    indented sub-fields) become nested dicts; repeated entries ("for each child",
+    "list of ...") are a single null.
+    """
+    def skeleton(tree):
+        return {name: skeleton(children) if children is not None and not repeated else None
+                for name, (_, children, repeated) in tree.items()}
+    return skeleton(section_tree(fragment))
+
+
+def fill_schema(fields: dict, sections: dict, requested) -> dict:
+    """
+    Pad a result extracted from a slice out to the full schema: requested
+    sections keep the extracted values (missing ones get the null skeleton),
+    every other section is the null skeleton. Sections come in template order,
+    followed by any keys the model added that are not section names.
+    """
+    full = {}
+    for name, fragment in sections.items():
+        value = fields.get(name) if name in requested else None
+        full[name] = value if value is not None else section_skeleton(fragment)
+    for name, value in fields.items():
+        full.setdefault(name, value)
+    return full